@@ -0,0 +1,273 @@
+"""
+benchmark.py
+
+Benchmarks the grchatbot handlers offline, against the local OpenAI and
+Pinecone stand-ins in tools/standins.py. Each scenario is run at each
+concurrency level and document size and reported with p50/p95/p99
+latency, throughput and the number of API calls made:
+
+    python benchmark.py --concurrency 1,8,32 --doc-sizes 5000,50000 --latency 0.3
+
+Use --rate-limit-rate and --error-rate to inject 429 and 503 responses.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import types
+
+SCENARIOS = ("chat", "lookup", "map_reduce", "add", "remove")
+
+# Words for the generated documents
+WORDS = ("spectrum sharing federal band auction interference study committee report "
+         "agency license wireless broadband relocation cost radar satellite working group "
+         "recommendation transition timeline industry government data analysis").split()
+
+
+def percentile(values, p):
+    """
+    Returns the p-th percentile (0-100) of values by the nearest-rank method.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * p // 100))
+    return ordered[int(rank) - 1]
+
+
+def make_document(size, seed=0):
+    # Generated text of about size characters, with a line break every 15 words
+    rng = random.Random(seed)
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(WORDS)
+        words.append(word + ("\n" if len(words) % 15 == 14 else " "))
+        length += len(word) + 1
+    return "".join(words)
+
+
+def is_error(text):
+    return isinstance(text, str) and text.startswith("We received an error")
+
+
+async def last(updates):
+    # Drains a streaming handler and returns its final update
+    result = None
+    async for result in updates:
+        pass
+    return result
+
+
+class Benchmark:
+    """
+    Runs the grchatbot handlers against the stand-ins in a scratch directory.
+
+    grchatbot is imported here (not at module level) so its library, caches
+    and job queue are created in the scratch directory with the stand-ins
+    already installed.
+    """
+
+    def __init__(self, args):
+        from tools import clients
+        from tools.standins import FakeOpenAI, FakePineconeIndex, FaultInjector
+        from tools.vector_index import RemoteIndex
+
+        self.args = args
+        self.workdir = tempfile.mkdtemp(prefix="grchatbot-bench-")
+        os.chdir(self.workdir)
+        os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+        os.environ["CHATBOT_INDEX_BACKEND"] = "local"
+        os.environ.pop("CHATBOT_COMPLETION_CACHE", None)
+        if args.no_rate_limits:
+            clients.limiter.buckets.clear()
+
+        self.openai_faults = FaultInjector(args.latency, error_rate=args.error_rate,
+                                           rate_limit_rate=args.rate_limit_rate, seed=1)
+        self.pinecone_faults = FaultInjector(args.pinecone_latency, error_rate=args.error_rate,
+                                             rate_limit_rate=args.rate_limit_rate, seed=2)
+        self.openai = FakeOpenAI(self.openai_faults, tokens_per_second=args.tokens_per_second).install()
+
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        import grchatbot
+        self.app = grchatbot
+        manager = grchatbot.docdatabase
+        # Calls to the stand-in go through the same limiter and retries as Pinecone
+        manager._index_instance = RemoteIndex(FakePineconeIndex(manager.index_instance, self.pinecone_faults))
+        grchatbot.ingest_queue.start(workers=grchatbot.INGEST_WORKERS)
+        self.documents = {}
+
+    def document(self, size):
+        if size not in self.documents:
+            self.documents[size] = make_document(size, seed=size)
+        return self.documents[size]
+
+    def calls(self):
+        return self.openai_faults.calls + self.pinecone_faults.calls
+
+    # Each request returns True on success and False on an error response
+
+    async def chat(self, i, size):
+        (display, _, _) = await last(self.app.generate_chat_response(
+            [], f"Question {i}: what did the committee decide?", [], self.args.model))
+        return not is_error(display[-1][1])
+
+    async def lookup(self, i, size):
+        (display, _, _, _) = await last(self.app.document_lookup_chat(
+            [], "", self.args.top_n, f"Question {i}: what is the relocation timeline?", [], self.args.model))
+        return not is_error(display[-1][1])
+
+    async def map_reduce(self, i, size):
+        (display, _, _, _) = await last(self.app.map_reduce_chat(
+            [], self.document(size), f"Question {i}: summarize the findings.", [], self.args.model,
+            self.args.map_reduce_mode))
+        return not is_error(display[-1][1])
+
+    async def add(self, i, size):
+        # Measured until the background job has indexed the document
+        path = os.path.join(self.workdir, f"bench-{size}-{i}.txt")
+        with open(path, "w") as file:
+            file.write(self.document(size) + f"\nCopy {i}\n")
+        (_, status, _) = await asyncio.to_thread(self.app.add_document, types.SimpleNamespace(name=path))
+        if is_error(status):
+            return False
+        title = os.path.basename(path)
+        while True:
+            jobs = [job for job in self.app.ingest_queue.list_jobs(limit=1000) if job['title'] == title]
+            if jobs and jobs[0]['status'] in ('done', 'failed'):
+                return jobs[0]['status'] == 'done'
+            await asyncio.sleep(0.01)
+
+    async def remove(self, i, size):
+        (_, status) = await asyncio.to_thread(self.app.remove_document, f"bench-{size}-{i}.txt")
+        return not is_error(status)
+
+    async def run(self, scenario, concurrency, size):
+        request = getattr(self, scenario)
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies = []
+        errors = 0
+
+        async def timed(i):
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    ok = await request(i, size)
+                except Exception:
+                    ok = False
+                latencies.append(time.perf_counter() - start)
+                errors += not ok
+
+        before = self.calls()
+        start = time.perf_counter()
+        await asyncio.gather(*(timed(i) for i in range(self.args.requests)))
+        elapsed = time.perf_counter() - start
+        calls = self.calls()
+        calls.subtract(before)
+        return {
+            'scenario': scenario,
+            'concurrency': concurrency,
+            'doc_size': size,
+            'requests': len(latencies),
+            'errors': errors,
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'p99': percentile(latencies, 99),
+            'throughput': len(latencies) / elapsed if elapsed else None,
+            'api_calls': {name: count for (name, count) in sorted(calls.items()) if count},
+        }
+
+    async def setup_library(self, size):
+        # Index one document of each size for the lookup scenario (not measured)
+        title = f"library-{size}.txt"
+        if not self.app.docdatabase.has_document(title):
+            await asyncio.to_thread(self.app.docdatabase.add_document, title, self.document(size))
+
+    async def run_all(self):
+        from tools import clients
+
+        try:
+            return await self.run_scenarios()
+        finally:
+            # Close the keep-alive session of this event loop
+            await clients.close_aiosession()
+
+    async def run_scenarios(self):
+        results = []
+        for size in self.args.doc_sizes:
+            for scenario in self.args.scenarios:
+                if scenario == "lookup":
+                    await self.setup_library(size)
+                # Documents added at one concurrency level are removed at the same level
+                for concurrency in self.args.concurrency:
+                    if scenario in ("add", "remove") and concurrency != self.args.concurrency[0]:
+                        continue
+                    result = await self.run(scenario, concurrency, size)
+                    print(format_result(result), flush=True)
+                    results.append(result)
+        return results
+
+    def close(self):
+        self.app.ingest_queue.stop()
+        self.openai.uninstall()
+
+
+def format_result(result):
+    def ms(seconds):
+        return f"{seconds * 1000:8.1f}" if seconds is not None else "       -"
+    calls = " ".join(f"{name}={count}" for (name, count) in result['api_calls'].items())
+    return (f"{result['scenario']:<11}{result['concurrency']:>5}{result['doc_size']:>9}"
+            f"{result['requests']:>6}{result['errors']:>5} {ms(result['p50'])} {ms(result['p95'])} "
+            f"{ms(result['p99'])} {result['throughput'] or 0:8.2f}  {calls}")
+
+
+def int_list(text):
+    return [int(value) for value in text.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the grchatbot handlers offline.")
+    parser.add_argument("--scenarios", type=lambda text: text.split(","), default=list(SCENARIOS),
+                        help=f"Comma separated scenarios (default {','.join(SCENARIOS)})")
+    parser.add_argument("--concurrency", type=int_list, default=[1, 4, 16],
+                        help="Comma separated concurrency levels ('add' and 'remove' use the first)")
+    parser.add_argument("--doc-sizes", type=int_list, default=[10000, 100000],
+                        help="Comma separated document sizes in characters")
+    parser.add_argument("--requests", type=int, default=20, help="Requests per scenario and level")
+    parser.add_argument("--model", default="gpt-3.5-turbo-16k")
+    parser.add_argument("--top-n", type=int, default=5, help="Sections retrieved by the lookup scenario")
+    parser.add_argument("--map-reduce-mode", default="Parallel", choices=["Parallel", "Sequential"])
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds per OpenAI call")
+    parser.add_argument("--pinecone-latency", type=float, default=0.02, help="Seconds per Pinecone call")
+    parser.add_argument("--tokens-per-second", type=float, default=0, help="Streaming speed (0 for instant)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls failing with 503")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of calls failing with 429")
+    parser.add_argument("--no-rate-limits", action="store_true", help="Disable the client-side rate limiter")
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+    if args.json:
+        args.json = os.path.abspath(args.json)
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    benchmark = Benchmark(args)
+    print(f"{'scenario':<11}{'conc':>5}{'size':>9}{'reqs':>6}{'errs':>5} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8} {'req/s':>8}  api calls")
+    try:
+        results = asyncio.run(benchmark.run_all())
+    finally:
+        benchmark.close()
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
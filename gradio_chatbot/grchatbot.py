@@ -1,40 +1,63 @@
 import gradio as gr
-import pinecone
+import asyncio
 import os 
 import json
-import traceback
+import logging
 
 from tools.chatgpt import ChatGPT
+from tools.clients import MAP
+from tools.completion_cache import CompletionCache
+from tools.context import format_sections, pack_context
+from tools.jobs import IngestQueue
+from tools.map_reduce import map_reduce
+from tools.splitter import split_text
 from tools.pinecone import PineconeManager
+from tools.tracing import start_metrics_server, traced, tracer
 
-# Connect to OpenAI ChatGPT (use OPENAI_API_KEY from environment)
-chatgpt = ChatGPT()
+# Connect to OpenAI ChatGPT (use OPENAI_API_KEY from environment), caching
+# completions if CHATBOT_COMPLETION_CACHE names a cache file
+completion_cache_file = os.getenv("CHATBOT_COMPLETION_CACHE")
+chatgpt = ChatGPT(cache=CompletionCache(completion_cache_file) if completion_cache_file else None)
 
-# Connect to Pinecone
+# Concurrency of the parallel Question with Large Document mode (its requests
+# share the OPENAI_RATE_LIMITS quotas, queued after chat requests)
+MAP_CONCURRENCY = int(os.getenv("CHATBOT_MAP_CONCURRENCY", "4"))
+MAP_SECTION_TOKENS = 2000
+
+# The document library (the vector index is connected on first use)
 docdatabase = PineconeManager()
 
+# Index uploads in background workers (INGEST_WORKERS documents at a time,
+# started with the server)
+INGEST_WORKERS = int(os.getenv("CHATBOT_INGEST_WORKERS", "2"))
+ingest_queue = IngestQueue(docdatabase)
+
 def clear_chat(message_history):
     chatgpt.clear_messages(message_history)
     return [], message_history
 
 
-def generate_chat_response(chat_display, prompt, message_history, model):
+@traced("handler.generate_chat_response")
+async def generate_chat_response(chat_display, prompt, message_history, model):
     if (not(prompt)):
         newchat_display = chat_display + [[prompt, f"Please enter a prompt"]]
-        return (newchat_display, prompt, message_history)
+        yield (newchat_display, prompt, message_history)
+        return
     try:
-        # Now call the chatbot to get the response
-        response = chatgpt.chat(prompt, message_history, model)
-        # Update the chatbot's response
-        newchat_display = chat_display + [[prompt, response]]
-        return (newchat_display, "", message_history)
+        # Now call the chatbot and display the response as it streams in
+        response = ""
+        async for token in chatgpt.chat_stream(prompt, message_history, model):
+            response += token
+            newchat_display = chat_display + [[prompt, response]]
+            yield (newchat_display, "", message_history)
     except Exception as e:
         # Upon error, output the error as the response
         newchat_display = chat_display + [[prompt, f"We received an error: {str(e)}"]]
-        print(traceback.format_exc())
-        return (newchat_display, prompt, message_history)
+        tracer.record_exception(e)
+        yield (newchat_display, prompt, message_history)
 
-def document_lookup_chat(chat_display, search, top_n, prompt, message_history, model):
+@traced("handler.document_lookup_chat")
+async def document_lookup_chat(chat_display, search, top_n, prompt, message_history, model):
     if (not(prompt)):
         newchat_display = chat_display + [[prompt, f"Please enter a prompt"]]
         yield (newchat_display, search, prompt, message_history)
@@ -46,57 +69,72 @@ def document_lookup_chat(chat_display, search, top_n, prompt, message_history, m
         # Update status for search
         newchat_display = chat_display + [[prompt, f"Searching for {top_n} documents with '{search}...'"]]
         yield (newchat_display, search, prompt, message_history)
-        # Conduct search
-        results = docdatabase.query_index(search, top_n)
+        # Conduct search (in a thread so other sessions keep streaming)
+        results = await asyncio.to_thread(docdatabase.query_index, search, top_n)
         newchat_display = chat_display + [[prompt, f"We found {len(results['matches'])} hits. Now executing chat prompt...'"]]
         yield (newchat_display, search, prompt, message_history)
-        chat_search = "The following are a series of document sections for a request below\n\n"
-        for r in results['matches']:
-            chat_search += (
-                "Document Id: " + r['id'] + "\n\n" +
-                r['metadata']['text'] + "\n\n"
+        with tracer.span("handler.document_lookup_chat.prompt") as span:
+            # Fit the best sections (without repeated text) into the model's budget
+            (sections, stats) = pack_context(results['matches'], prompt, model)
+            span.set(**{f"context_{name}": count for (name, count) in stats.items()})
+            chat_search = (
+                "The following are a series of document sections for a request below\n\n" +
+                format_sections(sections) +
+                "Answer the request based upon the above document sections. " +
+                "If the answer is not clear from the source, state 'I cannot answer " +
+                "based upon the documents provided.'\n\n " +
+                "Request: " + prompt
             )
-        chat_search += (
-            "Answer the request based upon the above document sections. " +
-            "If the answer is not clear from the source, state 'I cannot answer " +
-            "based upon the documents provided.'\n\n " +
-            "Request: " + prompt
-        )
-        # Now call the chatbot to get the response
-        response = chatgpt.chat(chat_search, message_history, model)
-        newchat_display = chat_display + [[prompt, response]]
-        yield (newchat_display, "", "", message_history)
+        # Now call the chatbot and display the response as it streams in
+        response = ""
+        async for token in chatgpt.chat_stream(chat_search, message_history, model):
+            response += token
+            newchat_display = chat_display + [[prompt, response]]
+            yield (newchat_display, "", "", message_history)
     except Exception as e:
         newchat_display = chat_display + [[prompt, f"We received an error {str(type(e))}: {str(e)}"]]
-        print(traceback.format_exc())
+        tracer.record_exception(e)
         yield (newchat_display, search, prompt, message_history)
         
     
-def map_reduce_chat(chat_display, document, prompt, message_history, model):
+async def parallel_map_reduce_chat(chat_display, sections, prompt, message_history, model):
+    # Send every section at once (bounded by MAP_CONCURRENCY), then combine the findings
+    status = f"Sending {len(sections)} sections..."
+    async for update in map_reduce(sections, prompt, lambda p: chatgpt.complete(p, model, priority=MAP),
+                                   model, max_concurrency=MAP_CONCURRENCY):
+        if update['stage'] == 'map':
+            status = f"Received findings for {update['done']} of {update['total']} sections..."
+            yield chat_display + [[prompt, status]]
+        elif update['stage'] == 'reduce':
+            status = f"Combining findings (level {update['level']}, {update['groups']} groups)..."
+            yield chat_display + [[prompt, status]]
+        else:
+            # Stream the final answer into the chat history
+            response = ""
+            async for token in chatgpt.chat_stream(update['prompt'], message_history, model):
+                response += token
+                yield chat_display + [[prompt, response]]
+
+
+@traced("handler.map_reduce_chat")
+async def map_reduce_chat(chat_display, document, prompt, message_history, model, mode="Parallel"):
     if (not(document) or not(prompt)):
         newchat_display = chat_display + [[prompt, f"Please enter a document and a prompt"]]
         yield (newchat_display, document, prompt, message_history)
         return
-    # Split the document into sections
-    # Split the text by newline
-    lines = document.split('\n')
-    
-    sections = []
-    section = []
-    count = 0
-    for line in lines:
-        line_word_count = len(line.split())
-        if count + line_word_count > 1500:
-            # Store entry and start new section
-            sections.append('\n'.join(section))
-            section = [line]
-            count = line_word_count
-        else:
-            # Add line to current section
-            section.append(line)
-            count += line_word_count
-    # Store last entry
-    sections.append('\n'.join(section))
+    # Split the document into sections that fit the model
+    sections = split_text(document, max_tokens=MAP_SECTION_TOKENS, model=model)
+
+    if (mode == "Parallel"):
+        try:
+            async for newchat_display in parallel_map_reduce_chat(chat_display, sections, prompt,
+                                                                  message_history, model):
+                yield (newchat_display, document, prompt, message_history)
+        except Exception as e:
+            newchat_display = chat_display + [[prompt, f"We received an error {str(type(e))}: {str(e)}"]]
+            tracer.record_exception(e)
+            yield (newchat_display, document, prompt, message_history)
+        return
 
     try:
         num_sections = len(sections)
@@ -139,41 +177,48 @@ def map_reduce_chat(chat_display, document, prompt, message_history, model):
             # the last response from the chatbot
             if len(message_history) > 0:
                 message_history = [message_history[-1]]
-            response = chatgpt.chat(chat_search, message_history, model)
-            # Display the response (and save it in our local copy of the chat_display)
+            response = ""
+            async for token in chatgpt.chat_stream(chat_search, message_history, model):
+                response += token
+                newchat_display = chat_display + [[chat_search, response]]
+                yield (newchat_display, document, prompt, message_history)
+            # Save the response in our local copy of the chat_display
             chat_display = chat_display + [[chat_search, response]]
-            yield (chat_display, document, prompt, message_history)
             # Move to the next section
             n += 1
     except Exception as e:
         newchat_display = chat_display + [[prompt, f"We received an error {str(type(e))}: {str(e)}"]]
-        print(traceback.format_exc())
+        tracer.record_exception(e)
         yield (newchat_display, document, prompt, message_history)
         
     
+@traced("handler.add_document")
 def add_document(lib_upload):
     filename = os.path.basename(lib_upload.name)
-    if (filename in docdatabase.get_document_list()):
-        return (None, "File already exists.")
-    # Read the file
-    with open(lib_upload.name,'r') as file:
-        text = file.read()
-    # Unlink the file
-    os.remove(lib_upload.name)
-    # Now insert the file into pinecone
+    # Queue the file for the background ingestion workers (an existing file is
+    # updated in place, re-indexing only its changed sections)
     try:
-        num_sections = docdatabase.add_document(filename, text)
+        ingest_queue.submit(filename, lib_upload.name)
     except Exception as e:
-        return (None, "We received an error: " + str(e))
-    return (gr.Dropdown.update(choices=docdatabase.get_document_list(), value=filename),
-            f"File {filename} added, split into {num_sections} sections.")
+        tracer.record_exception(e)
+        return (gr.Dropdown.update(), "We received an error: " + str(e), list_jobs())
+    return (gr.Dropdown.update(), f"File {filename} queued for indexing.", list_jobs())
+
+def list_jobs():
+    return [[job['title'], job['status'], job['sections_done'], job['message'], job['updated']]
+            for job in ingest_queue.list_jobs()]
 
+def refresh_library():
+    return (gr.Dropdown.update(choices=docdatabase.get_document_list()), list_jobs())
+
+@traced("handler.remove_document")
 def remove_document(filename):
     if (filename == None) or (filename == ""):
         return (None, "Please select a file.")
     try:
         num_sections = docdatabase.remove_document(filename)
     except Exception as e:
+        tracer.record_exception(e)
         return (None, "We received an error: " + str(e))
     return (gr.Dropdown.update(choices=docdatabase.get_document_list(), value=""),
             f"File {filename} with {num_sections} sections removed.")
@@ -187,6 +232,8 @@ with gr.Blocks(css="footer {visibility: hidden}", title="Chatbot Application") a
                 radio = gr.Radio(value='gpt-3.5-turbo-16k', show_label=False,
                                  choices=['gpt-3.5-turbo','gpt-3.5-turbo-16k','gpt-4'],
                                  container=False)
+            with gr.Column(scale=2, min_width=110):
+                stop_chat_button = gr.Button("Stop")
             with gr.Column(scale=2, min_width=110):
                 clear_chat_button = gr.Button("Clear Chat")
         chat_display = gr.Chatbot(value=[], elem_id="chat_display", height=500)
@@ -220,6 +267,9 @@ with gr.Blocks(css="footer {visibility: hidden}", title="Chatbot Application") a
                 with gr.Column(scale=2, min_width=110):
                     dl_submit = gr.Button("Submit")
         with gr.Tab("Question with Large Document"):
+            mr_mode = gr.Radio(value='Parallel', show_label=False,
+                               choices=['Parallel', 'Sequential'],
+                               container=False)
             mr_document = gr.Textbox(
                 show_label=False, max_lines=5,
                 placeholder="Cut and Paste Document Here",
@@ -243,34 +293,51 @@ with gr.Blocks(css="footer {visibility: hidden}", title="Chatbot Application") a
             lib_upload = gr.UploadButton(label='Upload a new file', file_types=["text"])
         with gr.Row():
             lib_status = gr.Markdown()
+        with gr.Row():
+            lib_jobs = gr.Dataframe(headers=['File', 'Status', 'Sections', 'Message', 'Updated'],
+                                    value=list_jobs, label='Indexing jobs', interactive=False)
 
     # Clear CHAT
     clear_chat_button.click(clear_chat, [message_history], [chat_display, message_history])
     # NORMAL CHAT
-    nc_prompt.submit(generate_chat_response, [chat_display, nc_prompt, message_history, radio],
+    nc_prompt_submit = nc_prompt.submit(generate_chat_response, [chat_display, nc_prompt, message_history, radio],
                      [chat_display, nc_prompt, message_history])
-    nc_submit.click(generate_chat_response, [chat_display, nc_prompt, message_history, radio],
+    nc_submit_click = nc_submit.click(generate_chat_response, [chat_display, nc_prompt, message_history, radio],
                     [chat_display, nc_prompt, message_history])
     # Document lookup and chat
-    dl_prompt.submit(document_lookup_chat, [chat_display, dl_search, dl_top_n, dl_prompt, message_history, radio],
+    dl_prompt_submit = dl_prompt.submit(document_lookup_chat, [chat_display, dl_search, dl_top_n, dl_prompt, message_history, radio],
                     [chat_display, dl_search, dl_prompt, message_history])
-    dl_submit.click(document_lookup_chat, [chat_display, dl_search, dl_top_n, dl_prompt, message_history, radio],
+    dl_submit_click = dl_submit.click(document_lookup_chat, [chat_display, dl_search, dl_top_n, dl_prompt, message_history, radio],
                     [chat_display, dl_search, dl_prompt, message_history])
     # Question with Large Document (Map-Reduce)
-    mr_prompt.submit(map_reduce_chat, [chat_display, mr_document, mr_prompt, message_history, radio],
+    mr_prompt_submit = mr_prompt.submit(map_reduce_chat, [chat_display, mr_document, mr_prompt, message_history, radio, mr_mode],
                     [chat_display, mr_document, mr_prompt, message_history])
-    mr_submit.click(map_reduce_chat, [chat_display, mr_document, mr_prompt, message_history, radio],
+    mr_submit_click = mr_submit.click(map_reduce_chat, [chat_display, mr_document, mr_prompt, message_history, radio, mr_mode],
                     [chat_display, mr_document, mr_prompt, message_history])
+    # Stop any running chat (frees the worker and closes the openai stream)
+    stop_chat_button.click(None, None, None, cancels=[nc_prompt_submit, nc_submit_click,
+                                                      dl_prompt_submit, dl_submit_click,
+                                                      mr_prompt_submit, mr_submit_click])
     # LIBRARY DIALOG
     lib_delete_button.click(remove_document, [lib_doc_list], [lib_doc_list, lib_status])
-    lib_upload.upload(add_document, [lib_upload], [lib_doc_list, lib_status])
+    lib_upload.upload(add_document, [lib_upload], [lib_doc_list, lib_status, lib_jobs])
+    # Poll the ingestion jobs (and pick up newly indexed files)
+    demo.load(refresh_library, None, [lib_doc_list, lib_jobs], every=2)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    # Serve Prometheus metrics if CHATBOT_METRICS_PORT is set
+    metrics_port = os.getenv("CHATBOT_METRICS_PORT")
+    if metrics_port:
+        start_metrics_server(int(metrics_port))
 
-# NOTE: Set GRADIO_SERVER_NAME
-gruser = os.getenv("GRCHATBOT_USER")
-grpassword = os.getenv("GRCHATBOT_PASSWORD")
-if (gruser is None) or (grpassword is None):
-    auth = None
-else:
-    auth = (gruser, grpassword)
+    # NOTE: Set GRADIO_SERVER_NAME
+    gruser = os.getenv("GRCHATBOT_USER")
+    grpassword = os.getenv("GRCHATBOT_PASSWORD")
+    if (gruser is None) or (grpassword is None):
+        auth = None
+    else:
+        auth = (gruser, grpassword)
 
-demo.queue().launch(share=False, auth=auth)
+    ingest_queue.start(workers=INGEST_WORKERS)
+    demo.queue().launch(share=False, auth=auth)
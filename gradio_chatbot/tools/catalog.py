@@ -0,0 +1,178 @@
+"""
+catalog.py
+
+This module keeps the catalog of library documents (and the ids and
+hashes of their sections) in SQLite. Each operation runs in its own
+transaction, so several Gradio workers can add and remove documents at
+the same time without losing each other's writes.
+"""
+
+import json
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+
+class DocumentCatalog:
+    """
+    A transactional SQLite catalog of the documents in the library.
+
+    Attributes
+    ----------
+    path : str
+        Path to the SQLite file.
+
+    Methods
+    -------
+    list_documents():
+        Returns the sorted list of document titles.
+    has_document(title):
+        Returns whether a document is in the catalog.
+    get_document(title):
+        Returns a document's catalog entry, or None.
+    get_sections(title):
+        Returns a document's (section_id, hash) pairs in order, or None.
+    add_document(title, content_hash, section_ids, section_hashes, embedding_model):
+        Adds a document and its sections.
+    update_document(title, content_hash, section_ids, section_hashes, embedding_model):
+        Replaces a document's sections.
+    remove_document(title):
+        Removes a document and its sections.
+    get_setting(name):
+        Returns a cached setting (any JSON value), or None.
+    set_setting(name, value):
+        Stores a setting.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS documents (
+            title TEXT PRIMARY KEY,
+            content_hash TEXT,
+            section_count INTEGER,
+            embedding_model TEXT,
+            created TEXT,
+            updated TEXT
+        );
+        CREATE TABLE IF NOT EXISTS sections (
+            document TEXT REFERENCES documents(title) ON DELETE CASCADE,
+            position INTEGER,
+            section_id TEXT,
+            hash TEXT,
+            PRIMARY KEY (document, position)
+        );
+        CREATE TABLE IF NOT EXISTS settings (
+            name TEXT PRIMARY KEY,
+            value TEXT
+        );
+    """
+
+    def __init__(self, path):
+        self.path = path
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(self.SCHEMA)
+        finally:
+            db.close()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Opens a connection and runs the block in one write transaction.
+        """
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            db.execute("PRAGMA foreign_keys=ON")
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+        finally:
+            db.close()
+
+    def _query(self, sql, params=()):
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            return db.execute(sql, params).fetchall()
+        finally:
+            db.close()
+
+    def list_documents(self):
+        return [title for (title,) in self._query("SELECT title FROM documents ORDER BY title")]
+
+    def has_document(self, title):
+        return bool(self._query("SELECT 1 FROM documents WHERE title = ?", (title,)))
+
+    def get_document(self, title):
+        rows = self._query(
+            "SELECT title, content_hash, section_count, embedding_model, created, updated "
+            "FROM documents WHERE title = ?", (title,))
+        if not rows:
+            return None
+        keys = ('title', 'content_hash', 'section_count', 'embedding_model', 'created', 'updated')
+        return dict(zip(keys, rows[0]))
+
+    def get_sections(self, title):
+        if not self.has_document(title):
+            return None
+        return self._query(
+            "SELECT section_id, hash FROM sections WHERE document = ? ORDER BY position", (title,))
+
+    def add_document(self, title, content_hash, section_ids, section_hashes, embedding_model):
+        """
+        Adds a document and its sections.
+
+        Raises
+        ------
+        ValueError
+            If a document with the same title is already in the catalog.
+        """
+        now = datetime.now(timezone.utc).isoformat()
+        with self.transaction() as db:
+            try:
+                db.execute("INSERT INTO documents VALUES (?, ?, ?, ?, ?, ?)",
+                           (title, content_hash, len(section_ids), embedding_model, now, now))
+            except sqlite3.IntegrityError:
+                raise ValueError(f"Document '{title}' already exists.")
+            db.executemany("INSERT INTO sections VALUES (?, ?, ?, ?)",
+                           [(title, i, id, h) for i, (id, h) in enumerate(zip(section_ids, section_hashes))])
+
+    def update_document(self, title, content_hash, section_ids, section_hashes, embedding_model):
+        now = datetime.now(timezone.utc).isoformat()
+        with self.transaction() as db:
+            db.execute("UPDATE documents SET content_hash = ?, section_count = ?, embedding_model = ?, "
+                       "updated = ? WHERE title = ?",
+                       (content_hash, len(section_ids), embedding_model, now, title))
+            db.execute("DELETE FROM sections WHERE document = ?", (title,))
+            db.executemany("INSERT INTO sections VALUES (?, ?, ?, ?)",
+                           [(title, i, id, h) for i, (id, h) in enumerate(zip(section_ids, section_hashes))])
+
+    def remove_document(self, title):
+        with self.transaction() as db:
+            db.execute("DELETE FROM documents WHERE title = ?", (title,))
+
+    def import_json(self, documents, manifest):
+        """
+        Imports the legacy JSON document list and section manifest.
+
+        Documents without a manifest entry get an unknown (NULL) section count.
+        """
+        now = datetime.now(timezone.utc).isoformat()
+        with self.transaction() as db:
+            for title in documents:
+                ids = manifest.get(title, [])
+                db.execute("INSERT OR IGNORE INTO documents VALUES (?, ?, ?, ?, ?, ?)",
+                           (title, None, len(ids) if title in manifest else None, None, now, now))
+                db.executemany("INSERT OR IGNORE INTO sections VALUES (?, ?, ?, ?)",
+                               [(title, i, id, None) for i, id in enumerate(ids)])
+
+    def get_setting(self, name):
+        rows = self._query("SELECT value FROM settings WHERE name = ?", (name,))
+        return json.loads(rows[0][0]) if rows else None
+
+    def set_setting(self, name, value):
+        with self.transaction() as db:
+            db.execute("INSERT OR REPLACE INTO settings VALUES (?, ?)", (name, json.dumps(value)))
@@ -6,8 +6,14 @@ ChatGPT, by managing the chat history and environment setup.
 """
 
 import os
+import time
 import openai
 
+from tools.clients import CHAT, chat_completion_async
+from tools.completion_cache import cached_chat_completion, completion_key
+from tools.tokens import count_message_tokens, count_tokens, trim_messages
+from tools.tracing import tracer
+
 class ChatGPT:
     """
     A class to manage interactions with OpenAI's ChatGPT.
@@ -16,6 +22,8 @@ class ChatGPT:
     ----------
     api_key : str
         OpenAI API key obtained from environment variable.
+    cache : CompletionCache
+        Optional cache of completions (None to always call the API).
 
     Methods
     -------
@@ -25,14 +33,24 @@ class ChatGPT:
         Adds an assistant message to the message history.
     chat(message, message_history, model="gpt-3.5-turbo"):
         Sends a message to the GPT model and returns its response.
+    chat_stream(message, message_history, model="gpt-3.5-turbo"):
+        Sends a message to the GPT model and yields its response as it arrives.
+    complete(message, model="gpt-3.5-turbo"):
+        Sends a single message, without history, and returns the response.
     clear_messages(message_history):
         Clears the chat history.
     """
 
-    def __init__(self):
+    def __init__(self, cache=None):
         """
         Constructs necessary attributes for the ChatGPT object.
+
+        Parameters
+        ----------
+        cache : CompletionCache, optional
+            Cache identical requests instead of calling the API again.
         """
+        self.cache = cache
         self.api_key = os.getenv("OPENAI_API_KEY")
         if self.api_key is None:
             raise Exception("OPENAI_API_KEY is not set in the environment variables.")
@@ -65,6 +83,15 @@ class ChatGPT:
         """
         message_history.append({'role': 'assistant', 'content': content})
 
+    def trim_history(self, message_history, model):
+        # Trim the history to the model's window; a new message that can't
+        # fit is taken back out, so the history has no unanswered turn
+        try:
+            return trim_messages(message_history, model)
+        except ValueError:
+            message_history.pop()
+            raise
+
     def chat(self, message, message_history, model="gpt-3.5-turbo"):
         """
         Sends a message to the GPT model and returns its response.
@@ -83,24 +110,98 @@ class ChatGPT:
         str
             The response from the GPT model.
         """
-        self.add_user_message(message, message_history)
-        while True:
-            # Try the query
+        with tracer.span("chatgpt.chat", model=model):
+            self.add_user_message(message, message_history)
+            # Drop the oldest messages so the request fits the model's window
+            tracer.annotate(trimmed_messages=self.trim_history(message_history, model))
+            gpt_response = cached_chat_completion(self.cache, model, message_history)
+            self.add_assistant_message(gpt_response, message_history)
+            return gpt_response
+
+    async def chat_stream(self, message, message_history, model="gpt-3.5-turbo"):
+        """
+        Sends a message to the GPT model and yields its response as it arrives.
+
+        The full response is added to the message history when the stream
+        ends. If the caller stops iterating (e.g. the request is cancelled),
+        the connection is closed and the partial response is kept.
+
+        Parameters
+        ----------
+        message : str
+            The message to be sent to the GPT model.
+        message_history : list
+            The message history list
+        model : str, optional
+            The GPT model to be used (default is "gpt-3.5-turbo").
+
+        Yields
+        ------
+        str
+            Each new piece of the response text.
+        """
+        with tracer.span("chatgpt.chat_stream", model=model) as span:
+            self.add_user_message(message, message_history)
+            # Drop the oldest messages so the request fits the model's window
+            span.set(trimmed_messages=self.trim_history(message_history, model))
+            key = completion_key(model, message_history) if self.cache is not None else None
+            if key is not None:
+                gpt_response = self.cache.get(key)
+                if gpt_response is not None:
+                    self.add_assistant_message(gpt_response, message_history)
+                    yield gpt_response
+                    return
+            prompt_tokens = count_message_tokens(message_history, model)
+            response = await chat_completion_async(model, message_history, stream=True)
+            gpt_response = ""
             try:
-                response = openai.ChatCompletion.create(
-                    model=model,
-                    messages=message_history,
-                )
-                break
-            except openai.error.InvalidRequestError as e:
-                # Our response was probably too long so remove the first one
-                if (len(message_history) < 2):
-                    raise e
-                else:
-                    message_history.pop(0)
-        gpt_response = response['choices'][0]['message']['content']
-        self.add_assistant_message(gpt_response, message_history)
-        return gpt_response
+                async for chunk in response:
+                    content = chunk['choices'][0]['delta'].get('content')
+                    if content:
+                        if not gpt_response:
+                            span.set(first_token_seconds=time.perf_counter() - span.started)
+                        gpt_response += content
+                        yield content
+                # Only cache complete responses
+                if key is not None:
+                    self.cache.put(key, gpt_response)
+            finally:
+                # Free the connection (this also runs when the request is cancelled)
+                await response.aclose()
+                self.add_assistant_message(gpt_response, message_history)
+                tracer.record_tokens(model, prompt_tokens=prompt_tokens,
+                                     completion_tokens=count_tokens(gpt_response, model))
+
+    async def complete(self, message, model="gpt-3.5-turbo", priority=CHAT):
+        """
+        Sends a single message, without history, and returns the response.
+
+        Parameters
+        ----------
+        message : str
+            The message to be sent to the GPT model.
+        model : str, optional
+            The GPT model to be used (default is "gpt-3.5-turbo").
+        priority : int, optional
+            Rate limiter queue priority (default is CHAT).
+
+        Returns
+        -------
+        str
+            The response from the GPT model.
+        """
+        with tracer.span("chatgpt.complete", model=model):
+            messages = [{'role': 'user', 'content': message}]
+            key = completion_key(model, messages) if self.cache is not None else None
+            if key is not None:
+                gpt_response = self.cache.get(key)
+                if gpt_response is not None:
+                    return gpt_response
+            response = await chat_completion_async(model, messages, priority)
+            gpt_response = response['choices'][0]['message']['content']
+            if key is not None:
+                self.cache.put(key, gpt_response)
+            return gpt_response
 
     def clear_messages(self, message_history):
         """
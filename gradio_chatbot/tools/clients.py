@@ -0,0 +1,361 @@
+"""
+clients.py
+
+This module is the process-wide layer in front of the OpenAI and Pinecone
+clients: pooled keep-alive HTTP connections, a token-bucket rate limiter
+per model (requests and tokens per minute) with queue priorities, and
+retries with exponential backoff and jitter.
+"""
+
+import asyncio
+import functools
+import itertools
+import json
+import os
+import random
+import threading
+import time
+import weakref
+
+import openai
+import requests
+from requests.adapters import HTTPAdapter
+
+from tools.tokens import count_message_tokens, count_tokens
+from tools.tracing import tracer
+
+# Queue priorities (lower goes first): interactive chat wins over the many
+# requests of a map/reduce answer, which win over bulk ingestion
+CHAT = 0
+MAP = 5
+BULK = 10
+
+# Default (requests per minute, tokens per minute) quotas; override with
+# OPENAI_RATE_LIMITS='{"gpt-4": [500, 30000]}'
+DEFAULT_RATE_LIMITS = {
+    'gpt-3.5-turbo': (3500, 90000),
+    'gpt-3.5-turbo-16k': (3500, 180000),
+    'gpt-4': (200, 40000),
+    'gpt-4o': (500, 30000),
+    'text-embedding-ada-002': (3000, 1000000),
+    'pinecone': (6000, None),
+}
+
+# Completion tokens assumed when a request does not set max_tokens
+COMPLETION_TOKEN_ESTIMATE = 500
+
+# Keep-alive connections kept open per host
+HTTP_POOL_SIZE = int(os.getenv("CHATBOT_HTTP_POOL_SIZE", "32"))
+
+# Errors worth retrying (rate limits and transient service failures)
+RETRYABLE_ERRORS = (
+    openai.error.RateLimitError,
+    openai.error.APIError,
+    openai.error.Timeout,
+    openai.error.APIConnectionError,
+    openai.error.ServiceUnavailableError,
+)
+# HTTP statuses worth retrying on Pinecone calls
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+
+
+def is_retryable(error):
+    """
+    Checks if an error is a rate limit or transient service failure: one of
+    RETRYABLE_ERRORS, or a Pinecone ApiException with a RETRYABLE_STATUSES status.
+    """
+    if isinstance(error, RETRYABLE_ERRORS):
+        return True
+    try:
+        from pinecone.core.client.exceptions import ApiException
+    except ImportError:
+        return False
+    return isinstance(error, ApiException) and error.status in RETRYABLE_STATUSES
+
+
+class TokenBucket:
+    """
+    A token bucket refilled continuously at rate_per_minute.
+
+    The capacity is one minute of quota, so a burst can use the whole
+    minute's allowance before callers start to wait.
+    """
+
+    def __init__(self, rate_per_minute):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(rate_per_minute)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        # Seconds until amount is available (0 if it is available now)
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.level) / self.rate)
+
+    def take(self, amount):
+        self.level -= min(amount, self.capacity)
+
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute buckets for each model.
+
+    A caller waits until both of its model's buckets have room and no
+    caller with a higher priority (lower number) is waiting for the same
+    model. acquire() blocks the thread; acquire_async() awaits.
+
+    Methods
+    -------
+    configure(model, requests_per_minute, tokens_per_minute=None):
+        Sets the quota of a model.
+    acquire(model, tokens=0, priority=CHAT):
+        Waits for quota and takes one request and the tokens.
+    acquire_async(model, tokens=0, priority=CHAT):
+        The same, for coroutines.
+    """
+
+    def __init__(self, limits=None):
+        self.lock = threading.Lock()
+        self.buckets = {}
+        self.waiting = {}
+        self.tickets = itertools.count()
+        for model, (rpm, tpm) in (limits or {}).items():
+            self.configure(model, rpm, tpm)
+
+    def configure(self, model, requests_per_minute, tokens_per_minute=None):
+        with self.lock:
+            self.buckets[model] = (TokenBucket(requests_per_minute),
+                                   TokenBucket(tokens_per_minute) if tokens_per_minute else None)
+
+    def _buckets(self, model):
+        # Dated variants (e.g. "gpt-4-0613") share the quota of their base model
+        matches = [name for name in self.buckets if model.startswith(name)]
+        return self.buckets[max(matches, key=len)] if matches else None
+
+    def _try(self, model, tokens, ticket):
+        # Returns 0 when the quota was taken, otherwise the seconds to wait
+        with self.lock:
+            buckets = self._buckets(model)
+            if buckets is None:
+                return 0.0
+            waiting = self.waiting.setdefault(model, set())
+            waiting.add(ticket)
+            if min(waiting) != ticket:
+                return 0.05
+            now = time.monotonic()
+            (requests_bucket, tokens_bucket) = buckets
+            delay = requests_bucket.wait_time(1, now)
+            if tokens_bucket is not None:
+                delay = max(delay, tokens_bucket.wait_time(tokens, now))
+            if delay > 0:
+                return delay
+            requests_bucket.take(1)
+            if tokens_bucket is not None:
+                tokens_bucket.take(tokens)
+            waiting.discard(ticket)
+            return 0.0
+
+    def _leave(self, model, ticket):
+        with self.lock:
+            self.waiting.get(model, set()).discard(ticket)
+
+    def acquire(self, model, tokens=0, priority=CHAT):
+        ticket = (priority, next(self.tickets))
+        try:
+            while True:
+                delay = self._try(model, tokens, ticket)
+                if not delay:
+                    return
+                time.sleep(min(delay, 1.0))
+        finally:
+            self._leave(model, ticket)
+
+    async def acquire_async(self, model, tokens=0, priority=CHAT):
+        ticket = (priority, next(self.tickets))
+        try:
+            while True:
+                delay = self._try(model, tokens, ticket)
+                if not delay:
+                    return
+                await asyncio.sleep(min(delay, 1.0))
+        finally:
+            self._leave(model, ticket)
+
+
+def load_rate_limits():
+    limits = dict(DEFAULT_RATE_LIMITS)
+    overrides = os.getenv("OPENAI_RATE_LIMITS")
+    if overrides:
+        limits.update({model: tuple(limit) for model, limit in json.loads(overrides).items()})
+    return limits
+
+
+# The process-wide limiter shared by every client
+limiter = RateLimiter(load_rate_limits())
+
+
+def backoff_delay(attempt, backoff=1.0, max_backoff=30.0):
+    """
+    Returns the delay before retry attempt (exponential with full jitter).
+    """
+    return min(max_backoff, backoff * (2 ** attempt)) * random.uniform(0.5, 1.0)
+
+
+def with_retries(fn, *args, retries=5, backoff=1.0, max_backoff=30.0, **kwargs):
+    """
+    Calls fn, retrying retryable errors (see is_retryable) with exponential
+    backoff and jitter.
+
+    Parameters
+    ----------
+    fn : callable
+        The function to call with *args and **kwargs.
+    retries : int, optional
+        Number of retries before the last error is raised (default is 5).
+    backoff : float, optional
+        Initial delay in seconds, doubled after each attempt (default is 1.0).
+    max_backoff : float, optional
+        Upper bound on a single delay (default is 30.0).
+    """
+    attempt = 0
+    while True:
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if not is_retryable(e) or attempt >= retries:
+                raise
+            tracer.record_retry(getattr(fn, '__qualname__', repr(fn)), e)
+            time.sleep(backoff_delay(attempt, backoff, max_backoff))
+            attempt += 1
+
+
+async def with_retries_async(fn, *args, retries=5, backoff=1.0, max_backoff=30.0, **kwargs):
+    """
+    Awaits fn(*args, **kwargs), retrying like with_retries.
+    """
+    attempt = 0
+    while True:
+        try:
+            return await fn(*args, **kwargs)
+        except Exception as e:
+            if not is_retryable(e) or attempt >= retries:
+                raise
+            tracer.record_retry(getattr(fn, '__qualname__', repr(fn)), e)
+            await asyncio.sleep(backoff_delay(attempt, backoff, max_backoff))
+            attempt += 1
+
+
+def pooled_session(pool_size=HTTP_POOL_SIZE):
+    """
+    Returns a requests session that keeps up to pool_size connections alive.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+# Share keep-alive connections across all (threaded) openai calls
+openai.requestssession = pooled_session()
+
+# One aiohttp session per event loop for the async openai calls (a loop
+# that is garbage collected drops out; close_aiosession() closes one)
+aiosessions = weakref.WeakKeyDictionary()
+
+
+def shared_aiosession(pool_size=HTTP_POOL_SIZE):
+    """
+    Returns the keep-alive aiohttp session of the running event loop.
+    """
+    import aiohttp
+
+    loop = asyncio.get_running_loop()
+    session = aiosessions.get(loop)
+    if session is None or session.closed:
+        session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=pool_size))
+        aiosessions[loop] = session
+    return session
+
+
+async def close_aiosession():
+    """
+    Closes the running event loop's keep-alive session (call before the loop ends).
+    """
+    session = aiosessions.pop(asyncio.get_running_loop(), None)
+    if session is not None and not session.closed:
+        await session.close()
+
+
+def estimate_chat_tokens(model, messages, params):
+    # Quotas count the prompt plus the completion (max_tokens, if set)
+    return count_message_tokens(messages, model) + params.get('max_tokens', COMPLETION_TOKEN_ESTIMATE)
+
+
+def record_usage(model, messages, response):
+    # Token counts reported by the API (estimated if it reports none)
+    usage = response.get('usage') or {}
+    prompt_tokens = usage.get('prompt_tokens') or count_message_tokens(messages, model)
+    completion_tokens = (usage.get('completion_tokens')
+                         or count_tokens(response['choices'][0]['message']['content'], model))
+    tracer.record_tokens(model, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+
+def chat_completion(model, messages, priority=CHAT, **params):
+    """
+    ChatCompletion.create through the limiter, with retries.
+    """
+    tokens = estimate_chat_tokens(model, messages, params)
+
+    # Every attempt (including retries after a 429) goes through the limiter;
+    # wraps keeps the endpoint name that retries are recorded under
+    @functools.wraps(openai.ChatCompletion.create)
+    def create():
+        limiter.acquire(model, tokens, priority)
+        return openai.ChatCompletion.create(model=model, messages=messages, **params)
+
+    response = with_retries(create)
+    record_usage(model, messages, response)
+    return response
+
+
+async def chat_completion_async(model, messages, priority=CHAT, **params):
+    """
+    ChatCompletion.acreate through the limiter, with retries (also for
+    stream=True, where only opening the stream is retried).
+    """
+    tokens = estimate_chat_tokens(model, messages, params)
+    # Reuse this event loop's keep-alive session instead of one session per call
+    openai.aiosession.set(shared_aiosession())
+
+    @functools.wraps(openai.ChatCompletion.acreate)
+    async def acreate():
+        await limiter.acquire_async(model, tokens, priority)
+        return await openai.ChatCompletion.acreate(model=model, messages=messages, **params)
+
+    response = await with_retries_async(acreate)
+    # Streamed responses are counted by the caller once the stream ends
+    if not params.get('stream'):
+        record_usage(model, messages, response)
+    return response
+
+
+def embedding(texts, model, priority=BULK):
+    """
+    Embedding.create through the limiter, with retries.
+    """
+    tokens = sum(count_tokens(t, model) for t in texts)
+
+    @functools.wraps(openai.Embedding.create)
+    def create():
+        limiter.acquire(model, tokens, priority)
+        return openai.Embedding.create(input=texts, engine=model)
+
+    response = with_retries(create)
+    tracer.record_tokens(model, embedding_tokens=tokens)
+    return response
@@ -0,0 +1,166 @@
+"""
+completion_cache.py
+
+This module provides an optional cache of chat completions keyed on the
+model, the request parameters and the (normalized) messages, so repeated
+questions and temperature=0 prompts are answered without an API call.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from tools.clients import CHAT, chat_completion
+from tools.tracing import tracer
+
+
+def completion_key(model, messages, **params):
+    """
+    Returns the cache key for a chat completion request.
+
+    Message roles and surrounding whitespace are normalized so trivially
+    different requests share an entry.
+    """
+    normalized = [{'role': m['role'].strip().lower(), 'content': m['content'].strip()}
+                  for m in messages]
+    request = json.dumps({'model': model, 'params': params, 'messages': normalized},
+                         sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(request.encode('utf-8')).hexdigest()
+
+
+class CompletionCache:
+    """
+    A two-tier completion cache: an in-memory LRU in front of SQLite.
+
+    Attributes
+    ----------
+    path : str
+        Path to the SQLite file (":memory:" for a process-local cache).
+    lru_size : int
+        Number of completions kept in memory.
+    ttl : float
+        Seconds a completion stays valid (None to never expire).
+    max_entries : int
+        Maximum completions kept on disk; the least recently used are evicted.
+    hits, disk_hits, misses : int
+        Lookup counters (hits counts both memory and disk hits).
+
+    Methods
+    -------
+    get(key):
+        Returns the cached completion text, or None.
+    put(key, text):
+        Stores a completion.
+    stats():
+        Returns the hit/miss counters.
+    """
+
+    def __init__(self, path="completion-cache.db", lru_size=1000, ttl=7 * 24 * 3600,
+                 max_entries=100000):
+        self.path = path
+        self.lru_size = lru_size
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.lru = OrderedDict()
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS completions "
+            "(key TEXT PRIMARY KEY, text TEXT, created REAL, accessed REAL)")
+        self.db.execute(
+            "CREATE INDEX IF NOT EXISTS completions_accessed ON completions (accessed)")
+        self.db.commit()
+
+    def _expired(self, created):
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    def get(self, key):
+        with self.lock:
+            if key in self.lru:
+                (text, created) = self.lru[key]
+                if not self._expired(created):
+                    self.lru.move_to_end(key)
+                    self.hits += 1
+                    tracer.record_cache('completion', 1, 0)
+                    return text
+                del self.lru[key]
+            row = self.db.execute(
+                "SELECT text, created FROM completions WHERE key = ?", (key,)).fetchone()
+            if row is None or self._expired(row[1]):
+                self.misses += 1
+                tracer.record_cache('completion', 0, 1)
+                return None
+            self.db.execute("UPDATE completions SET accessed = ? WHERE key = ?", (time.time(), key))
+            self.db.commit()
+            self._remember(key, row[0], row[1])
+            self.hits += 1
+            self.disk_hits += 1
+            tracer.record_cache('completion', 1, 0)
+            return row[0]
+
+    def put(self, key, text):
+        now = time.time()
+        with self.lock:
+            self._remember(key, text, now)
+            self.db.execute("INSERT OR REPLACE INTO completions VALUES (?, ?, ?, ?)",
+                            (key, text, now, now))
+            self._evict(now)
+            self.db.commit()
+
+    def _remember(self, key, text, created):
+        self.lru[key] = (text, created)
+        self.lru.move_to_end(key)
+        while len(self.lru) > self.lru_size:
+            self.lru.popitem(last=False)
+
+    def _evict(self, now):
+        # Drop expired entries, then the least recently used beyond max_entries
+        if self.ttl is not None:
+            self.db.execute("DELETE FROM completions WHERE created < ?", (now - self.ttl,))
+        self.db.execute(
+            "DELETE FROM completions WHERE key IN (SELECT key FROM completions "
+            "ORDER BY accessed DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+
+    def stats(self):
+        return {'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses}
+
+
+def cached_chat_completion(cache, model, messages, priority=CHAT, **params):
+    """
+    Calls openai.ChatCompletion.create (rate limited and retried, see
+    tools.clients) through a CompletionCache.
+
+    Parameters
+    ----------
+    cache : CompletionCache
+        The cache to use (None to always call the API).
+    model : str
+        The GPT model to be used.
+    messages : list
+        The chat messages.
+    priority : int, optional
+        Rate limiter queue priority (default is CHAT).
+    **params
+        Other ChatCompletion parameters (e.g. temperature=0).
+
+    Returns
+    -------
+    str
+        The completion text.
+    """
+    key = completion_key(model, messages, **params) if cache is not None else None
+    if key is not None:
+        text = cache.get(key)
+        if text is not None:
+            return text
+    response = chat_completion(model, messages, priority, **params)
+    text = response['choices'][0]['message']['content']
+    if key is not None:
+        cache.put(key, text)
+    return text
@@ -0,0 +1,164 @@
+"""
+context.py
+
+This module packs the document sections found by a search into a token
+budget for the chosen model. Sections are taken best score first, text
+already packed (from overlapping or duplicate sections) is dropped, and
+sections that score well below the best match, or that no longer fit,
+are trimmed to the sentences that best match the request.
+"""
+
+import json
+import os
+import re
+
+from tools.splitter import hard_split
+from tools.tokens import context_window, count_tokens
+
+# Per-model context budgets in tokens, matched by the longest model prefix
+# CHATBOT_CONTEXT_TOKENS='{"gpt-4": 3000, "gpt-3.5-turbo-16k": 8000}'
+CONTEXT_BUDGET_OVERRIDES = json.loads(os.getenv("CHATBOT_CONTEXT_TOKENS", "{}"))
+
+# Sections scoring more than this below the best match are trimmed to their best sentences
+TAIL_SCORE_MARGIN = 0.05
+# Most tokens kept from a trimmed section
+TRIMMED_SECTION_TOKENS = 200
+# Sections with less than this fraction of new (not yet packed) text are dropped
+MIN_NEW_FRACTION = 0.2
+# Stop packing when less than this many tokens are left
+MIN_SECTION_TOKENS = 32
+
+SECTION_HEADER = "Document Id: {id}\n\n"
+
+SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+|\n+")
+WORD = re.compile(r"[a-z0-9]+")
+STOP_WORDS = frozenset(
+    "a an and are as at be by for from has have how in is it its of on or that the "
+    "their there this to was were what when where which who why will with".split())
+
+
+def context_budget(model, reserve_tokens=None):
+    """
+    Returns the tokens available for document sections in a prompt to model.
+
+    The default is half of the prompt space (the window less the tokens
+    reserved for the reply), leaving the rest for the request and the chat
+    history. CHATBOT_CONTEXT_TOKENS overrides it per model.
+    """
+    matches = [name for name in CONTEXT_BUDGET_OVERRIDES if model.startswith(name)]
+    if matches:
+        return int(CONTEXT_BUDGET_OVERRIDES[max(matches, key=len)])
+    window = context_window(model)
+    if reserve_tokens is None:
+        reserve_tokens = min(1024, window // 4)
+    return (window - reserve_tokens) // 2
+
+
+def split_sentences(text):
+    return [s.strip() for s in SENTENCE_BREAK.split(text) if s.strip()]
+
+
+def normalize(sentence):
+    return " ".join(WORD.findall(sentence.lower()))
+
+
+def terms(text):
+    return {w for w in WORD.findall(text.lower()) if w not in STOP_WORDS and len(w) > 1}
+
+
+def best_sentences(sentences, request_terms, budget, model):
+    """
+    Returns the sentences sharing the most terms with the request that fit
+    the budget, in document order, with gaps marked by "...".
+    """
+    sizes = [count_tokens(s, model) for s in sentences]
+    ranked = sorted(range(len(sentences)),
+                    key=lambda i: (-len(terms(sentences[i]) & request_terms), i))
+    chosen = []
+    used = 0
+    for i in ranked:
+        if used + sizes[i] + 1 <= budget:
+            chosen.append(i)
+            used += sizes[i] + 1
+    if not chosen and sentences:
+        # Not even one sentence fits: keep the start of the best one
+        return hard_split(sentences[ranked[0]], max(budget, 1), model)[0]
+    chosen.sort()
+    pieces = []
+    for (n, i) in enumerate(chosen):
+        if n > 0 and i != chosen[n - 1] + 1:
+            pieces.append("...")
+        pieces.append(sentences[i])
+    return " ".join(pieces)
+
+
+def pack_context(matches, request, model, budget=None):
+    """
+    Selects and trims matched sections to fit a token budget.
+
+    Parameters
+    ----------
+    matches : list
+        Index matches ({'id', 'score', 'metadata': {'text'}}).
+    request : str
+        The user's request (used to pick the best sentences).
+    model : str
+        The GPT model the prompt is for.
+    budget : int, optional
+        Tokens for the sections, including their headers (default is
+        context_budget(model)).
+
+    Returns
+    -------
+    tuple
+        (sections, stats): the packed sections as dicts with 'id', 'score',
+        'text', 'tokens' and 'trimmed', in score order, and counts of the
+        'packed', 'trimmed', 'duplicate' and 'dropped' sections and the
+        'tokens' used.
+    """
+    if budget is None:
+        budget = context_budget(model)
+    request_terms = terms(request)
+    ranked = sorted(matches, key=lambda m: -m.get('score', 0))
+    best_score = ranked[0].get('score', 0) if ranked else 0
+    seen = set()
+    sections = []
+    stats = {'packed': 0, 'trimmed': 0, 'duplicate': 0, 'dropped': 0, 'tokens': 0}
+    remaining = budget
+
+    for match in ranked:
+        header_tokens = count_tokens(SECTION_HEADER.format(id=match['id']), model)
+        if remaining - header_tokens < MIN_SECTION_TOKENS:
+            stats['dropped'] += 1
+            continue
+        # Drop the sentences already packed from an overlapping section
+        sentences = split_sentences(match['metadata']['text'])
+        new = [s for s in sentences if normalize(s) not in seen]
+        if not new or len(new) < MIN_NEW_FRACTION * len(sentences):
+            stats['duplicate'] += 1
+            continue
+        text = match['metadata']['text'] if len(new) == len(sentences) else " ".join(new)
+        tokens = count_tokens(text, model)
+        available = remaining - header_tokens
+        if match.get('score', 0) < best_score - TAIL_SCORE_MARGIN:
+            available = min(available, TRIMMED_SECTION_TOKENS)
+        trimmed = tokens > available
+        if trimmed:
+            text = best_sentences(new, request_terms, available, model)
+            if not text:
+                stats['dropped'] += 1
+                continue
+            tokens = count_tokens(text, model)
+            new = split_sentences(text)
+        seen.update(normalize(s) for s in new)
+        sections.append({'id': match['id'], 'score': match.get('score'), 'text': text,
+                         'tokens': tokens + header_tokens, 'trimmed': trimmed})
+        remaining -= tokens + header_tokens
+        stats['packed'] += 1
+        stats['trimmed'] += trimmed
+    stats['tokens'] = budget - remaining
+    return (sections, stats)
+
+
+def format_sections(sections):
+    return "".join(SECTION_HEADER.format(id=s['id']) + s['text'] + "\n\n" for s in sections)
@@ -0,0 +1,167 @@
+"""
+embedding_cache.py
+
+This module provides a persistent, content-addressed cache of OpenAI
+embeddings so that re-uploads, repeated searches and notebook re-runs do
+not pay to embed the same text twice.
+"""
+
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from tools.clients import BULK, embedding
+from tools.tracing import tracer
+
+# Vector lengths of the standard OpenAI embedding models (others are measured)
+EMBEDDING_DIMENSIONS = {
+    'text-embedding-ada-002': 1536,
+    'text-embedding-3-small': 1536,
+    'text-embedding-3-large': 3072,
+}
+
+
+def text_hash(text):
+    """
+    Returns the SHA-256 hex digest of a text, used as its cache key.
+    """
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def openai_embeddings(texts, model, priority=BULK):
+    """
+    Embeds a list of texts with the OpenAI embedding endpoint (rate
+    limited and retried, see tools.clients).
+
+    Parameters
+    ----------
+    texts : list
+        The texts to embed.
+    model : str
+        The embedding model (e.g. "text-embedding-ada-002").
+    priority : int, optional
+        Rate limiter queue priority (default is BULK).
+
+    Returns
+    -------
+    list
+        One embedding (list of floats) per text, in order.
+    """
+    res = embedding(texts, model, priority)
+    return [d['embedding'] for d in sorted(res['data'], key=lambda d: d.get('index', 0))]
+
+
+class EmbeddingCache:
+    """
+    A two-tier embedding cache: an in-memory LRU in front of SQLite.
+
+    Embeddings are keyed by (model, SHA-256 of the text) and stored as
+    float32 blobs. get_embeddings() looks up a whole batch at once and
+    only sends the misses to the embedding endpoint.
+
+    Attributes
+    ----------
+    path : str
+        Path to the SQLite file (":memory:" for a process-local cache).
+    lru_size : int
+        Number of embeddings kept in memory.
+    hits, misses : int
+        Lookup counters since the cache was opened.
+
+    Methods
+    -------
+    get_embeddings(texts, model):
+        Returns embeddings for texts, computing and storing the misses.
+    """
+
+    def __init__(self, path="embedding-cache.db", lru_size=10000, embed_fn=openai_embeddings):
+        self.path = path
+        self.lru_size = lru_size
+        self.embed_fn = embed_fn
+        self.hits = 0
+        self.misses = 0
+        self.lru = OrderedDict()
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings "
+            "(model TEXT, hash TEXT, vector BLOB, PRIMARY KEY (model, hash))")
+        self.db.commit()
+
+    def _remember(self, key, vector):
+        self.lru[key] = vector
+        self.lru.move_to_end(key)
+        while len(self.lru) > self.lru_size:
+            self.lru.popitem(last=False)
+
+    def _lookup(self, model, hashes):
+        # Check memory first, then fetch the rest from SQLite in one query
+        found = {}
+        rest = []
+        for h in hashes:
+            if (model, h) in self.lru:
+                self.lru.move_to_end((model, h))
+                found[h] = self.lru[(model, h)]
+            else:
+                rest.append(h)
+        # Stay well under SQLite's bound-parameter limit
+        for i in range(0, len(rest), 500):
+            chunk = rest[i:i + 500]
+            marks = ','.join('?' * len(chunk))
+            rows = self.db.execute(
+                f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({marks})",
+                [model] + chunk)
+            for (h, blob) in rows:
+                vector = np.frombuffer(blob, dtype=np.float32)
+                found[h] = vector
+                self._remember((model, h), vector)
+        return found
+
+    def get_embeddings(self, texts, model, priority=BULK):
+        """
+        Returns the embeddings for texts, embedding only the cache misses.
+
+        Parameters
+        ----------
+        texts : list
+            The texts to embed.
+        model : str
+            The embedding model.
+        priority : int, optional
+            Rate limiter queue priority for the misses (default is BULK).
+
+        Returns
+        -------
+        list
+            One embedding (list of floats) per text, in order.
+        """
+        hashes = [text_hash(t) for t in texts]
+        with self.lock:
+            found = self._lookup(model, set(hashes))
+
+            # Embed each distinct missing text once
+            missing = {}
+            for h, t in zip(hashes, texts):
+                if h not in found and h not in missing:
+                    missing[h] = t
+            misses = sum(1 for h in hashes if h in missing)
+            # Ingest threads share the cache, so count under the lock
+            self.hits += len(texts) - misses
+            self.misses += misses
+        tracer.record_cache('embedding', len(texts) - misses, misses)
+        if missing:
+            vectors = self.embed_fn(list(missing.values()), model, priority=priority)
+            new = [(h, np.asarray(v, dtype=np.float32)) for h, v in zip(missing, vectors)]
+            with self.lock:
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)",
+                    [(model, h, v.tobytes()) for (h, v) in new])
+                self.db.commit()
+                for (h, v) in new:
+                    found[h] = v
+                    self._remember((model, h), v)
+
+        return [found[h].tolist() for h in hashes]
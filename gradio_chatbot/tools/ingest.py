@@ -0,0 +1,127 @@
+"""
+ingest.py
+
+This module embeds and upserts document sections as a streaming pipeline:
+sections are grouped into batches that respect the embedding request
+limits, the batches are embedded concurrently, and the vectors are
+upserted in fixed-size batches as soon as they are ready.
+"""
+
+import contextvars
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from tools.clients import with_retries
+from tools.tokens import count_tokens
+
+
+def token_batches(vectors, model, max_tokens=50000, max_items=256, max_item_tokens=8191):
+    """
+    Groups sections into batches that fit an embedding request.
+
+    Parameters
+    ----------
+    vectors : iterable
+        (id, text, metadata) tuples, read lazily.
+    model : str
+        The embedding model (used to count tokens).
+    max_tokens : int, optional
+        Maximum total tokens in one request (default is 50000).
+    max_items : int, optional
+        Maximum number of texts in one request (default is 256).
+    max_item_tokens : int, optional
+        Maximum tokens in a single text (default is 8191).
+
+    Yields
+    ------
+    list
+        Each batch of (id, text, metadata) tuples.
+    """
+    batch = []
+    batch_tokens = 0
+    for vector in vectors:
+        tokens = count_tokens(vector[1], model)
+        if tokens > max_item_tokens:
+            raise ValueError(f"Section {vector[0]} has {tokens} tokens, over the {max_item_tokens} token limit")
+        if batch and (batch_tokens + tokens > max_tokens or len(batch) >= max_items):
+            yield batch
+            batch = []
+            batch_tokens = 0
+        batch.append(vector)
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
+
+def embed_and_upsert(vectors, embed_fn, index, model, max_workers=4, upsert_batch_size=100,
+                     progress=None, on_upsert=None, **batch_limits):
+    """
+    Embeds sections concurrently and upserts them as batches complete.
+
+    The sections are read lazily and at most 2 * max_workers batches are in
+    flight, so a generator of sections is processed in bounded memory.
+
+    Parameters
+    ----------
+    vectors : iterable
+        (id, text, metadata) tuples (a list or a generator).
+    embed_fn : callable
+        Takes a list of texts and returns their embeddings.
+    index : object
+        The vector index to upsert into.
+    model : str
+        The embedding model (used to size the batches).
+    max_workers : int, optional
+        Maximum concurrent embedding requests (default is 4).
+    upsert_batch_size : int, optional
+        Number of vectors per upsert call (default is 100).
+    progress : callable, optional
+        Called as progress(sections_done, total_sections) after each upsert;
+        total_sections is None when vectors has no length.
+    on_upsert : callable, optional
+        Called with the list of ids of each upserted batch (for checkpoints).
+
+    Returns
+    -------
+    int
+        The number of vectors upserted.
+    """
+    total = len(vectors) if hasattr(vectors, '__len__') else None
+    pending = []
+    done = 0
+
+    def flush(count):
+        nonlocal pending, done
+        while len(pending) >= count and pending:
+            chunk, pending = pending[:upsert_batch_size], pending[upsert_batch_size:]
+            # Remote indexes rate limit and retry their own calls (see RemoteIndex)
+            index.upsert(vectors=chunk)
+            if on_upsert is not None:
+                on_upsert([v[0] for v in chunk])
+            done += len(chunk)
+            if progress is not None:
+                progress(done, total)
+
+    def collect(futures, return_when):
+        finished, running = wait(futures, return_when=return_when)
+        for future in finished:
+            batch = futures.pop(future)
+            for (vector, embedding) in zip(batch, future.result()):
+                pending.append((vector[0], embedding, vector[2]))
+        flush(upsert_batch_size)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        try:
+            for batch in token_batches(vectors, model, **batch_limits):
+                # Run in a copy of the caller's context so the embedding calls join its trace
+                futures[executor.submit(contextvars.copy_context().run, with_retries, embed_fn,
+                                        [v[1] for v in batch])] = batch
+                if len(futures) >= 2 * max_workers:
+                    collect(futures, FIRST_COMPLETED)
+            collect(futures, ALL_COMPLETED)
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+    flush(1)
+    return done
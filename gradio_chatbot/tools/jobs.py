@@ -0,0 +1,244 @@
+"""
+jobs.py
+
+This module runs Library uploads as background ingestion jobs. Jobs are
+kept in a SQLite table (queued, running, done or failed) and processed
+by a pool of worker threads. The ids of upserted sections are recorded
+as each batch completes, so a job interrupted by a crash resumes where
+it stopped instead of starting over, and a job that fails removes the
+sections it upserted from the index.
+"""
+
+import os
+import shutil
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from tools.tracing import tracer
+
+
+class IngestQueue:
+    """
+    A persistent queue of document ingestion jobs with a worker pool.
+
+    Attributes
+    ----------
+    path : str
+        Path to the SQLite file with the job table.
+    upload_dir : str
+        Directory where uploaded files are kept until their job finishes.
+    manager : PineconeManager
+        The document manager that indexes the files.
+
+    Methods
+    -------
+    submit(title, file_path):
+        Queues a file for ingestion and returns the job id.
+    get_job(job_id):
+        Returns a job as a dict, or None.
+    list_jobs(limit=20):
+        Returns the most recent jobs, newest first.
+    start(workers=2):
+        Starts the worker threads (re-queuing jobs left running by a crash).
+    stop():
+        Stops the worker threads after their current job.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            title TEXT,
+            path TEXT,
+            status TEXT,
+            sections_done INTEGER DEFAULT 0,
+            message TEXT,
+            created TEXT,
+            updated TEXT
+        );
+        CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created);
+        CREATE TABLE IF NOT EXISTS job_sections (
+            job TEXT REFERENCES jobs(id) ON DELETE CASCADE,
+            section_id TEXT,
+            PRIMARY KEY (job, section_id)
+        );
+    """
+
+    def __init__(self, manager, path="ingest-jobs.db", upload_dir="uploads"):
+        self.manager = manager
+        self.path = path
+        self.upload_dir = upload_dir
+        os.makedirs(upload_dir, exist_ok=True)
+        db = sqlite3.connect(path, timeout=30)
+        try:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(self.SCHEMA)
+        finally:
+            db.close()
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.workers = []
+
+    @contextmanager
+    def transaction(self):
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            db.execute("PRAGMA foreign_keys=ON")
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+        finally:
+            db.close()
+
+    @contextmanager
+    def reading(self):
+        # Plain reads take no write lock; WAL gives each query a consistent snapshot
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def _set(self, job_id, **fields):
+        fields['updated'] = datetime.now(timezone.utc).isoformat()
+        columns = ', '.join(f"{name} = ?" for name in fields)
+        with self.transaction() as db:
+            db.execute(f"UPDATE jobs SET {columns} WHERE id = ?", list(fields.values()) + [job_id])
+
+    def submit(self, title, file_path):
+        """
+        Queues a file for ingestion.
+
+        The file is moved into upload_dir so it survives until the job is done.
+
+        Raises
+        ------
+        ValueError
+            If a job for the same title is already queued or running.
+        """
+        job_id = uuid.uuid4().hex
+        stored = os.path.join(self.upload_dir, job_id)
+        now = datetime.now(timezone.utc).isoformat()
+        with self.transaction() as db:
+            active = db.execute("SELECT 1 FROM jobs WHERE title = ? AND status IN ('queued', 'running')",
+                                (title,)).fetchone()
+            if active:
+                raise ValueError(f"File {title} is already being ingested.")
+            shutil.move(file_path, stored)
+            db.execute("INSERT INTO jobs (id, title, path, status, message, created, updated) "
+                       "VALUES (?, ?, ?, 'queued', 'Waiting for a worker', ?, ?)",
+                       (job_id, title, stored, now, now))
+        self.wakeup.set()
+        return job_id
+
+    def get_job(self, job_id):
+        with self.reading() as db:
+            row = db.execute("SELECT id, title, status, sections_done, message, created, updated "
+                             "FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('id', 'title', 'status', 'sections_done', 'message', 'created', 'updated'), row))
+
+    def list_jobs(self, limit=20):
+        with self.reading() as db:
+            rows = db.execute("SELECT id, title, status, sections_done, message, created, updated "
+                              "FROM jobs ORDER BY created DESC LIMIT ?", (limit,)).fetchall()
+        return [dict(zip(('id', 'title', 'status', 'sections_done', 'message', 'created', 'updated'), row))
+                for row in rows]
+
+    def _claim(self):
+        # Atomically take the oldest queued job
+        with self.transaction() as db:
+            row = db.execute("SELECT id, title, path FROM jobs WHERE status = 'queued' "
+                             "ORDER BY created LIMIT 1").fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE jobs SET status = 'running', message = 'Indexing', updated = ? WHERE id = ?",
+                       (datetime.now(timezone.utc).isoformat(), row[0]))
+        return row
+
+    def _checkpoint(self, job_id, ids):
+        with self.transaction() as db:
+            db.executemany("INSERT OR IGNORE INTO job_sections VALUES (?, ?)", [(job_id, id) for id in ids])
+            db.execute("UPDATE jobs SET sections_done = (SELECT COUNT(*) FROM job_sections WHERE job = ?), "
+                       "updated = ? WHERE id = ?",
+                       (job_id, datetime.now(timezone.utc).isoformat(), job_id))
+
+    def run_job(self, job_id, title, path):
+        """
+        Ingests one claimed job, skipping sections a previous run upserted.
+        """
+        with self.reading() as db:
+            skip_ids = {id for (id,) in db.execute(
+                "SELECT section_id FROM job_sections WHERE job = ?", (job_id,))}
+        try:
+            with tracer.span("ingest.job", title=title, resumed_sections=len(skip_ids)), open(path, 'r') as file:
+                if self.manager.has_document(title):
+                    changes = self.manager.update_document(
+                        title, file, skip_ids=skip_ids, on_upsert=lambda ids: self._checkpoint(job_id, ids))
+                    message = (f"Updated: {changes['added']} sections added, "
+                               f"{changes['removed']} removed, {changes['unchanged']} unchanged.")
+                else:
+                    num_sections = self.manager.add_document(
+                        title, file, skip_ids=skip_ids, on_upsert=lambda ids: self._checkpoint(job_id, ids))
+                    message = f"Added, split into {num_sections} sections."
+        except Exception as e:
+            tracer.record_exception(e)
+            message = f"We received an error: {str(e)}"
+            try:
+                self._discard_sections(job_id)
+            except Exception as cleanup_error:
+                tracer.record_exception(cleanup_error)
+                message += f" (its indexed sections could not be removed: {str(cleanup_error)})"
+            self._finish(job_id, path, status='failed', message=message)
+            return
+        self._finish(job_id, path, status='done', message=message)
+
+    def _discard_sections(self, job_id):
+        # The sections a failed job upserted are in the index but not in the
+        # catalog (a new document was never recorded, and an update's new
+        # sections always get fresh ids), so nothing would ever delete them
+        with self.reading() as db:
+            ids = [id for (id,) in db.execute("SELECT section_id FROM job_sections WHERE job = ?", (job_id,))]
+        self.manager.delete_sections(ids)
+
+    def _finish(self, job_id, path, **fields):
+        # Failed jobs are not retried (the file is uploaded again), so done or
+        # failed, the job's checkpoints and its copy of the upload are removed
+        self._set(job_id, **fields)
+        with self.transaction() as db:
+            db.execute("DELETE FROM job_sections WHERE job = ?", (job_id,))
+        if os.path.exists(path):
+            os.remove(path)
+
+    def _work(self):
+        while not self.stopping.is_set():
+            job = self._claim()
+            if job is None:
+                self.wakeup.wait(timeout=1.0)
+                self.wakeup.clear()
+                continue
+            self.run_job(*job)
+
+    def start(self, workers=2):
+        # Jobs left running by a crashed process resume from their checkpoints
+        with self.transaction() as db:
+            db.execute("UPDATE jobs SET status = 'queued', message = 'Resuming' WHERE status = 'running'")
+        self.stopping.clear()
+        for _ in range(workers):
+            worker = threading.Thread(target=self._work, daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def stop(self):
+        self.stopping.set()
+        self.wakeup.set()
+        for worker in self.workers:
+            worker.join()
+        self.workers = []
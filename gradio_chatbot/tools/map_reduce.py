@@ -0,0 +1,160 @@
+"""
+map_reduce.py
+
+This module answers a request over a document too large for one prompt.
+Every section is sent to the model concurrently (the map), and the
+partial answers are combined in a tree of prompts that each fit the
+model's context window (the reduce). The request rate is left to the
+complete function (ChatGPT.complete goes through the shared limiter in
+tools.clients).
+"""
+
+import asyncio
+
+from tools.tokens import context_window, count_tokens
+
+MAP_PROMPT = (
+    "This is section {n} of {total} of a document\n\n---\n\n{section}\n\n---\n\n"
+    "Because the full document will not fit into the chat history size, please "
+    "extract everything in this section that helps answer the request below, "
+    "with details (such as quotes and summary information) that can later be "
+    "combined with the findings from the other sections. "
+    "If this section has nothing relevant, state 'Nothing relevant in this section.'\n\n "
+    "Request: {request}"
+)
+
+COMBINE_PROMPT = (
+    "The following are findings extracted from several sections of a document "
+    "for the request below\n\n---\n\n{findings}\n\n---\n\n"
+    "Combine these findings into one set of findings for the request, keeping the "
+    "details (such as quotes and summary information) and ignoring sections with "
+    "nothing relevant.\n\n "
+    "Request: {request}"
+)
+
+ANSWER_PROMPT = (
+    "The following are findings extracted from all sections of a document "
+    "for the request below\n\n---\n\n{findings}\n\n---\n\n"
+    "Answer the request based upon the above findings. "
+    "If the answer is not clear from the document, state 'I cannot answer "
+    "based upon the document provided.'\n\n "
+    "Request: {request}"
+)
+
+SINGLE_SECTION_PROMPT = (
+    "The following is a document to be used for a request below\n\n---\n\n{section}\n\n---\n\n"
+    "Answer the request based upon the above document section. "
+    "If the answer is not clear from the document, state 'I cannot answer "
+    "based upon the document provided.'\n\n "
+    "Request: {request}"
+)
+
+
+async def run_bounded(prompts, complete, max_concurrency):
+    """
+    Runs complete(prompt) for every prompt with bounded concurrency.
+
+    Yields
+    ------
+    tuple
+        (index, response) as each request finishes.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run(i, prompt):
+        async with semaphore:
+            return (i, await complete(prompt))
+
+    tasks = [asyncio.ensure_future(run(i, p)) for i, p in enumerate(prompts)]
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield await task
+    finally:
+        # Cancel whatever is still running if the caller stops early
+        for task in tasks:
+            task.cancel()
+
+
+def pack_groups(texts, budget, model):
+    """
+    Packs texts, in order, into groups whose total tokens fit the budget.
+    """
+    groups = []
+    group = []
+    tokens = 0
+    for text in texts:
+        size = count_tokens(text, model)
+        if group and tokens + size > budget:
+            groups.append(group)
+            group = []
+            tokens = 0
+        group.append(text)
+        tokens += size
+    if group:
+        groups.append(group)
+    return groups
+
+
+def join_findings(findings):
+    return "\n\n---\n\n".join(findings)
+
+
+async def map_reduce(sections, request, complete, model, max_concurrency=4, reserve_tokens=1024):
+    """
+    Maps a request over document sections and reduces the answers.
+
+    Parameters
+    ----------
+    sections : list
+        The document sections.
+    request : str
+        The user's request.
+    complete : coroutine function
+        Takes a prompt and returns the model's response text.
+    model : str
+        The GPT model (used to size the reduce prompts).
+    max_concurrency : int, optional
+        Maximum requests in flight (default is 4).
+    reserve_tokens : int, optional
+        Tokens left for each completion (default is 1024).
+
+    Yields
+    ------
+    dict
+        Progress updates: {'stage': 'map', 'done', 'total', 'section', 'response'}
+        for each section and {'stage': 'reduce', 'level', 'groups'} for each
+        reduce level. The last update is {'stage': 'answer', 'prompt'},
+        the prompt for the final answer (left to the caller so it can be
+        streamed).
+    """
+    if len(sections) == 1:
+        yield {'stage': 'answer', 'prompt': SINGLE_SECTION_PROMPT.format(section=sections[0], request=request)}
+        return
+    # Map: extract findings from every section concurrently
+    prompts = [MAP_PROMPT.format(n=n + 1, total=len(sections), section=section, request=request)
+               for n, section in enumerate(sections)]
+    findings = [None] * len(sections)
+    done = 0
+    async for (i, response) in run_bounded(prompts, complete, max_concurrency):
+        findings[i] = response
+        done += 1
+        yield {'stage': 'map', 'done': done, 'total': len(sections), 'section': i, 'response': response}
+
+    # Reduce: combine groups of findings until they fit in a single answer prompt
+    overhead = count_tokens(COMBINE_PROMPT.format(findings="", request=request), model)
+    budget = context_window(model) - reserve_tokens - overhead
+    level = 0
+    while count_tokens(join_findings(findings), model) > budget:
+        groups = pack_groups(findings, budget, model)
+        if len(groups) == len(findings):
+            raise ValueError("The section findings are too long to combine for this model.")
+        level += 1
+        yield {'stage': 'reduce', 'level': level, 'groups': len(groups)}
+        prompts = [COMBINE_PROMPT.format(findings=join_findings(group), request=request)
+                   for group in groups]
+        combined = [None] * len(groups)
+        async for (i, response) in run_bounded(prompts, complete, max_concurrency):
+            combined[i] = response
+        findings = combined
+
+    yield {'stage': 'answer', 'prompt': ANSWER_PROMPT.format(findings=join_findings(findings), request=request)}
@@ -1,125 +1,234 @@
 # tools/pinecone.py
 
+import io
 import os
 import json
-import pinecone
-import openai
+import threading
+
+from tools.catalog import DocumentCatalog
+from tools.clients import BULK, CHAT
+from tools.embedding_cache import EMBEDDING_DIMENSIONS, EmbeddingCache, text_hash
+from tools.ingest import embed_and_upsert
+from tools.splitter import HashingReader, split_sections
+from tools.tracing import traced, tracer
+from tools.vector_index import open_index
 
 class PineconeManager:
-    def __init__(self, index_name="chatbot-library", api_key=None, environment=None):
+    # Ids per fetch/delete call (pinecone accepts up to 1000 per delete)
+    FETCH_BATCH_SIZE = 100
+    DELETE_BATCH_SIZE = 1000
+    # Maximum tokens per document section
+    SECTION_TOKENS = 2000
+    # Tokens after which a section ends at the next content-chosen boundary
+    SECTION_MIN_TOKENS = 1000
+
+    def __init__(self, index_name="chatbot-library", api_key=None, environment=None, backend=None):
         self.api_key = api_key or os.getenv("PINECONE_API_KEY")
         self.environment = environment or os.getenv("PINECONE_ENVIRONMENT")
+        self.backend = backend or os.getenv("CHATBOT_INDEX_BACKEND", "pinecone")
         self.index_name = index_name
+        self.catalog_file_name = f"{self.index_name}-catalog.db"
+        # Document lists from before the catalog (imported on startup)
         self.file_name = f"{self.index_name}.json"
+        self.manifest_file_name = f"{self.index_name}-sections.json"
 
-        # Configure pinecone
-        pinecone.init(api_key=self.api_key, environment=self.environment)
-        print(pinecone.whoami())
-        print(pinecone.list_indexes())
-
-        # Initialize openai embedding
+        # Initialize openai embedding (cached on disk by model and text hash)
         self.embedding_model = "text-embedding-ada-002"
-
-        # Check if the index exists and create it if it doesn't
-        if self.index_name not in pinecone.list_indexes():
-            print("NOTE: Creating pinecone index. This will take 30-60 seconds.")
-            res = openai.Embedding.create(
-                input=["This is sample test that will determine the length"],
-                engine=self.embedding_model
-            )
-            
-            embedding_length = len(res['data'][0]['embedding'])
-            pinecone.create_index(
-                self.index_name,
-                dimension=embedding_length,
-                metric='cosine',
-                metadata_config={'indexed': ['title']})
-
-        # Create the index instance for later operations
-        self.index_instance = pinecone.Index(index_name=self.index_name)
-
-        # Try loading the local file with the list of added documents
+        self.embedding_cache = EmbeddingCache(os.getenv("CHATBOT_EMBEDDING_CACHE", "embedding-cache.db"))
+
+        # Open the document catalog, importing the older JSON files on first use
+        self.catalog = DocumentCatalog(self.catalog_file_name)
+        if os.path.exists(self.file_name):
+            self.import_json_documents()
+
+        # The vector index (hosted pinecone or a local memory-mapped index) is
+        # opened on first use, with the settings cached by earlier runs, so
+        # starting up makes no network calls
+        self.config = self.catalog.get_setting('index_config') or {}
+        self._index_instance = None
+        self.index_lock = threading.Lock()
+
+    @property
+    def index_instance(self):
+        if self._index_instance is None:
+            with self.index_lock:
+                if self._index_instance is None:
+                    self._index_instance = open_index(
+                        self.backend, self.index_name,
+                        api_key=self.api_key, environment=self.environment,
+                        dimension_fn=self.get_embedding_dimension,
+                        config=self.config, save_config=self.save_config)
+        return self._index_instance
+
+    def save_config(self, config):
+        self.catalog.set_setting('index_config', config)
+
+    def get_embedding_dimension(self):
+        # Use the cached or known vector length of the model, otherwise embed a sample
+        if self.config.get('embedding_model') == self.embedding_model and self.config.get('dimension'):
+            return self.config['dimension']
+        dimension = EMBEDDING_DIMENSIONS.get(self.embedding_model)
+        if dimension is None:
+            dimension = len(self.get_embeddings(["This is sample test that will determine the length"])[0])
+        self.config.update(embedding_model=self.embedding_model, dimension=dimension)
+        self.save_config(self.config)
+        return dimension
+
+    def get_embeddings(self, texts, priority=BULK):
+        # Only the texts not already in the cache are sent to openai
+        return self.embedding_cache.get_embeddings(texts, self.embedding_model, priority)
+
+    def import_json_documents(self):
+        with open(self.file_name, "r") as file:
+            documents = json.load(file)
         try:
-            with open(self.file_name, "r") as file:
-                self.documents = json.load(file)
+            with open(self.manifest_file_name, "r") as file:
+                manifest = json.load(file)
         except FileNotFoundError:
-            self.documents = []
+            manifest = {}
+        self.catalog.import_json(documents, manifest)
+        os.replace(self.file_name, self.file_name + ".imported")
+        if os.path.exists(self.manifest_file_name):
+            os.replace(self.manifest_file_name, self.manifest_file_name + ".imported")
 
     def get_document_list(self):
-        return self.documents
-
-
-    def add_document(self, title, text):
-        # Get the embedding for the text
-        # Split the text by newline
-        lines = text.split('\n')
-    
-        # Insert each section into Pinecone with the appropriate ID and metadata
-        sections = []
-        section = []
-        count = 0
-        for line in lines:
-            line_word_count = len(line.split())
-            if count + line_word_count > 1500:
-                # Store entry and start new section
-                sections.append('\n'.join(section))
-                section = [line]
-                count = line_word_count
-            else:
-                # Add line to current section
-                section.append(line)
-                count += line_word_count
-        # Store last entry
-        sections.append('\n'.join(section))
-
-        # Calculate the embeddings
-        embeddings = openai.Embedding.create(input=sections, engine=self.embedding_model)
-
-        # Zip up the embeddings and insert
-        to_upsert = [(title+'-'+str(i), embeddings['data'][i]['embedding'],
-                      {'document':title, 'text':sections[i]}) 
-                     for i in range(len(sections)) ]
-        self.index_instance.upsert(vectors=to_upsert)
-
-        # Add the document to the local list and save it
-        self.documents.append(title)
-        self.documents.sort()
-        self.save_documents()
-        
-        # Return the number of sections added
-        return len(sections)
+        return self.catalog.list_documents()
+
+    def has_document(self, title):
+        return self.catalog.has_document(title)
+
+
+    def split_text(self, text):
+        # Split the text (a string or a text stream, read incrementally) into
+        # sections of at most SECTION_TOKENS tokens. Sections end at boundaries
+        # chosen by content, so an edit leaves the later sections (and their
+        # embeddings) unchanged
+        return split_sections(text, max_tokens=self.SECTION_TOKENS, model=self.embedding_model,
+                              min_tokens=self.SECTION_MIN_TOKENS)
+
+    @traced("library.add_document")
+    def add_document(self, title, text, progress=None, skip_ids=(), on_upsert=None):
+        # Insert each section into Pinecone with the appropriate ID and metadata,
+        # reading the sections lazily so large files are ingested in bounded memory.
+        # Sections in skip_ids were upserted by an earlier, interrupted run.
+        reader = HashingReader(io.StringIO(text) if isinstance(text, str) else text)
+        ids = []
+        hashes = []
+
+        def sections():
+            for i, section in enumerate(self.split_text(reader)):
+                ids.append(title+'-'+str(i))
+                hashes.append(text_hash(section))
+                if ids[-1] not in skip_ids:
+                    yield (ids[-1], section, {'document':title, 'text':section})
+
+        # Embed the sections in concurrent batches and upsert them as they complete
+        embed_and_upsert(sections(), self.get_embeddings, self.index_instance,
+                         self.embedding_model, progress=progress, on_upsert=on_upsert)
+
+        # Record the document and its sections in the catalog
+        self.catalog.add_document(title, reader.hexdigest(), ids, hashes, self.embedding_model)
 
+        # Return the number of sections added
+        return len(ids)
+
+    @traced("library.update_document")
+    def update_document(self, title, text, progress=None, skip_ids=(), on_upsert=None):
+        # Re-split the text and match the sections to the stored ones by content hash
+        document = self.catalog.get_document(title)
+        if document is None:
+            raise ValueError(f"Document '{title}' does not exist.")
+        if document['section_count'] is None:
+            stored = [(id, None) for id in self.find_section_ids(title)]
+        else:
+            stored = self.catalog.get_sections(title)
+        unused = {}
+        for (id, h) in stored:
+            if h is not None:
+                unused.setdefault(h, []).append(id)
+        used_ids = {id for (id, _) in stored}
+        reader = HashingReader(io.StringIO(text) if isinstance(text, str) else text)
+        ids = []
+        hashes = []
+        added = []
+
+        # Unchanged sections keep their ids, new or changed sections get fresh ones
+        def changed_sections():
+            for i, section in enumerate(self.split_text(reader)):
+                h = text_hash(section)
+                hashes.append(h)
+                if unused.get(h):
+                    ids.append(unused[h].pop(0))
+                    continue
+                id = title+'-'+h[:12]
+                if id in used_ids:
+                    id += '-'+str(i)
+                used_ids.add(id)
+                ids.append(id)
+                added.append(id)
+                if id not in skip_ids:
+                    yield (id, section, {'document':title, 'text':section})
+
+        # Embed and upsert the new sections, then delete the ones that disappeared
+        embed_and_upsert(changed_sections(), self.get_embeddings, self.index_instance,
+                         self.embedding_model, progress=progress, on_upsert=on_upsert)
+        kept = set(ids)
+        to_delete = [id for (id, _) in stored if id not in kept]
+        self.delete_sections(to_delete)
+        self.catalog.update_document(title, reader.hexdigest(), ids, hashes, self.embedding_model)
+
+        # Return the number of sections added, removed and unchanged
+        return {'added': len(added), 'removed': len(to_delete),
+                'unchanged': len(ids) - len(added)}
+
+    def delete_sections(self, ids):
+        # Delete sections from the index in batched calls (the catalog is not changed)
+        ids = list(ids)
+        for i in range(0, len(ids), self.DELETE_BATCH_SIZE):
+            self.index_instance.delete(ids=ids[i:i + self.DELETE_BATCH_SIZE])
+
+    @traced("library.remove_document")
     def remove_document(self, title):
-        # Loop through sections, deleting while found
-        i = 0
-        while True:
-            id = title+'-'+str(i)
-            fetch = self.index_instance.fetch(ids=[id])
-            if fetch.vectors:
-                self.index_instance.delete(ids=[id])
-                i += 1
-            else:
-                break
-        
-        # Remove the document from the local list and save it
-        self.documents = [doc for doc in self.documents if doc != title]
-        self.save_documents()
+        # Delete the recorded section ids in batched calls
+        document = self.catalog.get_document(title)
+        if document is not None and document['section_count'] is not None:
+            ids = [id for (id, _) in self.catalog.get_sections(title)]
+        else:
+            ids = self.find_section_ids(title)
+        self.delete_sections(ids)
+
+        # Remove the document from the catalog
+        self.catalog.remove_document(title)
 
         # Return the number of sections removed
-        return i
-        
-    def save_documents(self):
-        # Save the list of documents to a local file
-        with open(self.file_name, "w") as file:
-            json.dump(self.documents, file)
-
-    def query_index(self, query_text, top_n=5):
-        # Get the embedding for the query text
-        vector = openai.Embedding.create(input=[query_text], engine=self.embedding_model)
-
-        # Query the pinecone index
-        result = self.index_instance.query(vector['data'][0]['embedding'], top_k=top_n,
-                                           include_metadata=True)
+        return len(ids)
+
+    def find_section_ids(self, title):
+        # Documents added before manifests were recorded: probe the ids in
+        # batches until a whole batch comes back empty
+        ids = []
+        start = 0
+        while True:
+            probe = [title+'-'+str(i) for i in range(start, start + self.FETCH_BATCH_SIZE)]
+            fetch = self.index_instance.fetch(ids=probe)
+            found = [id for id in probe if id in fetch['vectors']]
+            if not found:
+                return ids
+            ids.extend(found)
+            start += self.FETCH_BATCH_SIZE
+
+    @traced("library.query_index")
+    def query_index(self, query_text, top_n=5, document=None):
+        # Get the embedding for the query text (ahead of any bulk ingestion)
+        with tracer.span("library.query_index.embed"):
+            vector = self.get_embeddings([query_text], priority=CHAT)[0]
+
+        # Query the index, optionally restricted to a single document
+        filter = {'document': {'$eq': document}} if document else None
+        with tracer.span("library.query_index.search", top_k=int(top_n)) as span:
+            result = self.index_instance.query(vector, top_k=int(top_n),
+                                               filter=filter, include_metadata=True)
+            span.set(matches=len(result['matches']))
 
         # Return the top n results
         return result
@@ -0,0 +1,231 @@
+"""
+splitter.py
+
+This module splits text into sections of a bounded number of tokens. It
+reads files and streams incrementally, so a large document (or one long
+line) is never held in memory at once, and lines longer than a section are
+split on token boundaries rather than becoming one oversized section.
+"""
+
+import hashlib
+import io
+import re
+import zlib
+
+from tools.tokens import count_tokens, get_encoding
+
+DEFAULT_MAX_TOKENS = 2000
+DEFAULT_MODEL = "text-embedding-ada-002"
+# Lines are tokenized in parts of at most this many characters per token of
+# the section limit (a token is rarely more than a few characters)
+PART_CHARS_PER_TOKEN = 16
+# With min_tokens, about one in this many lines (chosen by content) may end a section
+BOUNDARY_LINES = 8
+# Blank lines and markdown headings always may
+BOUNDARY_START = re.compile(r"\s*$|#+ ")
+
+
+class HashingReader:
+    """
+    Wraps a text stream and computes the SHA-256 of everything read.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.sha256 = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.sha256.update(data.encode('utf-8'))
+        return data
+
+    def hexdigest(self):
+        return self.sha256.hexdigest()
+
+
+def iter_parts(stream, separator="\n", chunk_size=1 << 20, max_chars=None):
+    """
+    Yields the pieces of a text stream between separators as (part, complete)
+    pairs, in parts of at most max_chars characters.
+
+    Only the newly read text is searched for separators, and a piece longer
+    than max_chars is yielded in parts as it is read (complete is False for
+    all but its last part), so an unbroken line is never held whole.
+
+    Parameters
+    ----------
+    stream : file
+        A text stream with a read(size) method.
+    separator : str, optional
+        The piece separator (default is a newline).
+    chunk_size : int, optional
+        Characters read at a time (default is 1M).
+    max_chars : int, optional
+        Most characters per part (default is no limit).
+    """
+    buffer = ""
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        # The buffer has no separator, except perhaps one starting in its last characters
+        start = max(len(buffer) - len(separator) + 1, 0)
+        buffer += chunk
+        position = 0
+        while True:
+            end = buffer.find(separator, start)
+            if end < 0:
+                break
+            yield (buffer[position:end], True)
+            position = start = end + len(separator)
+        buffer = buffer[position:]
+        # Keep enough of the end to find a separator cut off by the read
+        while max_chars and len(buffer) >= max_chars + len(separator):
+            yield (buffer[:max_chars], False)
+            buffer = buffer[max_chars:]
+    yield (buffer, True)
+
+
+def iter_pieces(stream, separator="\n", chunk_size=1 << 20):
+    """
+    Yields the pieces of a text stream between separators.
+
+    Parameters
+    ----------
+    stream : file
+        A text stream with a read(size) method.
+    separator : str, optional
+        The piece separator (default is a newline).
+    chunk_size : int, optional
+        Characters read at a time (default is 1M).
+    """
+    for (piece, _) in iter_parts(stream, separator, chunk_size):
+        yield piece
+
+
+def hard_split(piece, max_tokens, model=DEFAULT_MODEL):
+    """
+    Splits a piece that is longer than max_tokens on token boundaries.
+    """
+    encoding = get_encoding(model)
+    if encoding is None:
+        # Without a tokenizer, split on characters at the estimated 4 per token
+        step = max_tokens * 4
+        return [piece[i:i + step] for i in range(0, len(piece), step)]
+    tokens = encoding.encode(piece, disallowed_special=())
+    # Cut the text where tokens start (a token inside a multi-byte character
+    # starts at that character), so no character is ever cut in two
+    (_, offsets) = encoding.decode_with_offsets(tokens)
+    offsets.append(len(piece))
+    pieces = []
+    start = 0
+    while start < len(tokens):
+        end = min(start + max_tokens, len(tokens))
+        text = piece[offsets[start]:offsets[end]]
+        # A character moved to this piece can cost a token more
+        while end > start + 1 and len(encoding.encode(text, disallowed_special=())) > max_tokens:
+            end -= 1
+            text = piece[offsets[start]:offsets[end]]
+        if text:
+            pieces.append(text)
+        start = end
+    return pieces
+
+
+def is_boundary(piece):
+    # Whether a section may end before this piece, decided by its text alone
+    return bool(BOUNDARY_START.match(piece)) or zlib.crc32(piece.encode('utf-8')) % BOUNDARY_LINES == 0
+
+
+def split_sections(source, max_tokens=DEFAULT_MAX_TOKENS, overlap_tokens=0,
+                   separator="\n", model=DEFAULT_MODEL, min_tokens=None):
+    """
+    Splits text into sections of at most max_tokens tokens.
+
+    Pieces (lines, by default) are accumulated until the next one would
+    exceed max_tokens. A piece longer than max_tokens is split on token
+    boundaries. With overlap_tokens, each section starts with the last
+    pieces of the previous one, up to that many tokens.
+
+    With min_tokens, a section of at least min_tokens tokens also ends
+    before the next blank line, heading or content-chosen line (see
+    is_boundary). The boundaries then depend on the nearby text rather than
+    on everything before it, so an edit only changes the sections around it.
+
+    Parameters
+    ----------
+    source : str or file
+        The text, or a text stream to read incrementally.
+    max_tokens : int, optional
+        Maximum tokens per section (default is 2000).
+    overlap_tokens : int, optional
+        Tokens repeated from the end of the previous section (default is 0).
+    separator : str, optional
+        The separator between pieces, kept when joining (default is a newline).
+    model : str, optional
+        The model whose tokenizer counts the tokens.
+    min_tokens : int, optional
+        Tokens after which a section ends at the next boundary (default is
+        to fill each section up to max_tokens).
+
+    Yields
+    ------
+    str
+        Each section.
+    """
+    if overlap_tokens >= max_tokens:
+        raise ValueError("overlap_tokens must be smaller than max_tokens")
+    if isinstance(source, str):
+        source = io.StringIO(source)
+    # Each piece is charged for the separator that joins it to the next
+    separator_tokens = count_tokens(separator, model)
+    limit = max_tokens - separator_tokens
+
+    section = []
+    sizes = []
+    count = 0
+    carry = ""
+    for (text, complete) in iter_parts(source, separator, max_chars=limit * PART_CHARS_PER_TOKEN):
+        # The end of an unfinished line is tokenized again with its next part
+        piece = carry + text
+        carry = ""
+        size = count_tokens(piece, model)
+        parts = [(piece, size)] if size <= limit else \
+            [(p, count_tokens(p, model)) for p in hard_split(piece, limit, model)]
+        if not complete:
+            (carry, _) = parts.pop()
+        for (part, size) in parts:
+            size += separator_tokens
+            if section and (count + size > max_tokens
+                            or (min_tokens and count >= min_tokens and is_boundary(part))):
+                # Store entry and start new section (with the overlap carried over)
+                yield separator.join(section)
+                keep = 0
+                count = 0
+                while (keep < len(section) and count + sizes[-1 - keep] <= overlap_tokens
+                       and count + sizes[-1 - keep] + size <= max_tokens):
+                    count += sizes[-1 - keep]
+                    keep += 1
+                section = section[len(section) - keep:]
+                sizes = sizes[len(sizes) - keep:]
+            # Add piece to current section
+            section.append(part)
+            sizes.append(size)
+            count += size
+    # Store last entry
+    yield separator.join(section)
+
+
+def split_text(text, **kwargs):
+    """
+    Returns the list of sections of a text (see split_sections).
+    """
+    return list(split_sections(text, **kwargs))
+
+
+def split_file(path, encoding="utf-8", **kwargs):
+    """
+    Yields the sections of a text file, reading it incrementally.
+    """
+    with open(path, "r", encoding=encoding) as file:
+        yield from split_sections(file, **kwargs)
@@ -0,0 +1,203 @@
+"""
+standins.py
+
+This module provides local stand-ins for the OpenAI chat and embedding
+endpoints and for a Pinecone index, with configurable latency and error
+injection, so the chatbot can be exercised and benchmarked offline and
+without spending API quota.
+"""
+
+import asyncio
+import hashlib
+import random
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+import openai
+
+
+class FaultInjector:
+    """
+    Simulated latency and failures shared by the stand-ins.
+
+    Failures are raised as the openai error types, or as pinecone
+    ApiExceptions for "pinecone." endpoints, which the shared clients retry
+    with backoff (see tools.clients).
+
+    Attributes
+    ----------
+    latency : float
+        Seconds each call takes before it responds.
+    jitter : float
+        Extra random latency, up to this fraction of latency.
+    error_rate : float
+        Fraction of calls failing with a 503 (ServiceUnavailableError).
+    rate_limit_rate : float
+        Fraction of calls failing with a 429 (RateLimitError).
+    calls : Counter
+        Number of calls per endpoint, including failed ones.
+    errors : Counter
+        Number of injected failures per endpoint.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.2, error_rate=0.0, rate_limit_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = Counter()
+        self.errors = Counter()
+
+    def _start(self, endpoint):
+        # Counts the call, raises an injected failure, or returns the delay to simulate
+        with self.lock:
+            self.calls[endpoint] += 1
+            roll = self.random.random()
+            delay = self.latency * (1 + self.jitter * self.random.random())
+        if roll < self.rate_limit_rate:
+            with self.lock:
+                self.errors[endpoint] += 1
+            raise self._error(endpoint, 429, f"Injected 429 from {endpoint}")
+        if roll < self.rate_limit_rate + self.error_rate:
+            with self.lock:
+                self.errors[endpoint] += 1
+            raise self._error(endpoint, 503, f"Injected 503 from {endpoint}")
+        return delay
+
+    @staticmethod
+    def _error(endpoint, status, message):
+        if endpoint.startswith("pinecone."):
+            from pinecone.core.client.exceptions import ApiException
+
+            return ApiException(status=status, reason=message)
+        if status == 429:
+            return openai.error.RateLimitError(message)
+        return openai.error.ServiceUnavailableError(message)
+
+    def call(self, endpoint):
+        time.sleep(self._start(endpoint))
+
+    async def acall(self, endpoint):
+        await asyncio.sleep(self._start(endpoint))
+
+    def reset(self):
+        with self.lock:
+            self.calls.clear()
+            self.errors.clear()
+
+
+def fake_embedding(text, dimension):
+    # A deterministic unit vector per text (identical texts embed identically)
+    seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'little')
+    vector = np.random.default_rng(seed).standard_normal(dimension).astype(np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+class FakeOpenAI:
+    """
+    Replaces openai.ChatCompletion and openai.Embedding with local stand-ins.
+
+    Chat completions echo the start of the last message; streamed responses
+    arrive one word at a time at tokens_per_second. Use as a context manager
+    (or call install() and uninstall()).
+
+    Attributes
+    ----------
+    faults : FaultInjector
+        Latency and error injection (counted per endpoint: "chat", "embedding").
+    tokens_per_second : float
+        Streaming speed of chat responses (0 for no delay).
+    response_words : int
+        Number of words in each chat response.
+    dimension : int
+        Length of the embedding vectors.
+    """
+
+    def __init__(self, faults=None, tokens_per_second=0, response_words=50, dimension=1536):
+        self.faults = faults or FaultInjector()
+        self.tokens_per_second = tokens_per_second
+        self.response_words = response_words
+        self.dimension = dimension
+        self.saved = None
+
+    def _response_words(self, messages):
+        words = messages[-1]['content'].split()[:self.response_words]
+        words += ["ok"] * (self.response_words - len(words))
+        return words
+
+    def create(self, model, messages, **params):
+        self.faults.call("chat")
+        text = " ".join(self._response_words(messages))
+        return {'choices': [{'message': {'role': 'assistant', 'content': text}}]}
+
+    async def acreate(self, model, messages, stream=False, **params):
+        await self.faults.acall("chat")
+        words = self._response_words(messages)
+        if not stream:
+            return {'choices': [{'message': {'role': 'assistant', 'content': " ".join(words)}}]}
+
+        async def chunks():
+            for (i, word) in enumerate(words):
+                if self.tokens_per_second:
+                    await asyncio.sleep(1 / self.tokens_per_second)
+                yield {'choices': [{'delta': {'content': word if i == 0 else " " + word}}]}
+        return chunks()
+
+    def embed(self, input, engine, **params):
+        self.faults.call("embedding")
+        return {'data': [{'index': i, 'embedding': fake_embedding(text, self.dimension)}
+                         for (i, text) in enumerate(input)]}
+
+    def install(self):
+        replacements = [(openai.ChatCompletion, 'create', self.create),
+                        (openai.ChatCompletion, 'acreate', self.acreate),
+                        (openai.Embedding, 'create', self.embed)]
+        # Keep the original class attributes (classmethods) to put them back
+        self.saved = [(cls, name, cls.__dict__.get(name)) for (cls, name, _) in replacements]
+        for (cls, name, replacement) in replacements:
+            setattr(cls, name, replacement)
+        return self
+
+    def uninstall(self):
+        for (cls, name, original) in self.saved:
+            if original is None:
+                delattr(cls, name)
+            else:
+                setattr(cls, name, original)
+
+    def __enter__(self):
+        return self.install()
+
+    def __exit__(self, *exc):
+        self.uninstall()
+
+
+class FakePineconeIndex:
+    """
+    Wraps a vector index (e.g. a LocalIndex) to behave like a remote Pinecone
+    index: every call goes through a FaultInjector, counted as "pinecone.<method>".
+    """
+
+    def __init__(self, index, faults=None):
+        self.index = index
+        self.faults = faults or FaultInjector()
+
+    def query(self, *args, **kwargs):
+        self.faults.call("pinecone.query")
+        return self.index.query(*args, **kwargs)
+
+    def fetch(self, *args, **kwargs):
+        self.faults.call("pinecone.fetch")
+        return self.index.fetch(*args, **kwargs)
+
+    def upsert(self, *args, **kwargs):
+        self.faults.call("pinecone.upsert")
+        return self.index.upsert(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        self.faults.call("pinecone.delete")
+        return self.index.delete(*args, **kwargs)
@@ -0,0 +1,49 @@
+import threading
+import pytest
+from tools.catalog import DocumentCatalog
+
+
+def test_add_list_and_remove(tmp_path):
+    catalog = DocumentCatalog(str(tmp_path / "catalog.db"))
+    catalog.add_document("b.txt", "hb", ["b.txt-0"], ["s0"], "model")
+    catalog.add_document("a.txt", "ha", ["a.txt-0", "a.txt-1"], ["s0", "s1"], "model")
+
+    assert catalog.list_documents() == ["a.txt", "b.txt"]
+    assert catalog.has_document("a.txt") and not catalog.has_document("c.txt")
+    assert catalog.get_document("a.txt")['section_count'] == 2
+    assert catalog.get_sections("a.txt") == [("a.txt-0", "s0"), ("a.txt-1", "s1")]
+    with pytest.raises(ValueError):
+        catalog.add_document("a.txt", "ha", [], [], "model")
+
+    catalog.remove_document("a.txt")
+    assert catalog.list_documents() == ["b.txt"]
+    assert catalog.get_sections("a.txt") is None
+
+
+def test_concurrent_adds_are_not_lost(tmp_path):
+    path = str(tmp_path / "catalog.db")
+    DocumentCatalog(path)
+
+    def add(n):
+        DocumentCatalog(path).add_document(f"doc-{n}", "h", [f"doc-{n}-0"], ["s"], "model")
+
+    threads = [threading.Thread(target=add, args=(n,)) for n in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(DocumentCatalog(path).list_documents()) == 20
+
+
+def test_import_json(tmp_path):
+    catalog = DocumentCatalog(str(tmp_path / "catalog.db"))
+    catalog.import_json(["a.txt", "b.txt"], {"a.txt": ["a.txt-0"]})
+    assert catalog.get_document("a.txt")['section_count'] == 1
+    assert catalog.get_document("b.txt")['section_count'] is None
+
+
+def test_settings(tmp_path):
+    catalog = DocumentCatalog(str(tmp_path / "catalog.db"))
+    assert catalog.get_setting('index_config') is None
+    catalog.set_setting('index_config', {'dimension': 1536})
+    assert DocumentCatalog(str(tmp_path / "catalog.db")).get_setting('index_config') == {'dimension': 1536}
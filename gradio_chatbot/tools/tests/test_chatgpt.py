@@ -1,3 +1,4 @@
+import asyncio
 import os
 import pytest
 import openai
@@ -5,7 +6,8 @@ from unittest.mock import patch
 from tools.chatgpt import ChatGPT
 
 @patch.object(openai.ChatCompletion, 'create')
-def test_chat(mock_create):
+def test_chat(mock_create, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test-api-key")
     # Mock the response from OpenAI
     mock_create.return_value = {
         'choices': [{
@@ -15,23 +17,25 @@ def test_chat(mock_create):
         }]
     }
 
-    # NOTE: OPENAI_API_KEY must be valid for testing
-    # os.environ["OPENAI_API_KEY"] = "test-api-key"
-
     chatgpt = ChatGPT()
-    response = chatgpt.chat("Hello, GPT!")
+    message_history = []
+    response = chatgpt.chat("Hello, GPT!", message_history)
 
     assert response == "Hello, user!"
-    assert len(chatgpt.message_history) == 2
-    assert chatgpt.message_history[-1]['content'] == "Hello, user!"
-    assert chatgpt.message_history[-1]['role'] == 'assistant'
+    assert len(message_history) == 2
+    assert message_history[-1]['content'] == "Hello, user!"
+    assert message_history[-1]['role'] == 'assistant'
 
-def test_clear_messages():
+@patch.object(openai.ChatCompletion, 'create')
+def test_clear_messages(mock_create, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test-api-key")
+    mock_create.return_value = {'choices': [{'message': {'content': 'Hello, user!'}}]}
     chatgpt = ChatGPT()
-    chatgpt.chat("Hello, GPT!")
-    chatgpt.clear_messages()
+    message_history = []
+    chatgpt.chat("Hello, GPT!", message_history)
+    chatgpt.clear_messages(message_history)
 
-    assert len(chatgpt.message_history) == 0
+    assert len(message_history) == 0
 
 def test_no_api_key():
     # Remove the API key from environment variables
@@ -40,3 +44,65 @@ def test_no_api_key():
 
     with pytest.raises(Exception) as e_info:
         chatgpt = ChatGPT()
+
+def test_chat_stream(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test-api-key")
+
+    async def chunks():
+        for content in [None, "Hello", ", user!"]:
+            delta = {'content': content} if content else {}
+            yield {'choices': [{'delta': delta}]}
+
+    async def acreate(**kwargs):
+        assert kwargs['stream']
+        return chunks()
+
+    monkeypatch.setattr(openai.ChatCompletion, 'acreate', acreate)
+
+    async def collect():
+        chatgpt = ChatGPT()
+        message_history = []
+        tokens = [t async for t in chatgpt.chat_stream("Hello, GPT!", message_history)]
+        return tokens, message_history
+
+    tokens, message_history = asyncio.run(collect())
+    assert tokens == ["Hello", ", user!"]
+    assert message_history[-1] == {'role': 'assistant', 'content': 'Hello, user!'}
+
+def test_oversized_message_is_not_left_in_history(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test-api-key")
+    chatgpt = ChatGPT()
+    message_history = [{'role': 'user', 'content': "Hi"}, {'role': 'assistant', 'content': "Hello!"}]
+    with pytest.raises(ValueError):
+        chatgpt.chat("word " * 20000, message_history, model="gpt-4")
+    assert message_history[-1] == {'role': 'assistant', 'content': "Hello!"}
+
+    async def stream():
+        return [piece async for piece in chatgpt.chat_stream("word " * 20000, message_history, model="gpt-4")]
+
+    with pytest.raises(ValueError):
+        asyncio.run(stream())
+    assert len(message_history) == 2
+
+def test_complete_uses_the_shared_limiter(monkeypatch):
+    from tools import clients
+
+    monkeypatch.setenv("OPENAI_API_KEY", "test-api-key")
+    acquired = []
+
+    async def acquire_async(model, tokens=0, priority=clients.CHAT):
+        acquired.append((model, priority))
+
+    async def acreate(**kwargs):
+        return {'choices': [{'message': {'content': "finding"}}]}
+
+    monkeypatch.setattr(clients.limiter, "acquire_async", acquire_async)
+    monkeypatch.setattr(openai.ChatCompletion, "acreate", acreate)
+
+    async def complete():
+        response = await ChatGPT().complete("Section 1", "gpt-4", priority=clients.MAP)
+        await clients.close_aiosession()
+        return response
+
+    assert asyncio.run(complete()) == "finding"
+    assert acquired == [("gpt-4", clients.MAP)]
@@ -0,0 +1,107 @@
+import asyncio
+import openai
+import pytest
+from tools import clients
+from tools.clients import BULK, CHAT, RateLimiter, TokenBucket, with_retries_async
+
+
+def test_token_bucket_refills_over_time():
+    bucket = TokenBucket(60)
+    now = bucket.updated
+    assert bucket.wait_time(60, now) == 0
+    bucket.take(60)
+    assert bucket.wait_time(1, now) == pytest.approx(1.0)
+    assert bucket.wait_time(1, now + 1.0) == 0
+    # A request larger than the capacity only waits for a full bucket
+    assert bucket.wait_time(1000, now + 1.0) == pytest.approx(59.0)
+
+
+def test_limiter_waits_for_tokens(monkeypatch):
+    limiter = RateLimiter({'gpt-4': (100, 600)})
+    sleeps = []
+    monkeypatch.setattr(clients.time, "sleep", lambda s: sleeps.append(s) or clock.append(clock[-1] + s))
+    clock = [0.0]
+    monkeypatch.setattr(clients.time, "monotonic", lambda: clock[-1])
+    limiter.buckets['gpt-4'][0].updated = limiter.buckets['gpt-4'][1].updated = 0.0
+
+    limiter.acquire("gpt-4-0613", tokens=600)
+    assert sleeps == []
+    limiter.acquire("gpt-4", tokens=20)
+    # 20 tokens at 10 tokens per second
+    assert sum(sleeps) == pytest.approx(2.0)
+    # Unknown models are not limited
+    limiter.acquire("other-model", tokens=10 ** 9)
+
+
+def test_chat_goes_ahead_of_bulk():
+    limiter = RateLimiter({'model': (600, None)})
+    limiter.buckets['model'][0].level = 0
+    order = []
+
+    async def request(name, priority, delay):
+        await asyncio.sleep(delay)
+        await limiter.acquire_async('model', priority=priority)
+        order.append(name)
+
+    async def main():
+        await asyncio.gather(request('bulk-1', BULK, 0), request('bulk-2', BULK, 0),
+                             request('chat', CHAT, 0.01))
+
+    asyncio.run(main())
+    assert order[0] == 'chat'
+
+
+def test_with_retries_async(monkeypatch):
+    async def no_sleep(s):
+        pass
+
+    monkeypatch.setattr(clients.asyncio, "sleep", no_sleep)
+    attempts = []
+
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise openai.error.ServiceUnavailableError("busy")
+        return "ok"
+
+    assert asyncio.run(with_retries_async(flaky)) == "ok"
+    assert len(attempts) == 3
+
+
+def test_embedding_goes_through_limiter(monkeypatch):
+    acquired = []
+    monkeypatch.setattr(clients.limiter, "acquire",
+                        lambda model, tokens=0, priority=CHAT: acquired.append((model, priority)))
+    monkeypatch.setattr(openai.Embedding, "create",
+                        lambda input, engine: {'data': [{'embedding': [1.0]} for _ in input]})
+    response = clients.embedding(["a", "b"], "text-embedding-ada-002")
+    assert len(response['data']) == 2
+    assert acquired == [("text-embedding-ada-002", BULK)]
+
+
+def test_retries_go_through_the_limiter(monkeypatch):
+    monkeypatch.setattr(clients.time, "sleep", lambda s: None)
+    acquired = []
+    monkeypatch.setattr(clients.limiter, "acquire", lambda model, tokens=0, priority=CHAT: acquired.append(model))
+    attempts = []
+
+    def create(**kwargs):
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise openai.error.RateLimitError("slow down")
+        return {'choices': [{'message': {'content': "hi"}}], 'usage': {'prompt_tokens': 5, 'completion_tokens': 1}}
+
+    monkeypatch.setattr(openai.ChatCompletion, "create", create)
+    clients.chat_completion("gpt-4", [{'role': 'user', 'content': "hello"}])
+    assert acquired == ["gpt-4"] * 3
+
+
+def test_aiosession_is_closed_with_its_loop():
+    async def use_session():
+        session = clients.shared_aiosession()
+        assert clients.shared_aiosession() is session
+        await clients.close_aiosession()
+        assert asyncio.get_running_loop() not in clients.aiosessions
+        return session
+
+    assert asyncio.run(use_session()).closed
@@ -0,0 +1,46 @@
+import openai
+from unittest.mock import patch
+from tools.completion_cache import CompletionCache, cached_chat_completion, completion_key
+
+
+def test_key_normalizes_messages():
+    a = completion_key("gpt-4", [{'role': 'user', 'content': ' hi '}], temperature=0)
+    b = completion_key("gpt-4", [{'role': 'User', 'content': 'hi'}], temperature=0)
+    assert a == b
+    assert a != completion_key("gpt-4", [{'role': 'user', 'content': 'hi'}], temperature=1)
+    assert a != completion_key("gpt-3.5-turbo", [{'role': 'user', 'content': 'hi'}], temperature=0)
+
+
+def test_memory_and_disk_tiers(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = CompletionCache(path)
+    assert cache.get("k") is None
+    cache.put("k", "answer")
+    assert cache.get("k") == "answer"
+
+    reopened = CompletionCache(path)
+    assert reopened.get("k") == "answer"
+    assert reopened.stats() == {'hits': 1, 'disk_hits': 1, 'misses': 0}
+    assert cache.stats() == {'hits': 1, 'disk_hits': 0, 'misses': 1}
+
+
+def test_ttl_and_size_eviction(tmp_path):
+    cache = CompletionCache(str(tmp_path / "cache.db"), lru_size=0, max_entries=2)
+    for k in ["a", "b", "c"]:
+        cache.put(k, k)
+    assert cache.get("a") is None
+    assert cache.get("c") == "c"
+
+    expired = CompletionCache(str(tmp_path / "ttl.db"), ttl=-1)
+    expired.put("k", "v")
+    assert expired.get("k") is None
+
+
+@patch.object(openai.ChatCompletion, 'create')
+def test_cached_chat_completion(mock_create, tmp_path):
+    mock_create.return_value = {'choices': [{'message': {'content': 'Hello!'}}]}
+    cache = CompletionCache(str(tmp_path / "cache.db"))
+    messages = [{'role': 'user', 'content': 'Hi'}]
+    assert cached_chat_completion(cache, "gpt-4", messages, temperature=0) == "Hello!"
+    assert cached_chat_completion(cache, "gpt-4", messages, temperature=0) == "Hello!"
+    assert mock_create.call_count == 1
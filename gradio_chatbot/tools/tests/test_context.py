@@ -0,0 +1,59 @@
+from tools.context import best_sentences, context_budget, format_sections, pack_context
+from tools.tokens import count_tokens
+
+
+def match(id, score, text):
+    return {'id': id, 'score': score, 'metadata': {'text': text}}
+
+
+def filler(topic, n):
+    return " ".join(f"Sentence {i} is about {topic}." for i in range(n))
+
+
+def test_context_budget_per_model():
+    assert context_budget("gpt-3.5-turbo") == (4096 - 1024) // 2
+    assert context_budget("gpt-4-32k-0613") == (32768 - 1024) // 2
+    assert context_budget("gpt-4o") > context_budget("gpt-4")
+
+
+def test_packs_best_sections_whole_within_budget():
+    matches = [match("doc-1", 0.80, filler("radar", 5)), match("doc-0", 0.82, filler("spectrum", 5))]
+    (sections, stats) = pack_context(matches, "What about spectrum?", "gpt-3.5-turbo", budget=1000)
+    assert [s['id'] for s in sections] == ["doc-0", "doc-1"]
+    assert not any(s['trimmed'] for s in sections)
+    assert sections[0]['text'] == matches[1]['metadata']['text']
+    assert stats['packed'] == 2 and stats['tokens'] == sum(s['tokens'] for s in sections)
+
+
+def test_drops_overlapping_text():
+    first = filler("auctions", 10)
+    overlapping = filler("auctions", 10)[first.index("Sentence 8"):] + " The auction closed in March."
+    matches = [match("doc-0", 0.9, first), match("doc-1", 0.89, overlapping),
+               match("copy-0", 0.88, first)]
+    (sections, stats) = pack_context(matches, "When did the auction close?", "gpt-4", budget=2000)
+    assert [s['id'] for s in sections] == ["doc-0", "doc-1"]
+    assert sections[1]['text'] == "The auction closed in March."
+    assert stats['duplicate'] == 1
+
+
+def test_trims_tail_sections_to_best_sentences():
+    tail = filler("weather", 60) + " The relocation timeline is five years. " + filler("lunch", 60)
+    matches = [match("doc-0", 0.9, filler("spectrum", 3)), match("doc-1", 0.7, tail)]
+    (sections, stats) = pack_context(matches, "What is the relocation timeline?", "gpt-4", budget=3000)
+    assert stats['trimmed'] == 1
+    assert sections[1]['trimmed'] and "relocation timeline is five years" in sections[1]['text']
+    assert count_tokens(sections[1]['text'], "gpt-4") <= 200
+
+
+def test_stays_within_budget():
+    matches = [match(f"doc-{i}", 0.9 - i * 0.001, filler(f"topic{i}", 80)) for i in range(20)]
+    (sections, stats) = pack_context(matches, "topic3", "gpt-3.5-turbo", budget=1500)
+    assert stats['tokens'] <= 1500
+    assert count_tokens(format_sections(sections), "gpt-3.5-turbo") <= 1500 + len(sections) * 2
+    assert stats['packed'] + stats['dropped'] + stats['duplicate'] == 20
+
+
+def test_best_sentences_keeps_document_order():
+    sentences = ["Alpha is first.", "Nothing here.", "Beta follows alpha.", "More filler."]
+    text = best_sentences(sentences, {"alpha", "beta"}, 12, "gpt-4")
+    assert text == "Alpha is first. ... Beta follows alpha."
@@ -0,0 +1,38 @@
+from tools.embedding_cache import EmbeddingCache
+
+
+class FakeEmbedder:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, texts, model, priority=None):
+        self.calls.append(list(texts))
+        return [[float(len(t)), 1.0] for t in texts]
+
+
+def test_only_misses_are_embedded(tmp_path):
+    embedder = FakeEmbedder()
+    cache = EmbeddingCache(str(tmp_path / "cache.db"), embed_fn=embedder)
+
+    first = cache.get_embeddings(["a", "bb", "a"], "model")
+    assert first == [[1.0, 1.0], [2.0, 1.0], [1.0, 1.0]]
+    assert embedder.calls == [["a", "bb"]]
+
+    second = cache.get_embeddings(["bb", "ccc"], "model")
+    assert second == [[2.0, 1.0], [3.0, 1.0]]
+    assert embedder.calls[-1] == ["ccc"]
+    assert (cache.hits, cache.misses) == (1, 4)
+
+    # Different models do not share entries
+    cache.get_embeddings(["a"], "other-model")
+    assert embedder.calls[-1] == ["a"]
+
+
+def test_cache_persists_across_instances(tmp_path):
+    path = str(tmp_path / "cache.db")
+    EmbeddingCache(path, embed_fn=FakeEmbedder()).get_embeddings(["hello"], "model")
+
+    embedder = FakeEmbedder()
+    cache = EmbeddingCache(path, lru_size=1, embed_fn=embedder)
+    assert cache.get_embeddings(["hello"], "model") == [[5.0, 1.0]]
+    assert embedder.calls == []
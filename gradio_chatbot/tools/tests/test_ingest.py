@@ -0,0 +1,74 @@
+import openai
+import pytest
+from tools import clients
+from tools.ingest import embed_and_upsert, token_batches, with_retries
+
+
+class FakeIndex:
+    def __init__(self):
+        self.upserts = []
+
+    def upsert(self, vectors):
+        self.upserts.append(list(vectors))
+
+
+def test_token_batches_respect_limits():
+    vectors = [(i, "word " * 100, {}) for i in range(10)]
+    batches = list(token_batches(iter(vectors), "text-embedding-ada-002", max_tokens=250, max_items=3))
+    assert [v[0] for b in batches for v in b] == list(range(10))
+    assert all(len(b) <= 2 for b in batches)
+
+    with pytest.raises(ValueError):
+        list(token_batches(vectors, "text-embedding-ada-002", max_item_tokens=10))
+
+
+def test_embed_and_upsert_batches_and_reports_progress():
+    vectors = [(f"doc-{i}", f"text {i}", {'document': 'doc'}) for i in range(25)]
+    index = FakeIndex()
+    calls = []
+    progress = []
+
+    def embed(texts):
+        calls.append(len(texts))
+        return [[float(t.split()[1])] for t in texts]
+
+    done = embed_and_upsert(vectors, embed, index, "text-embedding-ada-002",
+                            upsert_batch_size=10, progress=lambda d, t: progress.append((d, t)),
+                            max_items=4)
+    assert done == 25
+    assert sum(calls) == 25 and max(calls) <= 4
+    assert [len(u) for u in index.upserts] == [10, 10, 5]
+    assert progress[-1] == (25, 25)
+    upserted = {v[0]: v[1] for u in index.upserts for v in u}
+    assert upserted["doc-17"] == [17.0]
+
+
+def test_with_retries(monkeypatch):
+    monkeypatch.setattr(clients.time, "sleep", lambda s: None)
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise openai.error.RateLimitError("slow down")
+        return "ok"
+
+    assert with_retries(flaky) == "ok"
+    assert len(attempts) == 3
+
+    def always_limited():
+        raise openai.error.RateLimitError("slow down")
+
+    with pytest.raises(openai.error.RateLimitError):
+        with_retries(always_limited, retries=1)
+
+
+def test_embed_and_upsert_reads_generators():
+    index = FakeIndex()
+    progress = []
+    vectors = ((f"doc-{i}", "text", {}) for i in range(7))
+    done = embed_and_upsert(vectors, lambda texts: [[1.0]] * len(texts), index,
+                            "text-embedding-ada-002", upsert_batch_size=3,
+                            progress=lambda d, t: progress.append((d, t)), max_items=2)
+    assert done == 7
+    assert progress[-1] == (7, None)
@@ -0,0 +1,135 @@
+import time
+import pytest
+from tools.jobs import IngestQueue
+from tools.pinecone import PineconeManager
+
+
+def fake_embeddings(texts, model, priority=None):
+    return [[float(len(t)), 1.0] for t in texts]
+
+
+def wait_for(queue, job_id, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = queue.get_job(job_id)
+        if job['status'] in ('done', 'failed'):
+            return job
+        time.sleep(0.05)
+    raise AssertionError("job did not finish")
+
+
+def make_manager(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    manager = PineconeManager(backend="local")
+    manager.embedding_cache.embed_fn = fake_embeddings
+    return manager
+
+
+def test_jobs_ingest_in_the_background(tmp_path, monkeypatch):
+    manager = make_manager(tmp_path, monkeypatch)
+    queue = IngestQueue(manager)
+    queue.start(workers=2)
+    try:
+        upload = tmp_path / "upload.txt"
+        upload.write_text("\n".join(["word " * 100] * 40))
+        job_id = queue.submit("doc.txt", str(upload))
+        assert not upload.exists()
+
+        job = wait_for(queue, job_id)
+        assert job['status'] == 'done', job['message']
+        assert manager.get_document_list() == ["doc.txt"]
+        assert queue.list_jobs()[0]['id'] == job_id
+    finally:
+        queue.stop()
+
+
+def test_interrupted_job_resumes_from_checkpoint(tmp_path, monkeypatch):
+    manager = make_manager(tmp_path, monkeypatch)
+    queue = IngestQueue(manager)
+    upload = tmp_path / "upload.txt"
+    upload.write_text("\n".join(["word " * 100] * 40))
+    job_id = queue.submit("doc.txt", str(upload))
+
+    # Simulate a crash after the first section was upserted
+    queue._claim()
+    queue._checkpoint(job_id, ["doc.txt-0"])
+    upserted = []
+    upsert = manager.index_instance.upsert
+    manager.index_instance.upsert = lambda vectors: upserted.extend(v[0] for v in vectors) or upsert(vectors)
+
+    queue.start(workers=1)
+    try:
+        job = wait_for(queue, job_id)
+    finally:
+        queue.stop()
+    assert job['status'] == 'done', job['message']
+    assert "doc.txt-0" not in upserted and "doc.txt-1" in upserted
+    assert manager.catalog.get_document("doc.txt")['section_count'] == 3
+
+
+def test_duplicate_active_job_is_rejected(tmp_path, monkeypatch):
+    queue = IngestQueue(make_manager(tmp_path, monkeypatch))
+    for name in ("a.txt", "b.txt"):
+        (tmp_path / name).write_text("text")
+    queue.submit("doc.txt", str(tmp_path / "a.txt"))
+    with pytest.raises(ValueError):
+        queue.submit("doc.txt", str(tmp_path / "b.txt"))
+
+
+def test_failed_job_removes_its_upload(tmp_path, monkeypatch):
+    manager = make_manager(tmp_path, monkeypatch)
+
+    def failing_embeddings(texts, model, priority=None):
+        raise RuntimeError("embedding service is down")
+
+    manager.embedding_cache.embed_fn = failing_embeddings
+    queue = IngestQueue(manager)
+    upload = tmp_path / "upload.txt"
+    upload.write_text("some text")
+    job_id = queue.submit("doc.txt", str(upload))
+    queue.start(workers=1)
+    try:
+        job = wait_for(queue, job_id)
+    finally:
+        queue.stop()
+    assert job['status'] == 'failed'
+    assert "embedding service is down" in job['message']
+    assert list((tmp_path / "uploads").iterdir()) == []
+
+
+def test_reads_do_not_wait_for_writers(tmp_path, monkeypatch):
+    queue = IngestQueue(make_manager(tmp_path, monkeypatch))
+    (tmp_path / "a.txt").write_text("text")
+    job_id = queue.submit("doc.txt", str(tmp_path / "a.txt"))
+    with queue.transaction() as db:
+        db.execute("UPDATE jobs SET message = 'Busy' WHERE id = ?", (job_id,))
+        start = time.time()
+        assert queue.get_job(job_id)['message'] == 'Waiting for a worker'
+        assert queue.list_jobs()[0]['id'] == job_id
+        assert time.time() - start < 1
+
+
+def test_failed_job_removes_its_upserted_sections(tmp_path, monkeypatch):
+    manager = make_manager(tmp_path, monkeypatch)
+    queue = IngestQueue(manager)
+    upload = tmp_path / "upload.txt"
+    upload.write_text("\n".join(["word " * 100] * 40))
+    job_id = queue.submit("doc.txt", str(upload))
+
+    # A first run upserted one section before crashing, the resumed run fails
+    queue._claim()
+    manager.index_instance.upsert([("doc.txt-0", [1.0, 1.0], {'document': 'doc.txt'})])
+    queue._checkpoint(job_id, ["doc.txt-0"])
+
+    def failing_embeddings(texts, model, priority=None):
+        raise RuntimeError("embedding service is down")
+
+    manager.embedding_cache.embed_fn = failing_embeddings
+    queue.start(workers=1)
+    try:
+        job = wait_for(queue, job_id)
+    finally:
+        queue.stop()
+    assert job['status'] == 'failed'
+    assert manager.index_instance.fetch(ids=["doc.txt-0"])['vectors'] == {}
+    assert not manager.has_document("doc.txt")
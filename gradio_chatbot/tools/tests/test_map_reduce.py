@@ -0,0 +1,56 @@
+import asyncio
+from tools.map_reduce import map_reduce
+
+
+def run(sections, request, complete, model="gpt-3.5-turbo", **kwargs):
+    async def collect():
+        return [u async for u in map_reduce(sections, request, complete, model, **kwargs)]
+    return asyncio.run(collect())
+
+
+def test_single_section_goes_straight_to_answer():
+    async def complete(prompt):
+        raise AssertionError("no map calls expected")
+
+    updates = run(["only section"], "What?", complete)
+    assert len(updates) == 1
+    assert "only section" in updates[0]['prompt']
+
+
+def test_sections_are_mapped_concurrently():
+    in_flight = 0
+    peak = 0
+
+    async def complete(prompt):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return "finding for " + prompt.split("\n")[0]
+
+    sections = [f"section text {n}" for n in range(10)]
+    updates = run(sections, "What?", complete, max_concurrency=3)
+
+    maps = [u for u in updates if u['stage'] == 'map']
+    assert [u['done'] for u in maps] == list(range(1, 11))
+    assert peak == 3
+    answer = updates[-1]
+    assert answer['stage'] == 'answer'
+    assert "finding for This is section 10 of 10" in answer['prompt']
+
+
+def test_findings_are_tree_reduced_to_fit():
+    calls = []
+
+    async def complete(prompt):
+        calls.append(prompt)
+        if prompt.startswith("This is section"):
+            return "finding " * 400
+        return "combined"
+
+    updates = run([f"s{n}" for n in range(8)], "What?", complete, reserve_tokens=1024)
+    reduces = [u for u in updates if u['stage'] == 'reduce']
+    assert reduces and reduces[0]['groups'] < 8
+    assert updates[-1]['stage'] == 'answer'
+    assert "combined" in updates[-1]['prompt']
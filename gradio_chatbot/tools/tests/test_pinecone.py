@@ -0,0 +1,155 @@
+import pytest
+from tools.pinecone import PineconeManager
+
+
+def fake_embeddings(texts, model, priority=None):
+    return [[float(len(t)), 1.0, 0.5] for t in texts]
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    manager = PineconeManager(backend="local")
+    manager.embedding_cache.embed_fn = fake_embeddings
+    return manager
+
+
+def test_add_and_remove_document(manager):
+    text = "\n".join(["word " * 100] * 40)
+    num_sections = manager.add_document("doc.txt", text)
+    assert num_sections == 3
+    assert manager.get_document_list() == ["doc.txt"]
+    assert [id for (id, _) in manager.catalog.get_sections("doc.txt")] == \
+        ["doc.txt-0", "doc.txt-1", "doc.txt-2"]
+
+    deletes = []
+    delete = manager.index_instance.delete
+    manager.index_instance.delete = lambda **kw: deletes.append(kw) or delete(**kw)
+    assert manager.remove_document("doc.txt") == 3
+    assert len(deletes) == 1
+    assert manager.get_document_list() == []
+    assert manager.query_index("word", 5)['matches'] == []
+
+
+def test_remove_document_without_manifest(manager):
+    manager.add_document("old.txt", "one\ntwo")
+    manager.add_document("other.txt", "three")
+    manager.catalog.remove_document("old.txt")
+    manager.catalog.import_json(["old.txt"], {})
+    assert manager.remove_document("old.txt") == 1
+    assert [m['id'] for m in manager.query_index("x", 5)['matches']] == ["other.txt-0"]
+
+
+def test_legacy_json_is_imported(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "chatbot-library.json").write_text('["a.txt", "b.txt"]')
+    manager = PineconeManager(backend="local")
+    assert manager.get_document_list() == ["a.txt", "b.txt"]
+    assert manager.has_document("a.txt")
+    assert not (tmp_path / "chatbot-library.json").exists()
+
+
+def test_update_document_only_reindexes_changed_sections(manager):
+    paragraphs = [f"paragraph {n} " + "word " * 1000 for n in range(4)]
+    manager.add_document("doc.txt", "\n".join(paragraphs))
+
+    upserted = []
+    upsert = manager.index_instance.upsert
+    manager.index_instance.upsert = lambda vectors: upserted.extend(vectors) or upsert(vectors)
+    paragraphs[2] = "changed " + "word " * 1000
+    del paragraphs[3]
+    changes = manager.update_document("doc.txt", "\n".join(paragraphs))
+
+    assert changes == {'added': 1, 'removed': 2, 'unchanged': 2}
+    assert [v[2]['text'] for v in upserted] == [paragraphs[2]]
+    ids = [id for (id, _) in manager.catalog.get_sections("doc.txt")]
+    assert ids[:2] == ["doc.txt-0", "doc.txt-1"]
+    result = manager.query_index("x", 10)
+    assert sorted(m['id'] for m in result['matches']) == sorted(ids)
+    assert manager.remove_document("doc.txt") == 3
+
+
+def test_early_edit_keeps_later_sections(manager):
+    lines = [f"line {n} of the report: " + " ".join(f"w{(n * 7 + k) % 97}" for k in range(30))
+             for n in range(400)]
+    sections = manager.add_document("doc.txt", "\n".join(lines))
+    assert sections > 5
+
+    lines[3] += " with a few more words added"
+    lines.insert(10, "A new line near the start.")
+    changes = manager.update_document("doc.txt", "\n".join(lines))
+    assert changes['unchanged'] >= sections - 2
+    assert changes['added'] <= 2
+
+
+def test_index_is_opened_on_first_use(manager):
+    assert manager._index_instance is None
+    manager.query_index("x", 5)
+    assert manager._index_instance is not None
+
+
+def test_pinecone_config_is_cached(tmp_path, monkeypatch):
+    import pinecone
+    from pinecone.core.api_action import ActionAPI
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(pinecone.Config, "_config", pinecone.Config._config)
+    calls = []
+    # Stub the service at the request level, so pinecone.init() runs for real
+    monkeypatch.setattr(ActionAPI, "get",
+                        lambda self, path: calls.append(('get', path)) or {'project_name': "project"})
+    monkeypatch.setattr(pinecone, "list_indexes", lambda: calls.append(('list',)) or [])
+    monkeypatch.setattr(pinecone, "create_index",
+                        lambda name, dimension, **kw: calls.append(('create', dimension)))
+
+    def no_embeddings(texts, model, priority=None):
+        raise AssertionError("the dimension of a known model needs no embedding call")
+
+    manager = PineconeManager(backend="pinecone", api_key="key", environment="env")
+    manager.embedding_cache.embed_fn = no_embeddings
+    assert calls == []
+    manager.index_instance
+    assert calls == [('get', "/actions/whoami"), ('list',), ('create', 1536)]
+
+    # A restart trusts the recent check and makes no calls to the service
+    calls.clear()
+    index = PineconeManager(backend="pinecone", api_key="key", environment="env").index_instance
+    assert calls == []
+    assert index.index_instance.configuration.host == "https://chatbot-library-project.svc.env.pinecone.io"
+
+
+def test_stale_pinecone_config_is_checked_again(tmp_path, monkeypatch):
+    import time
+    import pinecone
+    from pinecone.core.api_action import ActionAPI
+    from urllib3.exceptions import MaxRetryError
+    from tools.vector_index import PineconeIndex
+    monkeypatch.setattr(pinecone.Config, "_config", pinecone.Config._config)
+    calls = []
+    monkeypatch.setattr(ActionAPI, "get", lambda self, path: calls.append('whoami') or {'project_name': "p"})
+    monkeypatch.setattr(pinecone, "list_indexes", lambda: calls.append('list') or [])
+    monkeypatch.setattr(pinecone, "create_index", lambda name, dimension, **kw: calls.append('create'))
+    config = {'index_name': "idx", 'environment': "env", 'project_name': "p", 'verified': time.time()}
+    index = PineconeIndex("idx", "key", "env", lambda: 3, config=config)
+
+    # The deleted index's host no longer resolves
+    def gone(*args, **kwargs):
+        raise MaxRetryError(None, "https://idx-p.svc.env.pinecone.io", "Name or service not known")
+    monkeypatch.setattr(index.index_instance, "query", gone)
+    monkeypatch.setattr(pinecone.Index, "query", lambda self, *a, **kw: {'matches': []})
+    assert index.query([0.0, 0.0, 1.0], top_k=1) == {'matches': []}
+    assert calls == ['whoami', 'list', 'create']
+
+
+def test_cached_pinecone_config_without_client_internals(monkeypatch):
+    import time
+    import pinecone
+    from pinecone.core.api_action import ActionAPI
+    from tools.vector_index import PineconeIndex
+    # A client release whose config is not the namedtuple configure() edits
+    monkeypatch.setattr(pinecone.Config, "_config", object())
+    calls = []
+    monkeypatch.setattr(ActionAPI, "get", lambda self, path: calls.append('whoami') or {'project_name': "other"})
+    config = {'index_name': "idx", 'environment': "env", 'project_name': "p", 'verified': time.time()}
+    index = PineconeIndex("idx", "key", "env", lambda: 3, config=config)
+    assert calls == ['whoami']
+    assert index.index_instance.configuration.host == "https://idx-p.svc.env.pinecone.io"
@@ -0,0 +1,74 @@
+import io
+import pytest
+from tools.embedding_cache import text_hash
+from tools.splitter import HashingReader, hard_split, iter_parts, iter_pieces, split_sections, split_text
+from tools.tokens import count_tokens
+
+
+def test_sections_fit_the_token_limit():
+    text = "\n".join(f"line {n} " + "word " * 50 for n in range(200))
+    sections = split_text(text, max_tokens=300)
+    assert len(sections) > 1
+    assert all(count_tokens(s, "text-embedding-ada-002") <= 300 for s in sections)
+    assert "\n".join(sections) == text
+
+
+def test_overlong_line_is_hard_split():
+    sections = split_text("short\n" + "x" * 10000 + "\nend", max_tokens=500)
+    assert len(sections) > 2
+    assert all(count_tokens(s, "text-embedding-ada-002") <= 500 for s in sections)
+    assert "".join(sections).replace("\n", "") == "short" + "x" * 10000 + "end"
+
+
+def test_overlap_repeats_the_tail_of_the_previous_section():
+    lines = [f"line {n} " + "word " * 20 for n in range(40)]
+    sections = split_text("\n".join(lines), max_tokens=200, overlap_tokens=60)
+    for previous, section in zip(sections, sections[1:]):
+        assert section.split("\n")[0] in previous.split("\n")
+
+
+def test_streams_are_read_incrementally():
+    text = "SECTION one SECTION two SECTION three"
+    pieces = list(iter_pieces(io.StringIO(text), separator="SECTION", chunk_size=4))
+    assert pieces == ["", " one ", " two ", " three"]
+
+    reader = HashingReader(io.StringIO("a\nb\nc"))
+    assert list(split_sections(reader, max_tokens=100)) == ["a\nb\nc"]
+    assert reader.hexdigest() == text_hash("a\nb\nc")
+
+
+def test_long_lines_are_read_in_bounded_parts():
+    parts = list(iter_parts(io.StringIO("ab" * 50 + "\nend"), chunk_size=7, max_chars=16))
+    assert all(len(part) <= 16 for (part, _) in parts)
+    assert [complete for (_, complete) in parts].count(True) == 2
+    assert "".join(part for (part, _) in parts) == "ab" * 50 + "end"
+
+    text = "start\n" + "word " * 20000 + "\nend"
+    sections = list(split_sections(io.StringIO(text), max_tokens=200))
+    assert all(count_tokens(s, "text-embedding-ada-002") <= 200 for s in sections)
+    assert "".join(sections).replace("\n", "") == text.replace("\n", "")
+
+
+def byte_encoding():
+    # A real tiktoken encoding with one token per byte, which splits every
+    # multi-byte character across tokens (the downloaded encodings do for many)
+    tiktoken = pytest.importorskip("tiktoken")
+    return tiktoken.Encoding("bytes", pat_str=r"\S+|\s+", mergeable_ranks={bytes([i]): i for i in range(256)},
+                             special_tokens={})
+
+
+def test_hard_split_keeps_multibyte_characters_whole(monkeypatch):
+    from tools import splitter, tokens
+
+    encoding = byte_encoding()
+    monkeypatch.setattr(splitter, "get_encoding", lambda model: encoding)
+    monkeypatch.setattr(tokens, "get_encoding", lambda model: encoding)
+    text = "naïve café 東京 🙂 " * 40
+    pieces = hard_split(text, 7)
+    assert "".join(pieces) == text
+    assert all(len(encoding.encode(p)) <= 7 for p in pieces)
+    assert "�" not in "".join(pieces)
+
+    sections = split_text(text * 10, max_tokens=50)
+    assert "�" not in "".join(sections)
+    assert "".join(sections).replace("\n", "") == text * 10
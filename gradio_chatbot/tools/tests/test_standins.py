@@ -0,0 +1,52 @@
+import asyncio
+import openai
+from benchmark import make_document, percentile
+from tools.chatgpt import ChatGPT
+from tools.embedding_cache import EmbeddingCache, openai_embeddings
+from tools.standins import FakeOpenAI, FakePineconeIndex, FaultInjector
+from tools.vector_index import LocalIndex
+
+
+def test_fake_openai_chat_and_embeddings(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test-api-key")
+    original = openai.ChatCompletion.__dict__['create']
+    with FakeOpenAI(response_words=3, dimension=8) as fake:
+        chatgpt = ChatGPT()
+        assert chatgpt.chat("hello there", []) == "hello there ok"
+
+        async def stream():
+            return [t async for t in chatgpt.chat_stream("one two three four", [])]
+        assert asyncio.run(stream()) == ["one", " two", " three"]
+
+        cache = EmbeddingCache(":memory:", embed_fn=openai_embeddings)
+        [a, b, c] = cache.get_embeddings(["x", "y", "x"], "text-embedding-ada-002")
+        assert len(a) == 8 and a == c and a != b
+        assert fake.faults.calls == {'chat': 2, 'embedding': 1}
+    assert openai.ChatCompletion.__dict__['create'] is original
+
+
+def test_fault_injection():
+    faults = FaultInjector(rate_limit_rate=0.5, error_rate=0.5, seed=0)
+    raised = []
+    for _ in range(20):
+        try:
+            faults.call("chat")
+        except (openai.error.RateLimitError, openai.error.ServiceUnavailableError) as e:
+            raised.append(type(e))
+    assert len(raised) == 20 and len(set(raised)) == 2
+    assert faults.calls["chat"] == faults.errors["chat"] == 20
+
+
+def test_fake_pinecone_counts_calls(tmp_path):
+    index = FakePineconeIndex(LocalIndex(str(tmp_path / "index")))
+    index.upsert(vectors=[("a", [1.0, 0.0], {'document': 'd'})])
+    assert index.query([1.0, 0.0], top_k=1)['matches'][0]['id'] == "a"
+    assert index.faults.calls == {'pinecone.upsert': 1, 'pinecone.query': 1}
+
+
+def test_benchmark_helpers():
+    assert percentile([], 50) is None
+    values = list(range(1, 101))
+    assert (percentile(values, 50), percentile(values, 95), percentile(values, 99)) == (50, 95, 99)
+    assert percentile([3.0], 99) == 3.0
+    assert abs(len(make_document(1000)) - 1000) < 20
@@ -0,0 +1,33 @@
+import pytest
+from tools.tokens import context_window, count_message_tokens, trim_messages
+
+
+def test_context_window():
+    assert context_window("gpt-4") == 8192
+    assert context_window("gpt-4-32k-0613") == 32768
+    assert context_window("gpt-3.5-turbo-16k") == 16384
+    assert context_window("unknown-model") == 4096
+
+
+def test_trim_messages_keeps_system_and_latest():
+    long = "word " * 1000
+    messages = ([{'role': 'system', 'content': 'Be brief.'}] +
+                [{'role': 'user', 'content': long} for _ in range(6)] +
+                [{'role': 'user', 'content': 'latest'}])
+    removed = trim_messages(messages, "gpt-3.5-turbo", reserve_tokens=1024)
+
+    assert removed > 0
+    assert messages[0]['role'] == 'system'
+    assert messages[-1]['content'] == 'latest'
+    assert count_message_tokens(messages, "gpt-3.5-turbo") <= 4096 - 1024
+
+
+def test_trim_messages_leaves_short_history_alone():
+    messages = [{'role': 'user', 'content': 'hi'}, {'role': 'assistant', 'content': 'hello'}]
+    assert trim_messages(messages, "gpt-4") == 0
+    assert len(messages) == 2
+
+
+def test_trim_messages_rejects_oversized_message():
+    with pytest.raises(ValueError):
+        trim_messages([{'role': 'user', 'content': "word " * 20000}], "gpt-4")
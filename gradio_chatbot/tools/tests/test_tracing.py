@@ -0,0 +1,78 @@
+import asyncio
+import json
+import urllib.request
+import openai
+import pytest
+from tools import clients
+from tools.tracing import Metrics, Tracer, start_metrics_server, traced, tracer
+
+
+def test_spans_nest_and_export(tmp_path):
+    trace_file = tmp_path / "traces.jsonl"
+    spans = Tracer(str(trace_file))
+    with spans.span("outer", model="gpt-4") as outer:
+        with spans.span("inner") as inner:
+            spans.record_tokens("gpt-4", prompt_tokens=10, completion_tokens=5)
+        with pytest.raises(ValueError):
+            with spans.span("failing"):
+                raise ValueError("boom")
+    records = [json.loads(line) for line in trace_file.read_text().splitlines()]
+    assert [r['name'] for r in records] == ["inner", "failing", "outer"]
+    assert records[0]['parent_id'] == outer.span_id
+    assert records[0]['trace_id'] == records[2]['trace_id']
+    assert records[0]['attributes'] == {'prompt_tokens': 10, 'completion_tokens': 5}
+    assert records[1]['status'] == "error" and "boom" in records[1]['attributes']['error']
+    assert spans.metrics.value("chatbot_tokens_total", model="gpt-4", kind="prompt") == 10
+    assert spans.metrics.value("chatbot_errors_total", span="failing") == 1
+    assert spans.current_span() is None
+
+
+def test_traced_async_generator_records_cancellation():
+    @traced("handler.stream")
+    async def stream():
+        for i in range(3):
+            yield i
+
+    async def take_one():
+        updates = stream()
+        first = await updates.__anext__()
+        await updates.aclose()
+        return first
+
+    before = tracer.metrics.histograms.get("chatbot_span_duration_seconds", {}).copy()
+    assert asyncio.run(take_one()) == 0
+    after = tracer.metrics.histograms["chatbot_span_duration_seconds"]
+    key = (('span', "handler.stream"), ('status', "cancelled"))
+    assert after[key][2] == before.get(key, (None, None, 0))[2] + 1
+
+
+def test_retries_are_counted(monkeypatch):
+    monkeypatch.setattr(clients.time, "sleep", lambda s: None)
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise openai.error.RateLimitError("slow down")
+        return "ok"
+
+    with tracer.span("caller") as span:
+        clients.with_retries(flaky)
+    assert span.attributes['retries'] == 2
+
+
+def test_metrics_endpoint():
+    metrics = Metrics(buckets=(0.1, 1.0))
+    metrics.inc("chatbot_cache_requests_total", 3, help="Cache lookups", cache="embedding", result="hit")
+    metrics.observe("chatbot_span_duration_seconds", 0.5, help="Durations", span="x", status="ok")
+    server = start_metrics_server(0, host="127.0.0.1", metrics=metrics)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        body = urllib.request.urlopen(url).read().decode('utf-8')
+    finally:
+        server.shutdown()
+    assert '# TYPE chatbot_cache_requests_total counter' in body
+    assert 'chatbot_cache_requests_total{cache="embedding",result="hit"} 3' in body
+    assert 'chatbot_span_duration_seconds_bucket{span="x",status="ok",le="0.1"} 0' in body
+    assert 'chatbot_span_duration_seconds_bucket{span="x",status="ok",le="1.0"} 1' in body
+    assert 'chatbot_span_duration_seconds_count{span="x",status="ok"} 1' in body
@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+from tools.vector_index import LocalIndex, open_index
+
+
+def make_vectors(n, dim=8, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.normal(size=(n, dim)).astype(np.float32)
+
+
+@pytest.mark.parametrize("dtype", ["float32", "float16", "int8"])
+def test_query_matches_brute_force(tmp_path, dtype):
+    vectors = make_vectors(50)
+    index = LocalIndex(str(tmp_path / "idx"), dtype=dtype)
+    index.upsert([(f"doc-{i}", v.tolist(), {'document': 'doc', 'text': str(i)})
+                  for i, v in enumerate(vectors)])
+
+    query = vectors[7] + 0.01
+    result = index.query(query.tolist(), top_k=3, include_metadata=True)
+
+    normed = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    expected = np.argsort(-(normed @ (query / np.linalg.norm(query))))[:3]
+    assert [m['id'] for m in result['matches']][0] == "doc-7"
+    assert [m['id'] for m in result['matches']] == [f"doc-{i}" for i in expected]
+    assert result['matches'][0]['metadata']['text'] == "7"
+
+    # Scores are cosine similarities whatever the storage type
+    itself = index.query(vectors[7].tolist(), top_k=1)['matches'][0]
+    assert itself['score'] == pytest.approx(1.0, abs=0.01)
+
+
+def test_filter_and_delete(tmp_path):
+    vectors = make_vectors(20)
+    index = LocalIndex(str(tmp_path / "idx"))
+    index.upsert([(f"a-{i}", vectors[i].tolist(), {'document': 'a'}) for i in range(10)])
+    index.upsert([(f"b-{i}", vectors[10 + i].tolist(), {'document': 'b'}) for i in range(10)])
+
+    result = index.query(vectors[0].tolist(), top_k=5, filter={'document': {'$eq': 'b'}})
+    assert len(result['matches']) == 5
+    assert all(m['id'].startswith("b-") for m in result['matches'])
+
+    result = index.query(vectors[0].tolist(), top_k=20, filter={'document': {'$in': ['a', 'c']}})
+    assert sorted(m['id'] for m in result['matches']) == sorted(f"a-{i}" for i in range(10))
+    assert index.query(vectors[0].tolist(), filter={'document': 'c'})['matches'] == []
+
+    assert index.delete(filter={'document': 'a'})['deleted_count'] == 10
+    assert index.delete(ids=["b-0", "b-1", "missing"])['deleted_count'] == 2
+    result = index.query(vectors[0].tolist(), top_k=20)
+    assert sorted(m['id'] for m in result['matches']) == [f"b-{i}" for i in range(2, 10)]
+    assert index.fetch(["a-0"])['vectors'] == {}
+
+
+def test_reopen_and_grow(tmp_path):
+    path = str(tmp_path / "idx")
+    vectors = make_vectors(1500)
+    index = LocalIndex(path, dtype="float16")
+    index.upsert([(f"v-{i}", v.tolist(), {'document': 'v'}) for i, v in enumerate(vectors)])
+    index.upsert([("v-3", vectors[4].tolist(), {'document': 'w'})])
+
+    reopened = LocalIndex(path)
+    assert reopened.dtype == "float16"
+    assert reopened.dimension == 8
+    result = reopened.query(vectors[4].tolist(), top_k=2, include_metadata=True)
+    assert {m['id'] for m in result['matches']} == {"v-3", "v-4"}
+    fetched = reopened.fetch(["v-3"])['vectors']["v-3"]
+    assert fetched['metadata'] == {'document': 'w'}
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        open_index("elastic", "idx")
+
+
+def test_remote_index_retries_rate_limits(tmp_path, monkeypatch):
+    from pinecone.core.client.exceptions import ApiException, NotFoundException
+    from tools import clients
+    from tools.vector_index import RemoteIndex
+
+    monkeypatch.setattr(clients.time, "sleep", lambda s: None)
+    local = LocalIndex(str(tmp_path / "idx"))
+    local.upsert([("a", [1.0, 0.0], {'document': 'd'})])
+    errors = [ApiException(status=429, reason="slow down"), ApiException(status=503, reason="busy")]
+
+    class Flaky:
+        def query(self, *args, **kwargs):
+            if errors:
+                raise errors.pop(0)
+            return local.query(*args, **kwargs)
+
+        def delete(self, *args, **kwargs):
+            raise NotFoundException(status=404, reason="no such index")
+
+    index = RemoteIndex(Flaky())
+    assert index.query([1.0, 0.0], top_k=1)['matches'][0]['id'] == "a"
+    assert errors == []
+    with pytest.raises(NotFoundException):
+        index.delete(ids=["a"])
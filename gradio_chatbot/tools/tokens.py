@@ -0,0 +1,136 @@
+"""
+tokens.py
+
+This module counts tokens the way the OpenAI models do. tiktoken is used
+when it is available; otherwise a characters-per-token estimate is used.
+"""
+
+from functools import lru_cache
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model):
+    """
+    Returns the tiktoken encoding for a model, or None when tiktoken (or
+    its downloaded encoding files) are not available.
+    """
+    if tiktoken is None:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # tiktoken fetches encodings on first use, which fails offline
+        return None
+
+
+def count_tokens(text, model="gpt-3.5-turbo"):
+    """
+    Returns the number of tokens in text for the given model.
+
+    Parameters
+    ----------
+    text : str
+        The text to count.
+    model : str, optional
+        The model whose tokenizer to use (default is "gpt-3.5-turbo").
+
+    Returns
+    -------
+    int
+        The token count (an estimate of 4 characters per token when
+        tiktoken is not installed).
+    """
+    encoding = get_encoding(model)
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+# Context window (prompt + completion tokens) of the chat models we use
+MODEL_CONTEXT_WINDOWS = {
+    'gpt-3.5-turbo': 4096,
+    'gpt-3.5-turbo-16k': 16384,
+    'gpt-4': 8192,
+    'gpt-4-32k': 32768,
+    'gpt-4o': 128000,
+}
+
+# Tokens added by the chat format for each message and to prime the reply
+TOKENS_PER_MESSAGE = 4
+TOKENS_PER_REPLY = 3
+
+
+def context_window(model):
+    """
+    Returns the context window of a model, matching dated variants
+    (e.g. "gpt-4-0613") by their longest known prefix.
+    """
+    matches = [name for name in MODEL_CONTEXT_WINDOWS if model.startswith(name)]
+    if not matches:
+        return MODEL_CONTEXT_WINDOWS['gpt-3.5-turbo']
+    return MODEL_CONTEXT_WINDOWS[max(matches, key=len)]
+
+
+def count_message_tokens(messages, model="gpt-3.5-turbo"):
+    """
+    Returns the number of prompt tokens a list of chat messages will use.
+    """
+    return TOKENS_PER_REPLY + sum(TOKENS_PER_MESSAGE + count_tokens(m['content'], model)
+                                  for m in messages)
+
+
+def trim_messages(messages, model="gpt-3.5-turbo", reserve_tokens=None):
+    """
+    Removes the oldest messages until the history fits the model's window.
+
+    System messages and the latest message are pinned; the other messages
+    are removed oldest first. The list is modified in place.
+
+    Parameters
+    ----------
+    messages : list
+        The message history list
+    model : str, optional
+        The GPT model the messages will be sent to (default is "gpt-3.5-turbo").
+    reserve_tokens : int, optional
+        Tokens to leave for the completion (default is a quarter of the
+        window, at most 1024).
+
+    Returns
+    -------
+    int
+        The number of messages removed.
+
+    Raises
+    ------
+    ValueError
+        If the pinned messages alone do not fit.
+    """
+    window = context_window(model)
+    if reserve_tokens is None:
+        reserve_tokens = min(1024, window // 4)
+    budget = window - reserve_tokens
+    sizes = [TOKENS_PER_MESSAGE + count_tokens(m['content'], model) for m in messages]
+    total = TOKENS_PER_REPLY + sum(sizes)
+
+    # Walk from the oldest message, skipping the pinned ones
+    removable = [i for i, m in enumerate(messages[:-1]) if m['role'] != 'system']
+    remove = set()
+    for i in removable:
+        if total <= budget:
+            break
+        remove.add(i)
+        total -= sizes[i]
+    if total > budget:
+        raise ValueError(f"The message is too long for {model} "
+                         f"({total} tokens, {budget} available for the prompt).")
+    messages[:] = [m for i, m in enumerate(messages) if i not in remove]
+    return len(remove)
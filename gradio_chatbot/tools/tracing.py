@@ -0,0 +1,276 @@
+"""
+tracing.py
+
+This module records where the time goes in the chatbot: spans with
+durations and attributes (token counts, retries, cache hits) around the
+handlers, ChatGPT calls and library operations. Finished spans update
+Prometheus-style metrics, served as text by start_metrics_server(), and
+can be exported as JSON lines (CHATBOT_TRACE_FILE).
+"""
+
+import asyncio
+import functools
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger("grchatbot")
+
+# Upper bounds (seconds) of the span duration histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Metrics:
+    """
+    Counters and histograms with labels, rendered in the Prometheus text format.
+
+    Methods
+    -------
+    inc(name, value=1, help="", **labels):
+        Adds to a counter.
+    observe(name, value, help="", **labels):
+        Records a value in a histogram.
+    render():
+        Returns all metrics in the Prometheus text exposition format.
+    """
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.help = {}
+
+    def inc(self, name, value=1, help="", **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.help.setdefault(name, help)
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, value, help="", **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.help.setdefault(name, help)
+            series = self.histograms.setdefault(name, {})
+            (counts, total, count) = series.get(key, ([0] * len(self.buckets), 0.0, 0))
+            counts = [c + (value <= bound) for (c, bound) in zip(counts, self.buckets)]
+            series[key] = (counts, total + value, count + 1)
+
+    def value(self, name, **labels):
+        # Current value of a counter series (0 if it was never incremented)
+        return self.counters.get(name, {}).get(tuple(sorted(labels.items())), 0)
+
+    def render(self):
+        def format_labels(key, extra=()):
+            pairs = list(key) + list(extra)
+            if not pairs:
+                return ""
+            escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for (_, v) in pairs)
+            return "{" + ",".join(f'{k}="{v}"' for ((k, _), v) in zip(pairs, escaped)) + "}"
+
+        lines = []
+        with self.lock:
+            for (name, series) in sorted(self.counters.items()):
+                lines += [f"# HELP {name} {self.help[name]}", f"# TYPE {name} counter"]
+                lines += [f"{name}{format_labels(key)} {value}" for (key, value) in sorted(series.items())]
+            for (name, series) in sorted(self.histograms.items()):
+                lines += [f"# HELP {name} {self.help[name]}", f"# TYPE {name} histogram"]
+                for (key, (counts, total, count)) in sorted(series.items()):
+                    for (bound, c) in zip(self.buckets, counts):
+                        lines.append(f"{name}_bucket{format_labels(key, [('le', bound)])} {c}")
+                    lines.append(f"{name}_bucket{format_labels(key, [('le', '+Inf')])} {count}")
+                    lines.append(f"{name}_sum{format_labels(key)} {total}")
+                    lines.append(f"{name}_count{format_labels(key)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+class Span:
+    """
+    One timed operation with free-form attributes (model, token counts,
+    retries, cache hits...).
+    """
+
+    def __init__(self, name, parent=None, **attributes):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = attributes
+        self.status = "ok"
+        self.start = time.time()
+        self.started = time.perf_counter()
+        self.duration = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add(self, name, value=1):
+        self.attributes[name] = self.attributes.get(name, 0) + value
+
+    def to_dict(self):
+        return {'trace_id': self.trace_id, 'span_id': self.span_id, 'parent_id': self.parent_id,
+                'name': self.name, 'start': self.start, 'duration': self.duration,
+                'status': self.status, 'attributes': self.attributes}
+
+
+class Tracer:
+    """
+    Creates spans, turns finished spans into metrics and optionally writes
+    them as JSON lines.
+
+    Attributes
+    ----------
+    metrics : Metrics
+        The metrics updated by finished spans.
+    trace_file : str
+        File the finished spans are appended to (None to not export).
+    """
+
+    def __init__(self, trace_file=None):
+        self.metrics = Metrics()
+        self.trace_file = trace_file
+        self.file_lock = threading.Lock()
+        self.current = ContextVar("span", default=None)
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """
+        Times the block as a span (a child of the current span, if any).
+        """
+        span = Span(name, self.current.get(), **attributes)
+        token = self.current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            cancelled = isinstance(e, (GeneratorExit, KeyboardInterrupt, asyncio.CancelledError))
+            span.status = "cancelled" if cancelled else "error"
+            if span.status == "error":
+                span.set(error=f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            try:
+                self.current.reset(token)
+            except ValueError:
+                # Streaming handlers may resume in another context than they started in
+                self.current.set(None)
+            self.finish(span)
+
+    def finish(self, span):
+        span.duration = time.perf_counter() - span.started
+        self.metrics.observe("chatbot_span_duration_seconds", span.duration,
+                             help="Duration of each pipeline stage", span=span.name, status=span.status)
+        if span.status == "error":
+            self.metrics.inc("chatbot_errors_total", help="Failed pipeline stages", span=span.name)
+        if self.trace_file:
+            line = json.dumps(span.to_dict(), default=str)
+            with self.file_lock:
+                with open(self.trace_file, "a") as file:
+                    file.write(line + "\n")
+
+    def current_span(self):
+        return self.current.get()
+
+    def annotate(self, **attributes):
+        # Sets attributes on the current span (if any)
+        span = self.current.get()
+        if span is not None:
+            span.set(**attributes)
+
+    def record_tokens(self, model, **counts):
+        # counts are prompt_tokens, completion_tokens or embedding_tokens
+        span = self.current.get()
+        for (kind, value) in counts.items():
+            if value:
+                self.metrics.inc("chatbot_tokens_total", value, help="Tokens sent to and received from models",
+                                 model=model, kind=kind.replace("_tokens", ""))
+                if span is not None:
+                    span.add(kind, value)
+
+    def record_retry(self, endpoint, error):
+        self.metrics.inc("chatbot_retries_total", help="Retried API calls", endpoint=endpoint,
+                         error=type(error).__name__)
+        span = self.current.get()
+        if span is not None:
+            span.add('retries')
+
+    def record_cache(self, cache, hits, misses):
+        if hits:
+            self.metrics.inc("chatbot_cache_requests_total", hits, help="Cache lookups", cache=cache, result="hit")
+        if misses:
+            self.metrics.inc("chatbot_cache_requests_total", misses, help="Cache lookups", cache=cache, result="miss")
+        span = self.current.get()
+        if span is not None:
+            span.add(f"{cache}_cache_hits", hits)
+            span.add(f"{cache}_cache_misses", misses)
+
+    def record_exception(self, error):
+        # Logs an error a handler turned into a chat message, and marks its span
+        logger.error("%s: %s", type(error).__name__, error, exc_info=error)
+        span = self.current.get()
+        if span is not None:
+            span.status = "error"
+            span.set(error=f"{type(error).__name__}: {error}")
+
+
+# The process-wide tracer (export spans by setting CHATBOT_TRACE_FILE)
+tracer = Tracer(os.getenv("CHATBOT_TRACE_FILE"))
+
+
+def traced(name):
+    """
+    Decorates a function, coroutine or async generator to run in a span.
+    """
+    def decorator(fn):
+        if inspect.isasyncgenfunction(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                with tracer.span(name):
+                    async for item in fn(*args, **kwargs):
+                        yield item
+        elif inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                with tracer.span(name):
+                    return await fn(*args, **kwargs)
+        else:
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with tracer.span(name):
+                    return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def start_metrics_server(port, host="0.0.0.0", metrics=None):
+    """
+    Serves the metrics at http://host:port/metrics from a daemon thread and
+    returns the server.
+    """
+    metrics = metrics or tracer.metrics
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
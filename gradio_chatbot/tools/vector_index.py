@@ -0,0 +1,564 @@
+"""
+vector_index.py
+
+This module provides the vector index backends used by PineconeManager.
+Every backend exposes the same upsert/query/delete/fetch surface as a
+pinecone.Index, so the manager does not need to know where the section
+embeddings are stored.
+"""
+
+import os
+import json
+import sqlite3
+import threading
+import time
+from functools import wraps
+
+import numpy as np
+
+from tools.clients import BULK, CHAT, HTTP_POOL_SIZE, limiter, with_retries
+
+
+def match_filter(metadata, filter):
+    """
+    Checks a metadata dict against a pinecone-style filter.
+
+    Only equality is supported, either as {'document': 'a.txt'} or as
+    {'document': {'$eq': 'a.txt'}}, which is all the chatbot uses
+    (LocalIndex also takes {'document': {'$in': [...]}}).
+    """
+    if not filter:
+        return True
+    for key, value in filter.items():
+        if isinstance(value, dict):
+            value = value.get('$eq')
+        if metadata.get(key) != value:
+            return False
+    return True
+
+
+def synchronized(method):
+    """
+    Runs a LocalIndex method under the index lock (uploads run in threads).
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class LocalIndex:
+    """
+    An in-process vector index stored in a memory-mapped NumPy matrix.
+
+    Vectors are normalized on insert so cosine similarity is a single
+    matrix-vector product, and the top-k slots are found with argpartition.
+    Ids and metadata are kept in a small SQLite file next to the matrix.
+
+    Attributes
+    ----------
+    path : str
+        Path prefix for the index files ("<path>.npy", "<path>.db", ...).
+    dtype : str
+        Storage type of the matrix: "float32", "float16" or "int8".
+
+    Methods
+    -------
+    upsert(vectors):
+        Inserts or replaces (id, values, metadata) tuples.
+    query(vector, top_k=5, filter=None, include_metadata=False):
+        Returns the top_k matches by cosine similarity.
+    fetch(ids):
+        Returns the stored vectors for the given ids.
+    delete(ids=None, filter=None):
+        Deletes vectors by id list or metadata filter.
+    """
+
+    DTYPES = ('float32', 'float16', 'int8')
+    # Rows converted to float32 at a time when scoring a query
+    SCORE_BLOCK_ROWS = 1024
+
+    def __init__(self, path, dimension=None, dtype="float32"):
+        if dtype not in self.DTYPES:
+            raise ValueError(f"Unsupported dtype '{dtype}', expected one of {self.DTYPES}")
+        self.path = path
+        self.dtype = dtype
+        self.lock = threading.RLock()
+        self.matrix_file = f"{path}.npy"
+        self.scale_file = f"{path}.scale.npy"
+        self.db = sqlite3.connect(f"{path}.db", check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS vectors "
+            "(slot INTEGER PRIMARY KEY, id TEXT UNIQUE, document TEXT, metadata TEXT)")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT)")
+        self.db.commit()
+
+        # The stored dtype and dimension win over the requested ones
+        settings = dict(self.db.execute("SELECT key, value FROM settings"))
+        if 'dtype' in settings:
+            self.dtype = settings['dtype']
+        self.dimension = int(settings['dimension']) if 'dimension' in settings else dimension
+
+        self.matrix = None
+        self.scale = None
+        if os.path.exists(self.matrix_file):
+            self.matrix = np.load(self.matrix_file, mmap_mode='r+')
+            if self.dtype == 'int8':
+                self.scale = np.load(self.scale_file, mmap_mode='r+')
+
+        # Keep slot lookups in memory, the metadata itself stays in SQLite
+        self.slots = {}
+        self.ids = {}
+        # Each slot's document as a code (-1 for none), so filters are one comparison
+        self.document_codes = {}
+        capacity = 0 if self.matrix is None else self.matrix.shape[0]
+        self.codes = np.full(capacity, -1, dtype=np.int32)
+        for (slot, id, document) in self.db.execute("SELECT slot, id, document FROM vectors"):
+            self.slots[id] = slot
+            self.ids[slot] = id
+            self.codes[slot] = self._document_code(document)
+        self.valid = np.zeros(capacity, dtype=bool)
+        if self.slots:
+            self.valid[list(self.slots.values())] = True
+        # Free slots are popped from the end, so keep the lowest slots last
+        self.free = [int(s) for s in np.flatnonzero(~self.valid)[::-1]]
+
+    def _create(self, dimension, capacity):
+        # (Re)allocate the memmap, copying over any existing rows
+        np_dtype = np.dtype(self.dtype)
+        matrix = np.lib.format.open_memmap(self.matrix_file + ".tmp", mode='w+',
+                                           dtype=np_dtype, shape=(capacity, dimension))
+        scale = None
+        if self.dtype == 'int8':
+            scale = np.lib.format.open_memmap(self.scale_file + ".tmp", mode='w+',
+                                              dtype=np.float32, shape=(capacity,))
+        if self.matrix is not None:
+            rows = self.matrix.shape[0]
+            matrix[:rows] = self.matrix
+            if scale is not None:
+                scale[:rows] = self.scale
+        matrix.flush()
+        del matrix
+        os.replace(self.matrix_file + ".tmp", self.matrix_file)
+        self.matrix = np.load(self.matrix_file, mmap_mode='r+')
+        if scale is not None:
+            scale.flush()
+            del scale
+            os.replace(self.scale_file + ".tmp", self.scale_file)
+            self.scale = np.load(self.scale_file, mmap_mode='r+')
+        old = len(self.valid)
+        self.valid = np.concatenate([self.valid, np.zeros(capacity - old, dtype=bool)])
+        self.codes = np.concatenate([self.codes, np.full(capacity - old, -1, dtype=np.int32)])
+        self.free = list(range(capacity - 1, old - 1, -1)) + self.free
+        if self.dimension is None:
+            self.dimension = dimension
+        self.db.executemany("INSERT OR REPLACE INTO settings VALUES (?, ?)",
+                            [('dimension', str(self.dimension)), ('dtype', self.dtype)])
+        self.db.commit()
+
+    def _document_code(self, document):
+        if document is None:
+            return -1
+        return self.document_codes.setdefault(document, len(self.document_codes))
+
+    def _encode(self, values):
+        # Normalize the vectors and convert them to the storage type
+        values = np.asarray(values, dtype=np.float32)
+        norms = np.linalg.norm(values, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        values = values / norms
+        if self.dtype == 'int8':
+            scale = np.abs(values).max(axis=1) / 127.0
+            scale[scale == 0] = 1.0
+            return np.round(values / scale[:, None]).astype(np.int8), scale
+        return values.astype(self.dtype), None
+
+    def _decode(self, slots):
+        rows = self.matrix[slots].astype(np.float32)
+        if self.dtype == 'int8':
+            rows *= self.scale[slots][:, None]
+        return rows
+
+    @synchronized
+    def upsert(self, vectors):
+        """
+        Inserts or replaces vectors.
+
+        Parameters
+        ----------
+        vectors : list
+            A list of (id, values, metadata) tuples, as for pinecone.Index.upsert.
+
+        Returns
+        -------
+        dict
+            {'upserted_count': n}
+        """
+        if not vectors:
+            return {'upserted_count': 0}
+        ids = [v[0] for v in vectors]
+        values = [v[1] for v in vectors]
+        metadata = [v[2] if len(v) > 2 else {} for v in vectors]
+        dimension = len(values[0])
+        if self.dimension is not None and dimension != self.dimension:
+            raise ValueError(f"Vector dimension {dimension} does not match index dimension {self.dimension}")
+
+        # Reuse existing slots for known ids and grow the matrix if needed
+        needed = sum(1 for id in set(ids) if id not in self.slots)
+        if self.matrix is None or needed > len(self.free):
+            capacity = 0 if self.matrix is None else self.matrix.shape[0]
+            self._create(dimension, max(1024, 2 * capacity, capacity + needed))
+        slots = []
+        for id in ids:
+            if id not in self.slots:
+                slot = self.free.pop()
+                self.slots[id] = slot
+                self.ids[slot] = id
+            slots.append(self.slots[id])
+
+        encoded, scale = self._encode(values)
+        self.matrix[slots] = encoded
+        if scale is not None:
+            self.scale[slots] = scale
+        self.matrix.flush()
+        self.valid[slots] = True
+        self.codes[slots] = [self._document_code(meta.get('document')) for meta in metadata]
+        self.db.executemany(
+            "INSERT OR REPLACE INTO vectors VALUES (?, ?, ?, ?)",
+            [(slot, id, meta.get('document'), json.dumps(meta))
+             for (slot, id, meta) in zip(slots, ids, metadata)])
+        self.db.commit()
+        return {'upserted_count': len(vectors)}
+
+    def _filter_mask(self, filter):
+        mask = self.valid.copy()
+        if filter:
+            other = {k: v for k, v in filter.items() if k != 'document'}
+            if 'document' in filter:
+                document = filter['document']
+                if isinstance(document, dict):
+                    documents = document['$in'] if '$in' in document else [document.get('$eq')]
+                else:
+                    documents = [document]
+                codes = [self.document_codes[d] for d in documents if d in self.document_codes]
+                mask &= np.isin(self.codes, codes)
+            if other:
+                for slot in np.flatnonzero(mask):
+                    if not match_filter(self._metadata([int(slot)])[int(slot)], other):
+                        mask[slot] = False
+        return mask
+
+    def _scores(self, query, slots=None):
+        # Cosine similarity of the query with the rows (all, or the given
+        # slots), upcasting SCORE_BLOCK_ROWS rows at a time so a float16 or
+        # int8 matrix is never copied whole to float32
+        count = self.matrix.shape[0] if slots is None else len(slots)
+        scores = np.empty(count, dtype=np.float32)
+        for start in range(0, count, self.SCORE_BLOCK_ROWS):
+            end = min(start + self.SCORE_BLOCK_ROWS, count)
+            rows = slice(start, end) if slots is None else slots[start:end]
+            scores[start:end] = self.matrix[rows].astype(np.float32, copy=False) @ query
+            if self.dtype == 'int8':
+                scores[start:end] *= self.scale[rows]
+        return scores
+
+    def _metadata(self, slots):
+        if not slots:
+            return {}
+        marks = ','.join('?' * len(slots))
+        rows = self.db.execute(
+            f"SELECT slot, metadata FROM vectors WHERE slot IN ({marks})", slots)
+        return {slot: json.loads(meta) for (slot, meta) in rows}
+
+    @synchronized
+    def query(self, vector, top_k=5, filter=None, include_metadata=False):
+        """
+        Finds the top_k most similar vectors by cosine similarity.
+
+        Parameters
+        ----------
+        vector : list
+            The query embedding.
+        top_k : int, optional
+            Number of matches to return (default is 5).
+        filter : dict, optional
+            Metadata equality filter (e.g. {'document': 'a.txt'}).
+        include_metadata : bool, optional
+            Whether to return each match's metadata (default is False).
+
+        Returns
+        -------
+        dict
+            {'matches': [{'id', 'score', 'metadata'}, ...]} sorted by score.
+        """
+        top_k = int(top_k)
+        if self.matrix is None or top_k <= 0:
+            return {'matches': []}
+        # Only stored rows are quantized: the query stays normalized float32
+        # and int8 rows' scales are applied to their scores
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        query = query / norm if norm else query
+        mask = self._filter_mask(filter)
+        candidates = np.flatnonzero(mask)
+        if len(candidates) == 0:
+            return {'matches': []}
+
+        # Score only the candidates when the filter is selective, else every row
+        if len(candidates) * 4 < len(mask):
+            scores = self._scores(query, candidates)
+        else:
+            scores = self._scores(query)[candidates]
+
+        k = min(top_k, len(candidates))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        slots = [int(s) for s in candidates[best]]
+        metadata = self._metadata(slots) if include_metadata else {}
+
+        matches = []
+        for slot, score in zip(slots, scores[best]):
+            match = {'id': self.ids[slot], 'score': float(score)}
+            if include_metadata:
+                match['metadata'] = metadata.get(slot, {})
+            matches.append(match)
+        return {'matches': matches}
+
+    @synchronized
+    def fetch(self, ids):
+        """
+        Returns the stored (normalized) vectors and metadata for ids.
+
+        Parameters
+        ----------
+        ids : list
+            The vector ids to fetch.
+
+        Returns
+        -------
+        dict
+            {'vectors': {id: {'id', 'values', 'metadata'}}} for the ids found.
+        """
+        found = [id for id in ids if id in self.slots]
+        slots = [self.slots[id] for id in found]
+        metadata = self._metadata(slots)
+        vectors = {}
+        if found:
+            rows = self._decode(slots)
+            for id, slot, row in zip(found, slots, rows):
+                vectors[id] = {'id': id, 'values': row.tolist(), 'metadata': metadata.get(slot, {})}
+        return {'vectors': vectors}
+
+    @synchronized
+    def delete(self, ids=None, filter=None):
+        """
+        Deletes vectors by id list and/or metadata filter.
+
+        Parameters
+        ----------
+        ids : list, optional
+            The vector ids to delete.
+        filter : dict, optional
+            Metadata equality filter selecting the vectors to delete.
+
+        Returns
+        -------
+        dict
+            {'deleted_count': n}
+        """
+        slots = set()
+        if ids:
+            slots.update(self.slots[id] for id in ids if id in self.slots)
+        if filter:
+            slots.update(int(s) for s in np.flatnonzero(self._filter_mask(filter)))
+        if not slots:
+            return {'deleted_count': 0}
+        slots = sorted(slots)
+        self.valid[slots] = False
+        for slot in slots:
+            del self.slots[self.ids.pop(slot)]
+        self.codes[slots] = -1
+        self.free.extend(reversed(slots))
+        self.db.executemany("DELETE FROM vectors WHERE slot = ?", [(s,) for s in slots])
+        self.db.commit()
+        return {'deleted_count': len(slots)}
+
+
+class RemoteIndex:
+    """
+    Wraps a remote pinecone.Index-like client so every call goes through the
+    shared rate limiter (queries ahead of bulk writes) and is retried with
+    backoff on rate limits and transient failures (see clients.is_retryable).
+
+    Attributes
+    ----------
+    index_instance : pinecone.Index
+        The wrapped client.
+    """
+
+    def __init__(self, index_instance):
+        self.index_instance = index_instance
+
+    def _call(self, method, priority, *args, **kwargs):
+        def attempt():
+            # Every attempt, retries included, waits for the limiter
+            limiter.acquire('pinecone', priority=priority)
+            return getattr(self.index_instance, method)(*args, **kwargs)
+
+        attempt.__qualname__ = f"pinecone.{method}"
+        return with_retries(attempt)
+
+    def query(self, *args, **kwargs):
+        return self._call('query', CHAT, *args, **kwargs)
+
+    def fetch(self, *args, **kwargs):
+        return self._call('fetch', BULK, *args, **kwargs)
+
+    def upsert(self, *args, **kwargs):
+        return self._call('upsert', BULK, *args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        return self._call('delete', BULK, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.index_instance, name)
+
+
+class PineconeIndex(RemoteIndex):
+    """
+    The hosted Pinecone index, created on first use if it does not exist.
+
+    pinecone.Index already provides upsert/query/delete/fetch, so this class
+    only handles connecting and creating the index; RemoteIndex rate limits
+    and retries each call.
+
+    When config holds a recent check of the index (see VERIFY_TTL), the
+    client is configured from it without pinecone.init(), which always asks
+    the service for the project name, so connecting makes no network calls.
+    If the cached index turns out to be missing (a not found error, or its
+    host no longer resolving), it is checked (and created) and the call
+    retried once.
+    """
+
+    # Seconds a successful check that the index exists is trusted
+    VERIFY_TTL = 24 * 3600
+
+    def __init__(self, index_name, api_key=None, environment=None, dimension_fn=None,
+                 config=None, save_config=None):
+        import pinecone
+
+        self.index_name = index_name
+        self.api_key = api_key
+        self.environment = environment
+        self.dimension_fn = dimension_fn
+        self.config = config if config is not None else {}
+        self.save_config = save_config
+        self.cached = bool(self.config.get('index_name') == index_name
+                           and self.config.get('environment') == environment
+                           and self.config.get('project_name')
+                           and time.time() - self.config.get('verified', 0) < self.VERIFY_TTL)
+        if self.cached:
+            self.configure(self.config['project_name'])
+        else:
+            self.verify()
+
+        # Create the index instance for later operations
+        super().__init__(pinecone.Index(index_name=index_name))
+
+    def openapi_config(self):
+        # A connection pool sized like the openai one
+        from pinecone.core.client.configuration import Configuration
+
+        openapi_config = Configuration()
+        openapi_config.connection_pool_maxsize = HTTP_POOL_SIZE
+        return openapi_config
+
+    def configure(self, project_name):
+        # What pinecone.init() sets up, minus its whoami call (Index only
+        # needs the key, environment and project name to reach the index).
+        # This sets pinecone-client 2.x internals (the version requirements.txt
+        # pins); a client without them gets the public pinecone.init(), which
+        # takes the project name but still makes the whoami call
+        import pinecone
+
+        if not (hasattr(pinecone.Config, '_get_socket_options')
+                and hasattr(getattr(pinecone.Config, '_config', None), '_replace')):
+            pinecone.init(api_key=self.api_key, environment=self.environment, project_name=project_name,
+                          openapi_config=self.openapi_config())
+            return
+        openapi_config = self.openapi_config()
+        openapi_config.socket_options = pinecone.Config._get_socket_options()
+        pinecone.Config._config = pinecone.Config._config._replace(
+            api_key=self.api_key or os.getenv("PINECONE_API_KEY") or "",
+            environment=self.environment or os.getenv("PINECONE_ENVIRONMENT") or "us-west1-gcp",
+            project_name=project_name, openapi_config=openapi_config)
+
+    def verify(self):
+        import pinecone
+
+        pinecone.init(api_key=self.api_key, environment=self.environment,
+                      openapi_config=self.openapi_config())
+        # Check if the index exists and create it if it doesn't
+        indexes = pinecone.list_indexes()
+        print(indexes)
+        if self.index_name not in indexes:
+            print("NOTE: Creating pinecone index. This will take 30-60 seconds.")
+            pinecone.create_index(
+                self.index_name,
+                dimension=self.dimension_fn(),
+                metric='cosine',
+                metadata_config={'indexed': ['document']})
+        self.config.update(index_name=self.index_name, environment=self.environment,
+                           project_name=pinecone.Config.PROJECT_NAME, verified=time.time())
+        if self.save_config is not None:
+            self.save_config(self.config)
+
+    def _call(self, method, priority, *args, **kwargs):
+        import pinecone
+        from pinecone import PineconeProtocolError
+        from pinecone.core.client.exceptions import NotFoundException
+        from urllib3.exceptions import MaxRetryError
+
+        try:
+            return super()._call(method, priority, *args, **kwargs)
+        except (NotFoundException, MaxRetryError, PineconeProtocolError):
+            # A deleted index fails at connect (its host is gone) or with a
+            # not found: if the index came from the cache, check it again and retry once
+            if not self.cached:
+                raise
+            self.cached = False
+            self.verify()
+            self.index_instance = pinecone.Index(index_name=self.index_name)
+            return super()._call(method, priority, *args, **kwargs)
+
+
+def open_index(backend, index_name, api_key=None, environment=None, dimension_fn=None,
+               config=None, save_config=None):
+    """
+    Opens the vector index for the named backend.
+
+    Parameters
+    ----------
+    backend : str
+        "pinecone" for the hosted service or "local" for a LocalIndex.
+        Local storage type can be chosen with a suffix ("local-float16",
+        "local-int8").
+    index_name : str
+        The index name (used as the file prefix for local indexes).
+    api_key, environment : str, optional
+        Pinecone credentials.
+    dimension_fn : callable, optional
+        Returns the embedding dimension when a new Pinecone index is created.
+    config : dict, optional
+        Cached Pinecone settings from an earlier run (see PineconeIndex).
+    save_config : callable, optional
+        Called with the updated config after the index is checked.
+    """
+    if backend == "pinecone":
+        return PineconeIndex(index_name, api_key, environment, dimension_fn, config, save_config)
+    if backend == "local" or backend.startswith("local-"):
+        dtype = backend.split("-", 1)[1] if "-" in backend else "float32"
+        return LocalIndex(index_name, dtype=dtype)
+    raise ValueError(f"Unknown index backend '{backend}'")
@@ -0,0 +1,629 @@
+"""
+minutes.py
+
+Generates meeting minutes from a transcript with a CrewAI note taker. Used by
+the NotesServer.py web UI, and as a batch command for whole directories:
+
+    python minutes.py archive/ --workers 4
+"""
+
+import argparse
+import fnmatch
+import glob
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import textwrap
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from crewai import Agent, Task, Crew, Process
+
+# NOTE set OPENAI_API_KEY in the environment to your OpenAI Key
+# Let's set the default model for our AI workflow
+os.environ["OPENAI_MODEL_NAME"]="gpt-4o"
+
+# Maximum number of tasks sent to the model at the same time
+MAX_PARALLEL_TASKS = int(os.getenv("NOTES_MAX_PARALLEL_TASKS", "3"))
+
+class TokenUsage:
+    """
+    Token counts of the model calls made for one set of minutes (thread safe).
+    """
+
+    FIELDS = ('prompt_tokens', 'completion_tokens', 'total_tokens', 'successful_requests')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = dict.fromkeys(self.FIELDS, 0)
+
+    @classmethod
+    def metrics(cls, crew):
+        # Newer crewai versions report a UsageMetrics object, older ones a dict
+        metrics = getattr(crew, 'usage_metrics', None) or {}
+        if not isinstance(metrics, dict):
+            metrics = {name: getattr(metrics, name, 0) for name in cls.FIELDS}
+        return {name: metrics.get(name) or 0 for name in cls.FIELDS}
+
+    def add(self, counts):
+        with self.lock:
+            for name in self.FIELDS:
+                self.counts[name] += counts.get(name) or 0
+
+def new_notetaker():
+    """
+    Returns a new notetaker agent. Agents keep state (including their token
+    counts) between tasks and are not thread safe, so every crew gets its own.
+    """
+    return Agent(
+        role='NoteTaker',
+        goal='To convert a transcript into a usable set of notes (minutes) for meeting participants',
+        backstory=textwrap.dedent("""
+            You are a knowledgeable professional with a college education and extensive experience in the IT industry 
+            as a project manager and writer. Your communication skills are excellent, and you understand the importance 
+            of meeting best practices such as setting clear agendas, defining action items with specific responsibilities, 
+            providing concise summaries, and maintaining documentation for future reference.
+            
+            Your role is to attentively listen to discussions and extract meaningful insights, ensuring that all 
+            relevant points are captured for the benefit of meeting participants. You aim to create an inviting and 
+            collaborative atmosphere, fostering an environment where everyone can contribute and thrive.
+        """)
+    )
+
+def run_crew(task, usage=None):
+    # Each task runs in its own single-task crew (with its own agent) so we
+    # can schedule it ourselves
+    agent = new_notetaker()
+    task.agent = agent
+    crew = Crew(
+      agents=[agent],
+      tasks=[task],
+      process=Process.sequential,
+      verbose=False,
+    )
+    before = TokenUsage.metrics(crew)
+    result = crew.kickoff()
+    if usage is not None:
+        # Only count the calls made by this crew
+        after = TokenUsage.metrics(crew)
+        usage.add({name: after[name] - before[name] for name in TokenUsage.FIELDS})
+    return result
+
+def run_task_graph(steps, max_workers=MAX_PARALLEL_TASKS, usage=None):
+    """
+    Runs tasks as a dependency graph: independent tasks run at the same time
+    and each task starts as soon as the tasks it depends on are done.
+
+    steps maps a step name to (task, label, dependencies). Yields a progress
+    message whenever a task starts or finishes and returns a dict of the
+    results by step name (use "results = yield from run_task_graph(...)").
+    """
+    results = {}
+    waiting = dict(steps)
+    running = {}
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        while waiting or running:
+            # Start every task whose inputs are ready
+            for name, (task, label, dependencies) in list(waiting.items()):
+                if all(d in results for d in dependencies):
+                    running[executor.submit(run_crew, task, usage)] = name
+                    del waiting[name]
+            if not running:
+                raise ValueError(f"Steps {', '.join(waiting)} have missing or circular dependencies")
+            labels = ", ".join(steps[name][1] for name in running.values())
+            yield f"{len(results)} of {len(steps)} steps done. Working on: {labels}..."
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[running.pop(future)] = future.result()
+    finally:
+        # Don't start queued tasks if the user stopped the run
+        executor.shutdown(wait=False, cancel_futures=True)
+    return results
+
+# Long transcripts are processed in chunks of about this many characters
+# (roughly 4 characters per token); "Auto" mode chunks anything longer
+CHUNK_CHARS = int(os.getenv("NOTES_CHUNK_CHARS", "24000"))
+LONG_TRANSCRIPT_CHARS = int(os.getenv("NOTES_LONG_TRANSCRIPT_CHARS", "60000"))
+# Number of partial results merged by one task
+MERGE_FAN_IN = 4
+
+# A new speaker turn starts with "Name:", a time stamp or a heading
+TURN_START = re.compile(r"^\s*(\(?\[?\d{1,2}:\d{2}|#+ |[A-Z][\w.'()-]*( [\w.'()-]+){0,4}:\s)")
+# Time stamps and headings are good places to start a new chunk
+SECTION_START = re.compile(r"^\s*(\(?\[?\d{1,2}:\d{2}|#+ )")
+
+CHUNK_PROMPT = """
+The following is one part of a transcript of a meeting:
+
+---
+
+{chunk}
+
+---
+
+Using only this part of the transcript, please extract:
+
+1. Everyone who spoke or is recorded as attending, under the heading '# Attendees', as a bulleted list of names.
+2. Every action item, under the heading '# Action Items', as a numbered list with the name of the assignee,
+   a brief summary and any deadline mentioned.
+3. An outline of the discussion organized by topic, under the heading '# Meeting Notes', with a '## ' subheading
+   per topic and bullet points for the key subtopics, debates, observations, and decisions. Include the
+   meeting title and date if they appear in this part.
+
+Write 'None' under a heading if this part has nothing for it.
+"""
+
+MERGE_PROMPT = """
+The following are notes taken from consecutive parts of the same meeting, in order:
+
+{parts}
+
+Please merge them into a single set of notes with the same three headings: '# Attendees' (each person once),
+'# Action Items' (each action item once, keeping assignees and deadlines) and '# Meeting Notes' (topics
+that continue across parts merged under one subheading, in the order they were discussed). Keep the
+meeting title and date if they are given.
+"""
+
+
+class ResultCache:
+    """
+    A SQLite cache of task results keyed by the SHA-256 of the model and prompt,
+    so regenerating minutes after an edit only reprocesses the changed chunks.
+    """
+
+    def __init__(self, path=None):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path or os.getenv("NOTES_CACHE", "notes-cache.db"), check_same_thread=False)
+        self.db.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, result TEXT)")
+        self.db.commit()
+
+    @staticmethod
+    def key(prompt):
+        return hashlib.sha256((os.environ["OPENAI_MODEL_NAME"] + "\n" + prompt).encode('utf-8')).hexdigest()
+
+    def get(self, prompt):
+        with self.lock:
+            row = self.db.execute("SELECT result FROM results WHERE key = ?", (self.key(prompt),)).fetchone()
+        return row[0] if row else None
+
+    def put(self, prompt, result):
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO results VALUES (?, ?)", (self.key(prompt), result))
+            self.db.commit()
+
+def split_transcript(transcript, max_chars=CHUNK_CHARS):
+    """
+    Splits a transcript into chunks of whole speaker turns.
+
+    Paragraphs that don't start a new turn stay with the turn before them.
+    Turns are packed into chunks of up to max_chars, and once a chunk is half
+    full a time stamp or heading closes it, so chunks follow the meeting's
+    own sections. A single turn longer than max_chars is split at lines.
+    """
+    turns = []
+    for paragraph in re.split(r"\n\s*\n", transcript):
+        if not paragraph.strip():
+            continue
+        if turns and not TURN_START.match(paragraph):
+            turns[-1] += "\n\n" + paragraph
+        else:
+            turns.append(paragraph)
+
+    chunks = []
+    chunk = ""
+    for turn in turns:
+        pieces = [turn]
+        if len(turn) > max_chars:
+            pieces = []
+            for line in turn.splitlines(keepends=True):
+                while len(line) > max_chars:
+                    pieces.append(line[:max_chars])
+                    line = line[max_chars:]
+                if pieces and len(pieces[-1]) + len(line) <= max_chars:
+                    pieces[-1] += line
+                else:
+                    pieces.append(line)
+        for piece in pieces:
+            if chunk and (len(chunk) + len(piece) + 2 > max_chars
+                          or (len(chunk) > max_chars // 2 and SECTION_START.match(piece))):
+                chunks.append(chunk)
+                chunk = ""
+            chunk = chunk + "\n\n" + piece if chunk else piece
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+def run_prompts(prompts, expected_output, label, cache, max_workers=MAX_PARALLEL_TASKS, usage=None):
+    """
+    Runs one task per prompt in parallel, reusing cached results.
+
+    Yields progress messages and returns the results in prompt order
+    (use "results = yield from run_prompts(...)").
+    """
+    results = [cache.get(prompt) for prompt in prompts]
+    todo = [i for (i, result) in enumerate(results) if result is None]
+    yield f"{label}: {len(prompts) - len(todo)} of {len(prompts)} parts cached..."
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        running = {executor.submit(run_crew, Task(description=prompts[i], expected_output=expected_output),
+                                   usage): i
+                   for i in todo}
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                i = running.pop(future)
+                results[i] = str(future.result())
+                cache.put(prompts[i], results[i])
+            yield f"{label}: {len(prompts) - len(running)} of {len(prompts)} parts done..."
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return results
+
+def extract_chunked(transcript, cache, usage=None):
+    """
+    Extracts attendees, action items and notes from a long transcript.
+
+    Each chunk is sent to the model once (rather than once per kind of
+    result), then the partial results are merged MERGE_FAN_IN at a time
+    until one remains. Returns the merged notes.
+    """
+    chunks = split_transcript(transcript)
+    results = yield from run_prompts(
+        [CHUNK_PROMPT.format(chunk=chunk) for chunk in chunks],
+        'Attendees, action items and topic notes for one part of the meeting',
+        f"Reading {len(chunks)} parts of the transcript", cache, usage=usage)
+    level = 1
+    while len(results) > 1:
+        groups = [results[i:i + MERGE_FAN_IN] for i in range(0, len(results), MERGE_FAN_IN)]
+        prompts = [MERGE_PROMPT.format(parts="\n\n".join(f"---\n\n{part}\n\n---" for part in group))
+                   for group in groups]
+        results = yield from run_prompts(
+            prompts, 'Merged attendees, action items and topic notes',
+            f"Merging notes (level {level})", cache, usage=usage)
+        level += 1
+    return results[0]
+
+def transcript_tasks(transcript):
+    """
+    Returns the participants, action items and notes Tasks, each of which
+    reads the whole transcript (the single pass steps).
+    """
+    # Identify meeting participants
+    participants_task = Task(
+        description=textwrap.dedent(f"""
+  The following is a transcript of a meeting:
+  
+  ---
+  
+  {transcript}
+  
+  ---
+  
+  Using the transcript, please identify and list all participants who attended the meeting.
+  It's essential to include everyone who contributed to the discussion, as their input is valuable for documentation. 
+  Please organize your response with the heading 'Attendees', followed by a bulleted list of names. 
+  Format your response as follows:
+  
+  # Attendees
+  - John Doe
+  - Jane Smith
+  - Alex Johnson
+        """),
+        expected_output='A formatted list of meeting participants',
+    )
+    
+    # Identify action items
+    action_items_task = Task(
+        description=textwrap.dedent(f"""
+  The following is a transcript of a meeting:
+  
+  ---
+  
+  {transcript}
+  
+  ---
+  
+  Using the transcript, please provide a complete list of action items 
+  identified in the meeting, including the name of the person assigned to each action item. 
+  Capturing action items is crucial for ensuring accountability and follow-up.
+  
+  Please organize your response with the heading 'Action Items', followed by a numbered list. Each item should include 
+  the name of the assignee and a brief summary of the action item. 
+  If possible, include any deadlines or follow-up dates mentioned during the meeting.
+  
+  Format your response as follows:
+  
+  # Action Items
+  1. Robert Buccigrossi - Prepare manager’s meeting notes for the next quarterly meeting (Due: [insert date here])
+  2. Jane Smith - Review project deliverables and provide feedback by next week.
+        """),
+        expected_output='A formatted list of meeting action items',
+    )
+    
+    # Identify notes
+    notes_task = Task(
+        description=textwrap.dedent(f"""
+The following is a transcript of a meeting:
+
+---
+
+{transcript}
+
+---
+
+Using the transcript, please create a outline of the conversation organized
+by topic, with all the key subtopics, debates, observations, and decisions made during discussions under that
+topic. You will find it easier to focus if you break the transcript into smaller subsections, probably by
+major topics that were discussed.
+
+Please format your notes with the heading 'Meeting Notes', followed by clearly defined sections
+for different parts of the meeting. Each section should have a subheading, and the content should be organized
+in bullet points for clarity.
+
+Include the Meeting Title and Date at the top of the notes and use the following structure:
+
+# Meeting Notes
+
+**Meeting Title: [Insert Title Here]**
+**Date: [Insert Date Here]**
+
+## Topic Name #1
+- Discution point, observation, decision, or subtopic
+  - Sub discussion point, observation, or decision
+  - ...
+- Discution point, observation, decision, or subtopic
+  - Sub discussion point, observation, or decision
+  - ...
+
+## Topic Name #2
+- ...
+
+## Topics Name #3
+- ...
+        """),
+        expected_output='A detailed, structured outline of the meeting notes in bullet points',
+    )
+
+    return (participants_task, action_items_task, notes_task)
+
+def minutes_steps(transcript, mode="Auto", cache=None, usage=None):
+    """
+    Generates meeting minutes from a transcript, step by step.
+
+    Yields a progress message as each step starts or finishes and returns the
+    minutes (use "minutes = yield from minutes_steps(...)"). mode is "Auto",
+    "Single pass" or "Chunked"; cache is the ResultCache for chunked mode and
+    usage an optional TokenUsage that collects the token counts.
+    """
+    chunked = mode == "Chunked" or (mode == "Auto" and len(transcript) > LONG_TRANSCRIPT_CHARS)
+
+    # In chunked mode the attendees, action items and notes are extracted
+    # part by part and given to the summary and combine tasks directly, so
+    # the tasks that read the whole transcript are only built for a single pass
+    notes = ""
+    if chunked:
+        merged = yield from extract_chunked(transcript, cache or ResultCache(), usage)
+        notes = f"The following are the attendees, action items and notes of a meeting:\n\n---\n\n{merged}\n\n---\n"
+    else:
+        (participants_task, action_items_task, notes_task) = transcript_tasks(transcript)
+
+    # Write meeting summary
+    summary_task = Task(
+        description=notes + textwrap.dedent("""
+            Using the notes provided, summarize the overall purpose and key points of the meeting. Your summary 
+            should be in prose format (one or two paragraphs) and should cover the main objectives, significant
+            discussions, key decisions made, and any notable outcomes. 
+            
+            Please begin the summary with the heading 'Meeting Summary'.
+            
+            Here is an example structure:
+            
+            # Meeting Summary
+            
+            The meeting focused on [main objective], where participants discussed [key topics discussed].
+            Significant decisions included [key decisions], and it was agreed that [summary of outcomes].
+            Notable contributions were made by [names], who [specific contributions].
+        """),
+        expected_output='A summary (one or two paragraphs) of the meeting in prose format',
+        context=[] if chunked else [notes_task],
+    )
+    
+    # Combine into a meeting minutes
+    combine_task = Task(
+        description=notes + textwrap.dedent("""
+            Please combine the elements from the previous workflow steps into a single set of meeting minutes text
+            to be shared with the team: Attendees, Meeting Summary, Action Items, and Meeting Notes.
+            
+            Please format the meeting minutes in markdown using the following structure, making sure to place the
+            Meeting Title and Date at the top:
+            
+            # Minutes [Insert Meeting Title Here] - [Insert Date Here]
+            
+            ## Meeting Summary
+            [Summary of the meeting]
+            
+            ## Action Items
+            [List of action items]
+            
+            ## Attendees
+            [List of attendees]
+            
+            ## Agenda
+            - List of key topics
+            
+            ## Topic Name #1
+            - ...
+            
+            ## Topic Name #2
+            - ...
+            
+            ## Topics Name #3
+            - ...
+            
+            ## Decisions Made
+            - Specific decisions or outcomes reached during the meeting.
+            
+            ## Follow-up
+            - Any follow-up actions that arose, without listing the attendees or action items directly.
+            
+            Ensure that each section is clearly labeled and formatted consistently. The goal is to create a
+            comprehensive and professional meeting minutes document that is easy to read and follow.
+
+            Since the results will be directly displayed to the user, please present the Markdown 
+            directly (not in a Markdown block).
+        """),
+        expected_output='Meeting minutes formatted in markdown',
+        context=[summary_task] if chunked else [participants_task, action_items_task, notes_task, summary_task],
+    )
+
+    # Execute the tasks as a graph: participants, action items and notes only
+    # need the transcript, so they run together and the summary starts as soon
+    # as the notes are done. We still report each step to the user.
+    if chunked:
+        steps = {
+            'summary': (summary_task, "Summarizing Meeting", []),
+            'combine': (combine_task, "Combining Results into a Document", ['summary']),
+        }
+    else:
+        steps = {
+            'participants': (participants_task, "Finding Participants", []),
+            'action_items': (action_items_task, "Finding Action Items", []),
+            'notes': (notes_task, "Finding Discussion Topics", []),
+            'summary': (summary_task, "Summarizing Meeting", ['notes']),
+            'combine': (combine_task, "Combining Results into a Document",
+                        ['participants', 'action_items', 'notes', 'summary']),
+        }
+    results = yield from run_task_graph(steps, usage=usage)
+    return str(results['combine'])
+
+def generate_minutes(transcript, mode="Auto", cache=None, usage=None):
+    """
+    Returns the meeting minutes for a transcript (see minutes_steps).
+    """
+    steps = minutes_steps(transcript, mode, cache, usage)
+    while True:
+        try:
+            next(steps)
+        except StopIteration as done:
+            return done.value
+
+def minutes_path(path):
+    # meeting.txt -> meeting.minutes.md (the metadata goes in meeting.minutes.json)
+    return os.path.splitext(path)[0] + ".minutes.md"
+
+def transcript_hash(transcript, mode):
+    # Minutes are up to date when the transcript, mode and model are unchanged
+    return hashlib.sha256("\n".join([os.environ["OPENAI_MODEL_NAME"], mode, transcript]).encode('utf-8')).hexdigest()
+
+def process_file(path, mode="Auto", cache=None, force=False):
+    """
+    Writes the minutes of one transcript next to it, unless they are up to date.
+
+    Returns a dict with the file, its status ("done", "skipped" or "failed"),
+    the seconds taken, the token usage and any error message.
+    """
+    start = time.time()
+    metadata_path = os.path.splitext(minutes_path(path))[0] + ".json"
+    usage = TokenUsage()
+    # One unreadable transcript or damaged metadata file must not stop the batch
+    try:
+        with open(path, 'r') as f:
+            transcript = f.read()
+        content_hash = transcript_hash(transcript, mode)
+        if not force and os.path.exists(minutes_path(path)) and os.path.exists(metadata_path):
+            try:
+                with open(metadata_path, 'r') as f:
+                    previous = json.load(f).get('hash')
+            except (OSError, ValueError, AttributeError):
+                # Regenerate minutes whose metadata can't be read
+                previous = None
+            if previous == content_hash:
+                return {'file': path, 'status': 'skipped', 'seconds': 0.0, 'usage': {}}
+
+        minutes = generate_minutes(transcript, mode, cache, usage)
+        with open(minutes_path(path), 'w') as f:
+            f.write(minutes)
+        report = {'file': path, 'status': 'done', 'seconds': time.time() - start, 'usage': usage.counts}
+        with open(metadata_path, 'w') as f:
+            json.dump({'hash': content_hash, 'model': os.environ["OPENAI_MODEL_NAME"], 'mode': mode,
+                       'seconds': report['seconds'], 'usage': usage.counts}, f, indent=2)
+    except Exception as e:
+        return {'file': path, 'status': 'failed', 'seconds': time.time() - start,
+                'usage': usage.counts, 'error': f"{type(e).__name__}: {e}"}
+    return report
+
+# Transcript file names (lowercase), and files that are never transcripts
+# (including our own outputs)
+TRANSCRIPT_FILES = ("*.txt", "*.md", "*.vtt")
+NOT_TRANSCRIPTS = ("readme*", "requirements*.txt", "license*", "changelog*", "*.minutes.md")
+
+def is_transcript(path, names=TRANSCRIPT_FILES):
+    name = os.path.basename(path).lower()
+    return (any(fnmatch.fnmatch(name, n) for n in names)
+            and not any(fnmatch.fnmatch(name, n) for n in NOT_TRANSCRIPTS))
+
+def find_transcripts(paths, names=TRANSCRIPT_FILES):
+    """
+    Returns the transcripts in paths (files, directories searched recursively
+    or glob patterns): the files whose names match one of names, a tuple of
+    lowercase glob patterns, leaving out NOT_TRANSCRIPTS.
+    """
+    files = []
+    for pattern in paths:
+        if os.path.isdir(pattern):
+            matches = [os.path.join(root, name) for (root, _, entries) in os.walk(pattern) for name in entries]
+        else:
+            matches = glob.glob(pattern, recursive=True)
+        files.extend(path for path in matches if os.path.isfile(path) and is_transcript(path, names))
+    return sorted(set(files))
+
+def process_files(files, mode="Auto", workers=2, force=False, report=print):
+    """
+    Processes transcripts with a bounded pool of workers, reporting each file
+    as it finishes. Returns the list of per-file results.
+    """
+    cache = ResultCache()
+    results = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(process_file, path, mode, cache, force): path for path in files}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                # Still report the file (and finish the others) if a worker fails outright
+                result = {'file': futures[future], 'status': 'failed', 'seconds': 0.0, 'usage': {},
+                          'error': f"{type(e).__name__}: {e}"}
+            results.append(result)
+            tokens = result['usage'].get('total_tokens', 0)
+            message = f"[{len(results)}/{len(files)}] {result['file']}: {result['status']}"
+            if result['status'] != 'skipped':
+                message += f" in {result['seconds']:.1f}s, {tokens:,} tokens"
+            if result.get('error'):
+                message += f" ({result['error']})"
+            report(message)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Write meeting minutes next to each transcript.")
+    parser.add_argument("paths", nargs="+", help="Transcript files, directories or glob patterns")
+    parser.add_argument("--mode", default="Auto", choices=["Auto", "Single pass", "Chunked"])
+    parser.add_argument("--workers", type=int, default=2, help="Transcripts processed at the same time")
+    parser.add_argument("--force", action="store_true", help="Regenerate minutes that are up to date")
+    parser.add_argument("--pattern", action="append",
+                        help=f"Transcript file name pattern, may be repeated (default {' '.join(TRANSCRIPT_FILES)})")
+    args = parser.parse_args()
+
+    files = find_transcripts(args.paths, tuple(p.lower() for p in args.pattern or TRANSCRIPT_FILES))
+    start = time.time()
+    results = process_files(files, args.mode, args.workers, args.force)
+    counts = {status: sum(1 for r in results if r['status'] == status) for status in ('done', 'skipped', 'failed')}
+    tokens = sum(r['usage'].get('total_tokens', 0) for r in results)
+    print(f"{len(files)} transcripts in {time.time() - start:.1f}s: {counts['done']} done, "
+          f"{counts['skipped']} up to date, {counts['failed']} failed; {tokens:,} tokens")
+    return 1 if counts['failed'] else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,61 @@
+import os
+import sys
+import threading
+import types
+
+import pytest
+
+# crewai is replaced by a stand-in whose crews answer at once, so the
+# scheduling and file handling can be tested without a model
+crewai = types.ModuleType("crewai")
+
+
+class Agent:
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+
+
+class Task:
+    created = []
+
+    def __init__(self, description, expected_output, context=None, agent=None):
+        self.description = description
+        self.expected_output = expected_output
+        self.context = context or []
+        self.agent = agent
+        Task.created.append(self)
+
+
+class Crew:
+    # (event, task description) of every kickoff, in order
+    events = []
+    lock = threading.Lock()
+
+    def __init__(self, agents, tasks, process=None, verbose=False):
+        self.tasks = tasks
+        self.usage_metrics = {}
+
+    def kickoff(self):
+        description = self.tasks[0].description
+        with Crew.lock:
+            Crew.events.append(('start', description))
+        self.usage_metrics = {'prompt_tokens': 10, 'completion_tokens': 5, 'total_tokens': 15,
+                              'successful_requests': 1}
+        with Crew.lock:
+            Crew.events.append(('end', description))
+        return f"Result of {description.strip().splitlines()[0]}"
+
+
+crewai.Agent = Agent
+crewai.Task = Task
+crewai.Crew = Crew
+crewai.Process = types.SimpleNamespace(sequential="sequential")
+sys.modules.setdefault("crewai", crewai)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(autouse=True)
+def clear_crewai():
+    Task.created.clear()
+    Crew.events.clear()
+    yield
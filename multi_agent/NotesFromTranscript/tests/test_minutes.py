@@ -0,0 +1,114 @@
+import json
+import os
+
+import pytest
+from crewai import Crew, Task
+
+import minutes
+
+
+def make_transcript(turns, words=20):
+    return "\n\n".join(f"Speaker {i % 3}: " + " ".join(f"word{i}" for _ in range(words))
+                       for i in range(turns))
+
+
+def test_split_transcript_keeps_turns_whole():
+    transcript = make_transcript(30)
+    chunks = minutes.split_transcript(transcript, max_chars=1000)
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 1000 for chunk in chunks)
+    # Every chunk starts a turn, and together they are the transcript
+    assert all(minutes.TURN_START.match(chunk) for chunk in chunks)
+    assert "\n\n".join(chunks) == transcript
+
+
+def test_split_transcript_boundaries():
+    # A paragraph without a speaker stays with the turn before it
+    transcript = "Alice: " + "a " * 100 + "\n\nstill Alice\n\nBob: hello"
+    assert minutes.split_transcript(transcript, max_chars=220) == [
+        "Alice: " + "a " * 100 + "\n\nstill Alice", "Bob: hello"]
+
+    # Once a chunk is half full, a time stamp starts the next one
+    transcript = "Alice: " + "a " * 40 + "\n\n10:30 Bob: next topic\n\nCarol: yes"
+    assert minutes.split_transcript(transcript, max_chars=150) == [
+        "Alice: " + "a " * 40, "10:30 Bob: next topic\n\nCarol: yes"]
+
+    # A turn longer than a chunk is split at its lines
+    long_turn = "Dave: " + "\n".join("line " * 10 for _ in range(10))
+    chunks = minutes.split_transcript(long_turn, max_chars=120)
+    assert all(len(chunk) <= 120 for chunk in chunks)
+    assert "".join(chunks) == long_turn
+
+
+def test_run_task_graph_follows_dependencies():
+    tasks = {name: Task(description=name, expected_output="") for name in "abcde"}
+    steps = {
+        'e': (tasks['e'], "E", ['c', 'd']),
+        'd': (tasks['d'], "D", ['b']),
+        'c': (tasks['c'], "C", ['a', 'b']),
+        'b': (tasks['b'], "B", []),
+        'a': (tasks['a'], "A", []),
+    }
+    graph = minutes.run_task_graph(steps, max_workers=2)
+    progress = []
+    while True:
+        try:
+            progress.append(next(graph))
+        except StopIteration as done:
+            results = done.value
+            break
+    assert results == {name: f"Result of {name}" for name in "abcde"}
+    assert progress[0].startswith("0 of 5 steps done")
+    for (name, (_, _, dependencies)) in steps.items():
+        started = Crew.events.index(('start', name))
+        assert all(Crew.events.index(('end', d)) < started for d in dependencies)
+
+
+def test_run_task_graph_rejects_circular_dependencies():
+    task = Task(description="a", expected_output="")
+    with pytest.raises(ValueError):
+        list(minutes.run_task_graph({'a': (task, "A", ['b']), 'b': (task, "B", ['a'])}))
+
+
+def test_chunked_minutes_skip_the_full_transcript_tasks():
+    transcript = make_transcript(400)
+    cache = minutes.ResultCache(":memory:")
+    usage = minutes.TokenUsage()
+    assert minutes.generate_minutes(transcript, "Chunked", cache, usage).startswith("Result of")
+    assert not any(transcript in task.description for task in Task.created)
+    chunks = len(minutes.split_transcript(transcript))
+    assert chunks > 1
+    assert usage.counts['successful_requests'] == len(Crew.events) // 2 >= chunks + 2
+
+    # The single pass gives the whole transcript to the participants, action items and notes
+    Task.created.clear()
+    minutes.generate_minutes(transcript, "Single pass")
+    assert sum(transcript in task.description for task in Task.created) == 3
+
+
+def test_process_file_writes_minutes(tmp_path):
+    path = tmp_path / "meeting.txt"
+    path.write_text(make_transcript(3))
+    cache = minutes.ResultCache(str(tmp_path / "cache.db"))
+
+    result = minutes.process_file(str(path), "Single pass", cache)
+    assert result['status'] == 'done'
+    assert result['usage']['total_tokens'] == 5 * 15
+    assert (tmp_path / "meeting.minutes.md").read_text().startswith("Result of")
+    metadata = json.loads((tmp_path / "meeting.minutes.json").read_text())
+    assert metadata['mode'] == "Single pass" and metadata['usage']['successful_requests'] == 5
+
+    # Up to date minutes are skipped unless forced
+    assert minutes.process_file(str(path), "Single pass", cache)['status'] == 'skipped'
+    assert minutes.process_file(str(path), "Single pass", cache, force=True)['status'] == 'done'
+    assert minutes.process_file(str(tmp_path / "missing.txt"))['status'] == 'failed'
+
+
+def test_find_transcripts(tmp_path):
+    for name in ("a.txt", "b.md", "README.md", "requirements.txt", "a.minutes.md", "notes.json",
+                 os.path.join("sub", "c.vtt")):
+        (tmp_path / name).parent.mkdir(exist_ok=True)
+        (tmp_path / name).write_text("text")
+    assert minutes.find_transcripts([str(tmp_path)]) == [
+        str(tmp_path / name) for name in ("a.txt", "b.md", os.path.join("sub", "c.vtt"))]
+    assert minutes.find_transcripts([str(tmp_path / "*")], ("*.md",)) == [str(tmp_path / "b.md")]
@@ -0,0 +1,542 @@
+"""
+assistance_clustering.py
+
+Cluster analysis of the assistance listings (see assistance_clustering.ipynb)
+that stays on the sparse TF-IDF matrix. The notebook densified the whole
+matrix (listings x 8,000 terms) to average term weights per cluster and
+again for the PCA/TSNE sample, and rebuilt each cluster's member list with
+list comprehensions over all the listings. Here:
+
+- ClusterMembership sorts the listings by cluster once, so each cluster's
+  members are a slice,
+- cluster_means() averages the term weights of every cluster with one
+  product of a sparse cluster indicator matrix and the TF-IDF matrix,
+- project() uses TruncatedSVD, which works on sparse input, for the 2-D
+  and the 50-D (before TSNE) projections,
+- find_optimal_clusters() fits the candidate k values in a process pool
+  over a shared-memory copy of the matrix, seeding each k from a smaller
+  k's centers, scores them with SSE and a sampled silhouette, and keeps
+  each k's labels, so the chosen k is not fitted again.
+
+    (data, text, tfidf) = load_listings(path)
+    sweep = find_optimal_clusters(text, 100)
+    clusters = sweep.labels(14)
+    plot_tsne_pca(text, clusters)
+    get_top_keywords(data, text, clusters, tfidf.get_feature_names_out(), 10, 10)
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.decomposition import TruncatedSVD
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics import pairwise_distances, silhouette_score
+
+TEXT_COLUMNS = ['Program Title', 'Federal Agency (030)', 'Objectives (050)']
+AGENCY_COLUMN = 'Federal Agency (030)'
+
+# The notebook's TF-IDF and MiniBatchKMeans settings
+TFIDF_PARAMS = {'min_df': 5, 'max_df': 0.95, 'max_features': 8000, 'stop_words': 'english'}
+KMEANS_PARAMS = {'init_size': 1024, 'batch_size': 2048, 'random_state': 20}
+
+# Listings sampled to compute the silhouette scores (the same sample for every k)
+SILHOUETTE_SAMPLE = 2000
+
+
+def load_listings(path, text_columns=TEXT_COLUMNS, **tfidf_params):
+    """
+    Reads an assistance listings export and computes its TF-IDF matrix.
+
+    Returns
+    -------
+    tuple
+        (data, text, tfidf): the DataFrame (with a joined 'text' column),
+        the sparse TF-IDF matrix and the fitted TfidfVectorizer.
+    """
+    data = pd.read_csv(path, encoding='cp1252', usecols=['Program Number'] + list(text_columns))
+    data['text'] = data[list(text_columns)].fillna('').agg(' '.join, axis=1)
+    tfidf = TfidfVectorizer(**dict(TFIDF_PARAMS, **tfidf_params))
+    text = tfidf.fit_transform(data['text'])
+    return (data, text, tfidf)
+
+
+class ClusterMembership:
+    """
+    The listings of each cluster, computed once from the cluster labels.
+
+    Attributes
+    ----------
+    labels : numpy.ndarray
+        The cluster label of each listing.
+    clusters : numpy.ndarray
+        The distinct cluster labels, sorted.
+    counts : numpy.ndarray
+        The number of listings in each cluster.
+    """
+
+    def __init__(self, labels):
+        self.labels = np.asarray(labels)
+        # Listing indexes grouped by cluster, each cluster's slice in listing order
+        self.order = np.argsort(self.labels, kind="stable")
+        (self.clusters, starts, self.counts) = np.unique(self.labels[self.order], return_index=True,
+                                                         return_counts=True)
+        self.starts = starts
+        self.position = {cluster: i for (i, cluster) in enumerate(self.clusters.tolist())}
+
+    def members(self, cluster):
+        # Indexes of the listings in a cluster
+        i = self.position[cluster]
+        return self.order[self.starts[i]:self.starts[i] + self.counts[i]]
+
+    def sample(self, cluster, size, rng=None):
+        # Up to size random members of a cluster
+        rng = rng or np.random.default_rng()
+        members = self.members(cluster)
+        return rng.choice(members, size=min(size, len(members)), replace=False)
+
+    def indicator(self, normalize=False):
+        """
+        Returns the sparse (clusters x listings) membership matrix, with rows
+        scaled by 1 / cluster size when normalize is set.
+        """
+        rows = np.repeat(np.arange(len(self.clusters)), self.counts)
+        values = np.repeat(1.0 / self.counts, self.counts) if normalize else np.ones(len(rows))
+        return sparse.csr_matrix((values, (rows, self.order)),
+                                 shape=(len(self.clusters), len(self.labels)))
+
+
+def cluster_means(text, membership):
+    """
+    Returns the (clusters x terms) mean TF-IDF weight of each term in each
+    cluster, as a dense array (its size does not depend on the listings).
+    """
+    return np.asarray((membership.indicator(normalize=True) @ text).todense())
+
+
+def top_terms(means, feature_names, n_terms):
+    """
+    Returns the n_terms terms with the highest mean weight in each cluster.
+    """
+    feature_names = np.asarray(feature_names, dtype=object)
+    n_terms = min(n_terms, means.shape[1])
+    # Partition for the top terms, then sort just those
+    top = np.argpartition(-means, n_terms - 1, axis=1)[:, :n_terms]
+    order = np.argsort(-np.take_along_axis(means, top, axis=1), axis=1, kind="stable")
+    return [list(feature_names[row]) for row in np.take_along_axis(top, order, axis=1)]
+
+
+def project(text, n_components=2, sample=None, random_state=None):
+    """
+    Projects (a sample of) the sparse matrix to n_components with TruncatedSVD.
+
+    Unlike the notebook's PCA the data is not centered (centering would make
+    it dense), which for TF-IDF mostly moves the first component.
+
+    Parameters
+    ----------
+    text : scipy.sparse matrix
+        The TF-IDF matrix.
+    n_components : int, optional
+        Dimensions of the projection (default is 2).
+    sample : numpy.ndarray, optional
+        Rows to project (default is all).
+    random_state : int, optional
+        Seed of the randomized SVD.
+
+    Returns
+    -------
+    numpy.ndarray
+        The (rows x n_components) projection.
+    """
+    rows = text if sample is None else text[sample]
+    return TruncatedSVD(n_components=n_components, random_state=random_state).fit_transform(rows)
+
+
+def plot_tsne_pca(text, labels, sample_size=3000, plot_size=300, random_state=None):
+    """
+    Scatter plots a sample of the listings, colored by cluster, on the first
+    two SVD components and with TSNE (after a 50 dimension SVD).
+    """
+    import matplotlib.cm as cm
+    import matplotlib.pyplot as plt
+    from sklearn.manifold import TSNE
+
+    rng = np.random.default_rng(random_state)
+    labels = np.asarray(labels)
+    sample = rng.choice(text.shape[0], size=min(sample_size, text.shape[0]), replace=False)
+    svd = project(text, 2, sample, random_state)
+    reduced = project(text, min(50, text.shape[1] - 1), sample, random_state)
+    tsne = TSNE(random_state=random_state).fit_transform(reduced)
+
+    idx = rng.choice(len(sample), size=min(plot_size, len(sample)), replace=False)
+    max_label = max(labels.max(), 1)
+    colors = [cm.hsv(i / max_label) for i in labels[sample][idx]]
+
+    (f, ax) = plt.subplots(1, 2, figsize=(14, 6))
+    ax[0].scatter(svd[idx, 0], svd[idx, 1], c=colors)
+    ax[0].set_title('SVD Cluster Plot')
+    ax[1].scatter(tsne[idx, 0], tsne[idx, 1], c=colors)
+    ax[1].set_title('TSNE Cluster Plot')
+    return f
+
+
+def describe_clusters(data, text, clusters, feature_names, n_terms=10, n_samples=10,
+                      agency_column=AGENCY_COLUMN, random_state=None):
+    """
+    Summarizes each cluster: its size, top terms, sample listings and the
+    number of agencies among its members.
+
+    Returns
+    -------
+    list
+        A dict per cluster with 'cluster', 'members', 'terms', 'samples',
+        'agencies' (unique count) and 'agency_samples', in cluster order.
+    """
+    membership = ClusterMembership(clusters)
+    terms = top_terms(cluster_means(text, membership), feature_names, n_terms)
+    agencies = data[agency_column].to_numpy()
+    unique_agencies = pd.Series(agencies).groupby(membership.labels).nunique()
+    texts = data['text'].to_numpy()
+    rng = np.random.default_rng(random_state)
+    summaries = []
+    for (i, cluster) in enumerate(membership.clusters.tolist()):
+        summaries.append({
+            'cluster': cluster,
+            'members': int(membership.counts[i]),
+            'terms': terms[i],
+            'samples': [t[:110] for t in texts[membership.sample(cluster, n_samples, rng)]],
+            'agencies': int(unique_agencies[cluster]),
+            'agency_samples': [t[:110] for t in agencies[membership.sample(cluster, n_samples, rng)]],
+        })
+    return summaries
+
+
+def get_top_keywords(data, text, clusters, labels, n_terms, n_samples, agency_column=AGENCY_COLUMN):
+    """
+    Prints each cluster's size, top terms, samples and agencies (as the
+    notebook's get_top_keywords) and returns the summaries.
+    """
+    summaries = describe_clusters(data, text, clusters, labels, n_terms, n_samples, agency_column)
+    for summary in summaries:
+        print('\nCluster {} - {} members'.format(summary['cluster'], summary['members']))
+        print(' Terms: ' + ','.join(summary['terms']))
+        print(' Samples:\n   - ' + '\n   - '.join(summary['samples']))
+        print(' Agencies: ', summary['agencies'], 'unique\n   - ' +
+              '\n   - '.join(summary['agency_samples']))
+    if summaries:
+        print('\n Average unique agencies', np.mean([s['agencies'] for s in summaries]), '\n')
+    return summaries
+
+
+class SharedMatrix:
+    """
+    A CSR matrix whose arrays live in shared memory, so pool workers use
+    the parent's copy instead of receiving their own.
+
+    Create it in the parent with SharedMatrix.create(matrix), pass its spec
+    to the workers, which attach(spec), and close() then unlink() it in the
+    parent when done.
+    """
+
+    def __init__(self, blocks, spec):
+        self.blocks = blocks
+        self.spec = spec
+        arrays = {name: np.ndarray(shape, dtype=dtype, buffer=blocks[name].buf)
+                  for (name, (_, shape, dtype)) in spec['arrays'].items()}
+        self.matrix = sparse.csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']),
+                                        shape=spec['shape'], copy=False)
+
+    @classmethod
+    def create(cls, matrix):
+        matrix = sparse.csr_matrix(matrix)
+        blocks = {}
+        spec = {'shape': matrix.shape, 'arrays': {}}
+        for name in ('data', 'indices', 'indptr'):
+            array = getattr(matrix, name)
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+            blocks[name] = block
+            spec['arrays'][name] = (block.name, array.shape, array.dtype.str)
+        return cls(blocks, spec)
+
+    @classmethod
+    def attach(cls, spec):
+        blocks = {}
+        for (name, (block_name, _, _)) in spec['arrays'].items():
+            blocks[name] = shared_memory.SharedMemory(name=block_name)
+        return cls(blocks, spec)
+
+    def close(self):
+        self.matrix = None
+        for block in self.blocks.values():
+            block.close()
+
+    def unlink(self):
+        for block in self.blocks.values():
+            block.unlink()
+
+
+# The matrix a pool worker fits (attached once per worker)
+worker_matrix = None
+
+
+def attach_worker_matrix(spec):
+    global worker_matrix
+    worker_matrix = SharedMatrix.attach(spec)
+
+
+def extend_centers(X, centers, k, rng, sample_size=4096):
+    """
+    Adds centers to reach k by k-means++ sampling: each new center is a
+    listing drawn with probability proportional to its squared distance to
+    the nearest existing center (centers may be empty for a cold start).
+    """
+    rows = rng.choice(X.shape[0], size=min(sample_size, X.shape[0]), replace=False)
+    Xs = X[rows]
+    squared = np.asarray(Xs.multiply(Xs).sum(axis=1)).ravel()
+    if len(centers):
+        distances = squared[:, None] - 2 * (Xs @ centers.T) + np.square(centers).sum(axis=1)
+        nearest = np.clip(distances.min(axis=1), 0, None)
+    else:
+        nearest = np.ones(len(rows))
+    new = []
+    for _ in range(k - len(centers)):
+        total = nearest.sum()
+        i = rng.choice(len(rows), p=nearest / total) if total > 0 else rng.integers(len(rows))
+        center = Xs[i].toarray().ravel()
+        new.append(center)
+        nearest = np.minimum(nearest, np.clip(squared - 2 * (Xs @ center) + center @ center, 0, None))
+    return np.vstack([centers] + new) if new else centers
+
+
+def fit_chain(ks, kmeans_params, sample, seed, X=None, centers=None, keep_models=False):
+    """
+    Fits MiniBatchKMeans for each k (ascending), starting each k from the
+    previous k's centers (or the given centers of a smaller k) plus
+    k-means++ picks for the extra clusters.
+
+    The silhouette of every k is computed on the same sample of listings,
+    whose distances are computed once.
+
+    Returns
+    -------
+    list
+        A dict per k with 'k', 'labels', 'sse', 'silhouette', 'seconds' and,
+        with keep_models, the fitted 'model' (whose dense centers are
+        clusters x terms each).
+    """
+    X = worker_matrix.matrix if X is None else X
+    rng = np.random.default_rng(seed)
+    distances = pairwise_distances(X[sample])
+    centers = np.empty((0, X.shape[1])) if centers is None else centers
+    results = []
+    for k in sorted(ks):
+        start = time.perf_counter()
+        centers = extend_centers(X, centers, k, rng)
+        model = MiniBatchKMeans(n_clusters=k, init=centers, n_init=1, **kmeans_params).fit(X)
+        centers = model.cluster_centers_
+        result = {'k': k, 'labels': model.labels_, 'sse': model.inertia_,
+                  'silhouette': sample_silhouette(distances, model.labels_[sample]),
+                  'seconds': time.perf_counter() - start}
+        if keep_models:
+            result['model'] = model
+        results.append(result)
+    return results
+
+
+def balanced_chains(ks, n):
+    """
+    Splits sorted k values into n contiguous chains of about the same total
+    k (the cost of the fits), each non-empty.
+    """
+    totals = np.cumsum(ks)
+    cuts = []
+    for i in range(1, n):
+        # Cut where the running total passes i n-ths of the whole, keeping every chain non-empty
+        cut = int(np.searchsorted(totals, totals[-1] * i / n, side='right'))
+        cuts.append(min(max(cut, (cuts[-1] if cuts else 0) + 1), len(ks) - (n - i)))
+    return [chain.tolist() for chain in np.split(np.asarray(ks), cuts)]
+
+
+def sample_silhouette(distances, labels):
+    # Silhouette of the sample (None when it is in one cluster or all apart)
+    if 1 < len(np.unique(labels)) < len(labels):
+        return silhouette_score(distances, labels, metric="precomputed")
+    return None
+
+
+class ClusterSweep:
+    """
+    MiniBatchKMeans fitted for a range of cluster counts, with each k's
+    labels and scores kept for reuse.
+
+    The candidate k values are split into contiguous chains with about the
+    same total k (the cost of a fit grows with k), e.g. 2-24 and 26-36,
+    fitted in parallel. Within a chain each k starts from the previous k's
+    centers, so large k converge in few iterations and the SSE falls
+    steadily with k.
+
+    Only the models asked for with model(k) are kept, unless keep_models is
+    set: each model holds dense (k x terms) centers. A model that was not
+    kept is rebuilt from its k's labels.
+
+    Attributes
+    ----------
+    text : scipy.sparse matrix
+        The TF-IDF matrix.
+    results : dict
+        k -> {'k', 'labels', 'sse', 'silhouette', 'seconds'} (and 'model').
+    """
+
+    def __init__(self, text, n_jobs=None, silhouette_sample=SILHOUETTE_SAMPLE, keep_models=False,
+                 **kmeans_params):
+        self.text = sparse.csr_matrix(text)
+        self.n_jobs = n_jobs or os.cpu_count() or 1
+        self.keep_models = keep_models
+        self.kmeans_params = dict(KMEANS_PARAMS, **kmeans_params)
+        self.seed = self.kmeans_params.get('random_state')
+        self.results = {}
+        rng = np.random.default_rng(self.seed)
+        self.sample = np.sort(rng.choice(self.text.shape[0], replace=False,
+                                         size=min(silhouette_sample, self.text.shape[0])))
+
+    def chain_seed(self, i):
+        return None if self.seed is None else self.seed + i
+
+    def fit(self, ks):
+        """
+        Fits every k not fitted yet and returns their results, sorted by k.
+        """
+        ks = sorted(set(ks) - set(self.results))
+        if not ks:
+            return []
+        chains = balanced_chains(ks, min(self.n_jobs, len(ks)))
+        if len(chains) == 1:
+            results = fit_chain(chains[0], self.kmeans_params, self.sample, self.chain_seed(0),
+                                self.text, keep_models=self.keep_models)
+        else:
+            shared = SharedMatrix.create(self.text)
+            try:
+                with ProcessPoolExecutor(max_workers=len(chains), initializer=attach_worker_matrix,
+                                         initargs=(shared.spec,)) as pool:
+                    futures = [pool.submit(fit_chain, chain, self.kmeans_params, self.sample,
+                                           self.chain_seed(i), keep_models=self.keep_models)
+                               for (i, chain) in enumerate(chains)]
+                    results = [result for future in futures for result in future.result()]
+            finally:
+                shared.close()
+                shared.unlink()
+        for result in results:
+            self.results[result['k']] = result
+        return sorted(results, key=lambda r: r['k'])
+
+    def model(self, k):
+        """
+        Returns the fitted model for k. A k not fitted yet is fitted now
+        (from the centroids of the closest smaller k); a fitted k whose
+        model was not kept is rebuilt, not refitted, from the centroids of
+        its labels, so labels(k) never changes.
+        """
+        if k not in self.results:
+            fitted = [j for j in self.results if j < k]
+            centers = cluster_means(self.text, ClusterMembership(self.results[max(fitted)]['labels'])) \
+                if fitted else None
+            (self.results[k],) = fit_chain([k], self.kmeans_params, self.sample, self.chain_seed(k),
+                                           self.text, centers, keep_models=True)
+        result = self.results[k]
+        if 'model' not in result:
+            result['model'] = self.rebuild_model(k, result)
+        return result['model']
+
+    def rebuild_model(self, k, result):
+        # A model whose centers are the centroids of the stored labels (the
+        # centers of empty clusters are k-means++ picks), for predict()
+        membership = ClusterMembership(result['labels'])
+        means = cluster_means(self.text, membership)
+        centers = np.empty((k, self.text.shape[1]))
+        centers[membership.clusters] = means
+        empty = np.setdiff1d(np.arange(k), membership.clusters)
+        if len(empty):
+            rng = np.random.default_rng(self.chain_seed(k))
+            centers[empty] = extend_centers(self.text, means, k, rng)[len(means):]
+        # Fitting one step on the centers themselves leaves them in place
+        model = MiniBatchKMeans(n_clusters=k, init=centers, n_init=1, max_iter=1, batch_size=k,
+                                random_state=self.seed).fit(centers)
+        model.cluster_centers_ = centers
+        model.labels_ = result['labels']
+        model.inertia_ = result['sse']
+        return model
+
+    def labels(self, k):
+        # The cluster of each listing for k (as fit_predict returned)
+        if k not in self.results:
+            self.model(k)
+        return self.results[k]['labels']
+
+    def best_k(self):
+        # The fitted k with the highest silhouette score
+        scored = [r for r in self.results.values() if r['silhouette'] is not None]
+        return max(scored, key=lambda r: r['silhouette'])['k'] if scored else None
+
+    def table(self):
+        return pd.DataFrame([{name: r[name] for name in ('k', 'sse', 'silhouette', 'seconds')}
+                             for (_, r) in sorted(self.results.items())])
+
+    def plot(self):
+        # SSE (for the elbow) and silhouette by number of clusters
+        import matplotlib.pyplot as plt
+
+        table = self.table()
+        (f, ax) = plt.subplots(1, 2, figsize=(14, 5))
+        ax[0].plot(table['k'], table['sse'], marker='o')
+        ax[0].set_xlabel('Cluster Centers')
+        ax[0].set_ylabel('SSE')
+        ax[0].set_title('SSE by Cluster Center Plot')
+        ax[1].plot(table['k'], table['silhouette'], marker='o')
+        ax[1].set_xlabel('Cluster Centers')
+        ax[1].set_ylabel('Silhouette (sampled)')
+        ax[1].set_title('Silhouette by Cluster Center Plot')
+        return f
+
+
+def find_optimal_clusters(data, max_k, step=2, n_jobs=None, plot=True, sweep=None, **kmeans_params):
+    """
+    Fits k = 2, 2 + step, ... max_k clusters (as the notebook's function)
+    and plots their SSE and silhouette.
+
+    Parameters
+    ----------
+    data : scipy.sparse matrix
+        The TF-IDF matrix.
+    max_k : int
+        The largest number of clusters.
+    step : int, optional
+        Spacing of the k values (default is 2).
+    n_jobs : int, optional
+        Worker processes (default is the number of CPUs).
+    plot : bool, optional
+        Plot the scores (default is True).
+    sweep : ClusterSweep, optional
+        An earlier sweep of the same data to extend.
+    **kmeans_params
+        MiniBatchKMeans settings (and keep_models) for a new sweep.
+
+    Returns
+    -------
+    ClusterSweep
+        The sweep, whose labels(k) reuse the fitted models.
+    """
+    sweep = sweep or ClusterSweep(data, n_jobs=n_jobs, **kmeans_params)
+    start = time.perf_counter()
+    sweep.fit(range(2, max_k + 1, step))
+    print('Fit {} cluster counts in {:.1f}s, best silhouette at k={}'.format(
+        len(sweep.results), time.perf_counter() - start, sweep.best_k()))
+    if plot:
+        sweep.plot()
+    return sweep
@@ -0,0 +1,306 @@
+"""
+fpi_predictor.py
+
+Scores texts against all the Federal Program Inventory (FPI) category models
+at once. predict_categories() in the notebooks calls predict_proba on every
+category's pipeline, so each text is tokenized and TF-IDF vectorized once
+per category. CategoryPredictor compiles the trained estimators dict
+(category -> TfidfVectorizer, SelectKBest, SGDClassifier pipeline) into one
+merged vocabulary and a weight matrix, so a batch of texts is counted once
+and every category is scored by one sparse matrix product:
+
+    predictor = CategoryPredictor.from_estimators(estimators)
+    predictor.predict_categories(texts)
+
+The probabilities are the same as the pipelines' predict_proba.
+
+A compiled predictor is saved as a directory of flat .npy arrays (one shared
+vocabulary, the idf vectors, the selected features and coefficients of all
+categories) that load memory-mapped, so worker processes share one copy in
+the page cache instead of each unpickling its own pipelines. The vocabulary
+is a sorted array of UTF-8 terms that is searched in place, so loading it
+builds no per-process term dict either:
+
+    python fpi_predictor.py fpi_estimators.pkl fpi_model
+    predictor = CategoryPredictor.load("fpi_model")
+"""
+
+import argparse
+import json
+import os
+import pickle
+
+import numpy as np
+from scipy import sparse
+from scipy.special import expit
+from sklearn.feature_extraction.text import CountVectorizer
+
+# Vectorizer settings that must match for the estimators to share a tokenizer
+SHARED_SETTINGS = ('lowercase', 'token_pattern', 'strip_accents', 'binary', 'sublinear_tf',
+                   'norm', 'use_idf', 'analyzer', 'tokenizer', 'preprocessor')
+
+DEFAULT_BATCH_SIZE = 10000
+
+# Version of the saved model directory layout
+FORMAT_VERSION = 2
+# The arrays of a saved model (name.npy each)
+ARRAYS = ('vocabulary', 'idf', 'groups', 'features', 'coefficients', 'offsets', 'intercepts')
+
+
+def stop_word_list(stop_words):
+    # Stop words as a sorted list (None for no stop words)
+    if stop_words is None:
+        return None
+    if isinstance(stop_words, str):
+        return sorted(CountVectorizer(stop_words=stop_words).get_stop_words())
+    return sorted(stop_words)
+
+
+class CategoryPredictor:
+    """
+    All the category models as arrays over one vocabulary.
+
+    The pipelines' TF-IDF vectors are normalized over their own vectorizer's
+    vocabulary, so the categories are grouped by vectorizer and each text's
+    norm is computed per group.
+
+    Attributes
+    ----------
+    categories : list
+        The category names (one column of the results each).
+    vocabulary : numpy.ndarray
+        The UTF-8 encoded terms (n-grams) of all the vectorizers, sorted,
+        one per feature column.
+    idf : numpy.ndarray
+        (groups x features) inverse document frequencies of each vectorizer
+        (0 for terms outside its vocabulary).
+    groups : numpy.ndarray
+        The vectorizer group of each category.
+    features : numpy.ndarray
+        The selected feature columns of all categories, one after another.
+    coefficients : numpy.ndarray
+        The classifier coefficient of each selected feature.
+    offsets : numpy.ndarray
+        Where each category's features start (and, last, where they end).
+    intercepts : numpy.ndarray
+        The classifier intercept of each category.
+    losses : list
+        Each classifier's loss ('log_loss' or 'modified_huber'), which
+        determines how decisions become probabilities.
+    settings : dict
+        The shared tokenizer settings ('ngram_range', 'stop_words',
+        'lowercase', 'token_pattern', 'sublinear_tf').
+    weights : scipy.sparse.csc_matrix
+        (features x categories) idf * coefficient of each selected feature.
+    """
+
+    def __init__(self, categories, vocabulary, idf, groups, features, coefficients, offsets,
+                 intercepts, losses, settings):
+        self.categories = list(categories)
+        if not (isinstance(vocabulary, np.ndarray) and vocabulary.dtype.kind == 'S'):
+            vocabulary = np.array([term.encode('utf-8') for term in vocabulary], dtype=bytes)
+        self.vocabulary = vocabulary
+        self.idf = idf
+        self.groups = np.asarray(groups)
+        self.features = features
+        self.coefficients = coefficients
+        self.offsets = offsets
+        self.intercepts = np.asarray(intercepts)
+        self.losses = list(losses)
+        self.settings = settings
+        # Only the selected features have weights, so keep them sparse
+        category_groups = np.repeat(self.groups, np.diff(offsets))
+        self.weights = sparse.csc_matrix((idf[category_groups, features] * coefficients, features, offsets),
+                                         shape=(len(vocabulary), len(self.categories)))
+        # The vectorizers' tokenizer; terms are looked up in the vocabulary array
+        self.analyzer = CountVectorizer(ngram_range=tuple(settings['ngram_range']),
+                                        stop_words=settings['stop_words'],
+                                        lowercase=settings['lowercase'],
+                                        token_pattern=settings['token_pattern']).build_analyzer()
+
+    @classmethod
+    def from_estimators(cls, estimators):
+        """
+        Compiles a dict of category -> fitted (vectorizer, select, classifier)
+        Pipeline.
+
+        Raises
+        ------
+        ValueError
+            If the vectorizers tokenize differently or a step is not supported.
+        """
+        steps = [(category, pipeline.named_steps['vectorizer'], pipeline.named_steps['select'],
+                  pipeline.named_steps['classifier']) for (category, pipeline) in estimators.items()]
+        if not steps:
+            raise ValueError("There are no estimators to compile.")
+
+        # Pipelines trained together may share a vectorizer object
+        vectorizers = []
+        groups = []
+        for (_, vectorizer, _, _) in steps:
+            if not any(vectorizer is v for v in vectorizers):
+                vectorizers.append(vectorizer)
+            groups.append(next(g for (g, v) in enumerate(vectorizers) if v is vectorizer))
+        first = vectorizers[0]
+        for vectorizer in vectorizers[1:]:
+            for name in SHARED_SETTINGS + ('stop_words',):
+                if name == 'stop_words':
+                    same = stop_word_list(vectorizer.stop_words) == stop_word_list(first.stop_words)
+                else:
+                    same = getattr(vectorizer, name, None) == getattr(first, name, None)
+                if not same:
+                    raise ValueError(f"The vectorizers differ in '{name}'.")
+        if first.analyzer != 'word' or first.tokenizer or first.preprocessor or first.strip_accents:
+            raise ValueError("Only the default word analyzer is supported.")
+        if first.norm != 'l2' or first.binary:
+            raise ValueError("Only l2 normalized, non-binary TF-IDF is supported.")
+
+        # One column per term of any vectorizer
+        vocabulary = sorted(set().union(*(v.vocabulary_ for v in vectorizers)))
+        column = {term: i for (i, term) in enumerate(vocabulary)}
+        idf = np.zeros((len(vectorizers), len(vocabulary)))
+        for (g, vectorizer) in enumerate(vectorizers):
+            terms = sorted(vectorizer.vocabulary_, key=vectorizer.vocabulary_.get)
+            columns = np.fromiter((column[t] for t in terms), dtype=np.int64, count=len(terms))
+            idf[g, columns] = vectorizer.idf_ if first.use_idf else 1.0
+
+        features = []
+        coefficients = []
+        intercepts = np.zeros(len(steps))
+        losses = []
+        for (c, (category, vectorizer, select, classifier)) in enumerate(steps):
+            if classifier.loss not in ('log_loss', 'log', 'modified_huber'):
+                raise ValueError(f"'{category}' uses loss '{classifier.loss}', which has no probabilities.")
+            if len(classifier.classes_) != 2:
+                raise ValueError(f"'{category}' is not a binary classifier.")
+            terms = np.asarray(sorted(vectorizer.vocabulary_, key=vectorizer.vocabulary_.get),
+                               dtype=object)
+            columns = np.array([column[t] for t in terms[select.get_support()]], dtype=np.int64)
+            # Sorted by column, as the sparse weight matrix wants
+            order = np.argsort(columns)
+            features.append(columns[order])
+            coefficients.append(classifier.coef_[0][order])
+            intercepts[c] = classifier.intercept_[0]
+            losses.append(classifier.loss)
+        offsets = np.concatenate([[0], np.cumsum([len(f) for f in features])])
+
+        settings = {'ngram_range': (min(v.ngram_range[0] for v in vectorizers),
+                                    max(v.ngram_range[1] for v in vectorizers)),
+                    'stop_words': stop_word_list(first.stop_words),
+                    'lowercase': first.lowercase, 'token_pattern': first.token_pattern,
+                    'sublinear_tf': first.sublinear_tf}
+        return cls([s[0] for s in steps], vocabulary, idf, groups, np.concatenate(features),
+                   np.concatenate(coefficients), offsets, intercepts, losses, settings)
+
+    def save(self, path):
+        """
+        Saves the predictor as a directory of .npy arrays and a JSON manifest.
+        """
+        os.makedirs(path, exist_ok=True)
+        for name in ARRAYS:
+            np.save(os.path.join(path, name + ".npy"), np.ascontiguousarray(getattr(self, name)))
+        manifest = {'format': FORMAT_VERSION, 'categories': self.categories, 'losses': self.losses,
+                    'settings': self.settings}
+        with open(os.path.join(path, "manifest.json"), "w") as file:
+            json.dump(manifest, file, indent=2)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Loads a predictor saved by save().
+
+        Parameters
+        ----------
+        path : str
+            The model directory.
+        mmap : bool, optional
+            Memory-map the arrays (read-only, shared by every process that
+            loads the same files) instead of reading them (default is True).
+        """
+        with open(os.path.join(path, "manifest.json")) as file:
+            manifest = json.load(file)
+        if manifest.get('format') != FORMAT_VERSION:
+            raise ValueError(f"Unsupported model format {manifest.get('format')} in {path}.")
+        arrays = {name: np.load(os.path.join(path, name + ".npy"), mmap_mode='r' if mmap else None)
+                  for name in ARRAYS}
+        return cls(manifest['categories'], arrays['vocabulary'], arrays['idf'], arrays['groups'],
+                   arrays['features'], arrays['coefficients'], arrays['offsets'],
+                   arrays['intercepts'], manifest['losses'], manifest['settings'])
+
+    def counts(self, texts):
+        # Term counts of the texts over the merged vocabulary, each term found
+        # by binary search of the sorted vocabulary
+        terms = []
+        rows = []
+        for (row, text) in enumerate(texts):
+            tokens = [token.encode('utf-8') for token in self.analyzer(text)]
+            terms.extend(tokens)
+            rows.extend([row] * len(tokens))
+        # Terms longer than the vocabulary's item size can't be in it (and
+        # would be truncated by the conversion)
+        fits = np.fromiter(map(len, terms), dtype=np.int64, count=len(terms)) <= self.vocabulary.itemsize
+        terms = np.array(terms, dtype=self.vocabulary.dtype)
+        columns = np.minimum(np.searchsorted(self.vocabulary, terms), len(self.vocabulary) - 1)
+        found = fits & (self.vocabulary[columns] == terms)
+        X = sparse.csr_matrix((np.ones(found.sum()), (np.asarray(rows, dtype=np.int64)[found], columns[found])),
+                              shape=(len(texts), len(self.vocabulary)))
+        X.sum_duplicates()
+        if self.settings['sublinear_tf']:
+            X.data = np.log(X.data) + 1
+        return X
+
+    def decision_function(self, texts):
+        """
+        Returns the (texts x categories) classifier decisions.
+        """
+        X = self.counts(texts)
+        # Each group's TF-IDF norm of each text, then all categories in one product
+        norms = np.sqrt(X.multiply(X) @ np.square(self.idf).T)
+        norms[norms == 0] = 1
+        return (X @ self.weights).toarray() / norms[:, self.groups] + self.intercepts
+
+    def predict_proba(self, texts, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Returns the (texts x categories) probability of each category.
+
+        Parameters
+        ----------
+        texts : list
+            The texts to score.
+        batch_size : int, optional
+            Texts vectorized at a time (default is 10000).
+        """
+        texts = list(texts)
+        log_loss = np.array([loss != 'modified_huber' for loss in self.losses])
+        results = np.empty((len(texts), len(self.categories)))
+        for start in range(0, len(texts), batch_size):
+            decision = self.decision_function(texts[start:start + batch_size])
+            # As SGDClassifier.predict_proba: a logistic or a clipped linear curve
+            results[start:start + batch_size] = np.where(
+                log_loss, expit(decision), (np.clip(decision, -1, 1) + 1) / 2)
+        return results
+
+    def predict_categories(self, texts, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Returns, for each text, its (category, probability) list sorted by
+        probability (as predict_categories in the notebooks).
+        """
+        probabilities = self.predict_proba(texts, batch_size)
+        order = np.argsort(-probabilities, axis=1, kind="stable")
+        return [[(self.categories[c], float(row[c])) for c in ranking]
+                for (row, ranking) in zip(probabilities, order)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert pickled FPI estimators to a memory-mappable model.")
+    parser.add_argument("estimators", help="Pickle of the estimators dict (e.g. fpi_estimators.pkl)")
+    parser.add_argument("output", help="Model directory to write")
+    args = parser.parse_args()
+    with open(args.estimators, "rb") as file:
+        estimators = pickle.load(file)
+    CategoryPredictor.from_estimators(estimators).save(args.output)
+    print(f"Saved {len(estimators)} categories to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+"""
+fpi_training.py
+
+Trains the Federal Program Inventory (FPI) category models of
+fpi_create_model.ipynb: one TF-IDF -> SelectKBest -> SGDClassifier pipeline
+per category, picked by a grid search over repeated train/test splits.
+
+Instead of refitting the TfidfVectorizer for every category, grid point and
+fold, the splits are shared by all categories so each TF-IDF matrix is
+computed once per n-gram setting and fold (FeatureCache) and reused by every
+category and hyperparameter. The per-category searches then only fit the
+SelectKBest + SGDClassifier heads on the cached sparse matrices, in parallel.
+
+    python fpi_training.py --output fpi_estimators.pkl
+"""
+
+import argparse
+import hashlib
+import pickle
+import time
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn import metrics
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.feature_selection import SelectKBest, f_classif
+from sklearn.linear_model import SGDClassifier
+from sklearn.model_selection import KFold, ShuffleSplit
+from sklearn.pipeline import Pipeline
+
+DATA_FILE = 'Federal_Program_Inventory_Pilot_Data.csv'
+TEXT_COLUMNS = ['Agency', 'Program Name', 'Program Description', 'Mission/Purpose',
+                'Recipients', 'Beneficiaries']
+
+# The grid of fpi_create_model.ipynb ('log' is called 'log_loss' in current scikit-learn)
+PARAM_GRID = {
+    'ngram_range': [(1, 1), (1, 2)],
+    'k': [10, 50, 100, 200, 500, 1000, 1500],
+    'loss': ['log_loss', 'modified_huber'],
+}
+
+SCORERS = {
+    'accuracy': metrics.accuracy_score,
+    'f1_macro': lambda y, pred: metrics.f1_score(y, pred, average='macro', zero_division=0),
+}
+
+
+def load_labeled_data(path=DATA_FILE):
+    """
+    Reads the FPI pilot data as one row per program with a 'text' column
+    (the joined TEXT_COLUMNS) and its 'Associated Categories'.
+
+    Returns
+    -------
+    tuple
+        (labeled_data, categories): the DataFrame and the category names.
+    """
+    labeled_data = pd.read_csv(path, encoding='cp1252',
+                               usecols=TEXT_COLUMNS + ['Associated Categories'])
+    labeled_data = labeled_data.drop_duplicates().reset_index(drop=True)
+    labeled_data['text'] = labeled_data[TEXT_COLUMNS].agg(' '.join, axis=1)
+    categories = pd.read_csv(path, encoding='cp1252', usecols=['Category'])
+    categories = categories['Category'].drop_duplicates().tolist()
+    return (labeled_data, categories)
+
+
+def category_labels(associated, category):
+    # 'Y' when the category appears in the associated categories, else 'N'
+    return np.where(associated.str.contains(category, regex=False), 'Y', 'N')
+
+
+class FeatureCache:
+    """
+    TF-IDF matrices of one set of texts, computed once per n-gram setting and
+    training rows.
+
+    Each entry is the vectorizer fitted on the training rows and the
+    transform of all the texts, so any fold's training and held-out rows
+    are row slices of one matrix. Keep the cache to retrain for another
+    category list without vectorizing again: it also keeps the splits, so
+    later calls (even unseeded ones) reuse the same folds and matrices.
+    """
+
+    def __init__(self, texts, stop_words='english', **vectorizer_params):
+        self.texts = list(texts)
+        self.vectorizer_params = dict(vectorizer_params, stop_words=stop_words)
+        self.entries = {}
+        self.fits = 0
+        self.split_sets = {}
+
+    def splits(self, times=10, cv=5, test_size=0.2, random_state=None):
+        """
+        Returns make_splits() of the texts, drawn once per setting (an
+        unseeded setting is drawn on the first call and reused after).
+        """
+        key = (times, cv, test_size, random_state)
+        if key not in self.split_sets:
+            self.split_sets[key] = make_splits(len(self.texts), times, cv, test_size, random_state)
+        return self.split_sets[key]
+
+    def key(self, ngram_range, train_index):
+        rows = hashlib.sha1(np.asarray(train_index, dtype=np.int64).tobytes()).hexdigest()
+        return (tuple(ngram_range), rows)
+
+    def get(self, ngram_range, train_index):
+        """
+        Returns (vectorizer, matrix) for the vectorizer fitted on the texts
+        at train_index, matrix being the TF-IDF of all the texts.
+        """
+        key = self.key(ngram_range, train_index)
+        if key not in self.entries:
+            vectorizer = TfidfVectorizer(ngram_range=tuple(ngram_range), **self.vectorizer_params)
+            vectorizer.fit([self.texts[i] for i in train_index])
+            self.entries[key] = (vectorizer, vectorizer.transform(self.texts).tocsr())
+            self.fits += 1
+        return self.entries[key]
+
+
+def make_splits(n_texts, times=10, cv=5, test_size=0.2, random_state=None):
+    """
+    Returns the shared outer train/test splits, each with the inner cross
+    validation folds of its training rows (as indexes into all texts).
+
+    The notebook stratified each split by the category's label; shared
+    splits cannot be, so folds whose training rows hold a single class are
+    skipped for that category.
+    """
+    outer = ShuffleSplit(n_splits=times, test_size=test_size, random_state=random_state)
+    splits = []
+    for (i, (train, test)) in enumerate(outer.split(np.zeros(n_texts))):
+        seed = None if random_state is None else random_state + i
+        inner = KFold(n_splits=cv, shuffle=True, random_state=seed)
+        folds = [(train[fit], train[held]) for (fit, held) in inner.split(train)]
+        splits.append({'train': train, 'test': test, 'folds': folds})
+    return splits
+
+
+def top_k(scores, k):
+    # The features SelectKBest keeps (same ordering and tie breaking)
+    scores = np.nan_to_num(scores, nan=np.finfo(float).min)
+    return np.sort(np.argsort(scores, kind="mergesort")[-k:])
+
+
+def fit_head(X, y, features, loss, random_state=None):
+    classifier = SGDClassifier(loss=loss, random_state=random_state)
+    return classifier.fit(X[:, features], y)
+
+
+def search_category(category, y, splits, matrices, param_grid, scoring, random_state=None):
+    """
+    Grid searches one category's heads on the cached matrices.
+
+    For each outer split, the parameters with the best mean score over the
+    inner folds are refit on the split's training rows and scored (macro
+    F1) on its test rows; the best split's head is returned.
+
+    Parameters
+    ----------
+    category : str
+        The category (for the report).
+    y : numpy.ndarray
+        The 'Y'/'N' label of every text.
+    splits : list
+        From make_splits().
+    matrices : dict
+        (ngram_range, split, fold) -> TF-IDF matrix of all texts, fold None
+        being the split's full training rows.
+    param_grid : dict
+        Lists of 'ngram_range', 'k' and 'loss' values.
+    scoring : str
+        Inner selection metric, a key of SCORERS (GridSearchCV used accuracy).
+
+    Returns
+    -------
+    dict
+        The 'params', 'features', 'classifier', 'split', 'f1' and the per
+        split 'f1_scores' of the best head.
+    """
+    score = SCORERS[scoring]
+    best = None
+    f1_scores = []
+    for (s, split) in enumerate(splits):
+        totals = {}
+        for ngram_range in param_grid['ngram_range']:
+            for (f, (fit_rows, held_rows)) in enumerate(split['folds']):
+                if len(set(y[fit_rows])) < 2:
+                    continue
+                X = matrices[(tuple(ngram_range), s, f)]
+                (X_fit, X_held) = (X[fit_rows], X[held_rows])
+                # Score the features once and take every k from the ranking
+                (feature_scores, _) = f_classif(X_fit, y[fit_rows])
+                for k in param_grid['k']:
+                    features = top_k(feature_scores, min(k, X.shape[1]))
+                    (X_k, X_held_k) = (X_fit[:, features], X_held[:, features])
+                    for loss in param_grid['loss']:
+                        classifier = SGDClassifier(loss=loss, random_state=random_state)
+                        pred = classifier.fit(X_k, y[fit_rows]).predict(X_held_k)
+                        params = (tuple(ngram_range), k, loss)
+                        totals.setdefault(params, []).append(score(y[held_rows], pred))
+        if not totals or len(set(y[split['train']])) < 2:
+            f1_scores.append(None)
+            continue
+        (ngram_range, k, loss) = max(totals, key=lambda p: np.mean(totals[p]))
+
+        # Refit the best parameters on the split's training rows and test them
+        X = matrices[(ngram_range, s, None)]
+        (train, test) = (split['train'], split['test'])
+        (feature_scores, _) = f_classif(X[train], y[train])
+        features = top_k(feature_scores, min(k, X.shape[1]))
+        classifier = fit_head(X[train], y[train], features, loss, random_state)
+        f1 = metrics.f1_score(y[test], classifier.predict(X[test][:, features]),
+                              average='macro', zero_division=0)
+        f1_scores.append(f1)
+        if best is None or f1 > best['f1']:
+            best = {'params': {'ngram_range': ngram_range, 'k': k, 'loss': loss},
+                    'features': features, 'classifier': classifier, 'split': s, 'f1': f1}
+    if best is None:
+        raise ValueError(f"Category '{category}' has too few labeled programs to train on.")
+    best['f1_scores'] = f1_scores
+    return best
+
+
+def build_pipeline(vectorizer, best, y_train, X_train):
+    """
+    Wraps a head as the notebook's Pipeline (vectorizer, select, classifier),
+    so predict_proba and the feature inspection in fpi_use_model.ipynb work
+    unchanged. Pipelines trained on the same split share one vectorizer.
+    """
+    select = SelectKBest(k=len(best['features']))
+    select.fit(X_train, y_train)
+    if not np.array_equal(np.flatnonzero(select.get_support()), best['features']):
+        raise ValueError("SelectKBest chose different features than the search.")
+    return Pipeline([('vectorizer', vectorizer), ('select', select),
+                     ('classifier', best['classifier'])])
+
+
+def train_estimators(texts, labels, param_grid=PARAM_GRID, times=10, cv=5, test_size=0.2,
+                     scoring='accuracy', n_jobs=-1, random_state=None, cache=None, verbose=True):
+    """
+    Trains a pipeline for every category.
+
+    Parameters
+    ----------
+    texts : list
+        The program texts.
+    labels : dict
+        Category -> 'Y'/'N' label of every text.
+    param_grid : dict, optional
+        Lists of 'ngram_range', 'k' and 'loss' values (default is PARAM_GRID).
+    times : int, optional
+        Number of random train/test splits (default is 10).
+    cv : int, optional
+        Cross validation folds within each split (default is 5).
+    test_size : float, optional
+        Fraction of the texts held out by each split (default is 0.2).
+    scoring : str, optional
+        Metric choosing the parameters within a split (default is 'accuracy',
+        as GridSearchCV did).
+    n_jobs : int, optional
+        Categories searched in parallel (default is all CPUs).
+    random_state : int, optional
+        Seed of the splits and classifiers (default is None).
+    cache : FeatureCache, optional
+        TF-IDF cache and splits of these texts (to reuse across calls).
+    verbose : bool, optional
+        Print progress and each category's scores (default is True).
+
+    Returns
+    -------
+    tuple
+        (estimators, report): category -> fitted Pipeline, and category ->
+        the chosen 'params', the best test 'f1' and the per split 'f1_scores'.
+    """
+    texts = list(texts)
+    cache = cache or FeatureCache(texts)
+    splits = cache.splits(times, cv, test_size, random_state)
+
+    # Vectorize once per n-gram setting and fold, for all categories
+    start = time.time()
+    matrices = {}
+    vectorizers = {}
+    for ngram_range in param_grid['ngram_range']:
+        ngram_range = tuple(ngram_range)
+        for (s, split) in enumerate(splits):
+            for (f, (fit_rows, _)) in enumerate(split['folds']):
+                matrices[(ngram_range, s, f)] = cache.get(ngram_range, fit_rows)[1]
+            (vectorizers[(ngram_range, s)], matrices[(ngram_range, s, None)]) = \
+                cache.get(ngram_range, split['train'])
+    if verbose:
+        print(f"Vectorized {len(matrices)} folds in {time.time() - start:.1f}s")
+
+    labels = {category: np.asarray(y) for (category, y) in labels.items()}
+    results = Parallel(n_jobs=n_jobs)(
+        delayed(search_category)(category, y, splits, matrices, param_grid, scoring, random_state)
+        for (category, y) in labels.items())
+
+    estimators = {}
+    report = {}
+    for ((category, y), best) in zip(labels.items(), results):
+        ngram_range = best['params']['ngram_range']
+        train = splits[best['split']]['train']
+        X_train = matrices[(ngram_range, best['split'], None)][train]
+        estimators[category] = build_pipeline(vectorizers[(ngram_range, best['split'])], best,
+                                               y[train], X_train)
+        report[category] = {'params': best['params'], 'f1': best['f1'],
+                            'f1_scores': best['f1_scores']}
+        if verbose:
+            print(f"{category}: f1={best['f1']:.3f} {best['params']}")
+    return (estimators, report)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the FPI category models.")
+    parser.add_argument("--data", default=DATA_FILE, help="Labeled FPI pilot data (CSV)")
+    parser.add_argument("--output", default="fpi_estimators.pkl", help="Pickle of the estimators")
+    parser.add_argument("--times", type=int, default=10, help="Random train/test splits")
+    parser.add_argument("--cv", type=int, default=5, help="Cross validation folds per split")
+    parser.add_argument("--scoring", default="accuracy", choices=sorted(SCORERS))
+    parser.add_argument("--n-jobs", type=int, default=-1)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    start = time.time()
+    (labeled_data, categories) = load_labeled_data(args.data)
+    labels = {category: category_labels(labeled_data['Associated Categories'], category)
+              for category in categories}
+    (estimators, _) = train_estimators(labeled_data['text'], labels, times=args.times, cv=args.cv,
+                                       scoring=args.scoring, n_jobs=args.n_jobs,
+                                       random_state=args.seed)
+    with open(args.output, "wb") as file:
+        pickle.dump(estimators, file)
+    print(f"Trained {len(estimators)} categories in {time.time() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
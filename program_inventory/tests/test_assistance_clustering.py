@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+from scipy import sparse
+
+from assistance_clustering import ClusterMembership, ClusterSweep, balanced_chains, cluster_means, top_terms
+
+
+def make_text(n=300, terms=40, blobs=4, seed=0):
+    # A sparse, TF-IDF like matrix whose rows come from a few groups of terms
+    rng = np.random.default_rng(seed)
+    group = rng.integers(blobs, size=n)
+    dense = rng.random((n, terms)) * (rng.random((n, terms)) < 0.1)
+    for g in range(blobs):
+        columns = np.arange(g * terms // blobs, (g + 1) * terms // blobs)
+        dense[np.ix_(group == g, columns)] += rng.random(((group == g).sum(), len(columns)))
+    dense /= np.linalg.norm(dense, axis=1, keepdims=True)
+    return sparse.csr_matrix(dense)
+
+
+def test_cluster_means_match_dense_means():
+    text = make_text()
+    labels = np.random.default_rng(1).choice([0, 2, 5], size=text.shape[0])
+    membership = ClusterMembership(labels)
+    dense = text.toarray()
+    expected = np.array([dense[labels == c].mean(axis=0) for c in (0, 2, 5)])
+    np.testing.assert_allclose(cluster_means(text, membership), expected, rtol=0, atol=1e-12)
+
+    assert membership.clusters.tolist() == [0, 2, 5]
+    for cluster in (0, 2, 5):
+        assert membership.members(cluster).tolist() == np.flatnonzero(labels == cluster).tolist()
+    assert top_terms(expected, [f"t{i}" for i in range(40)], 3)[0] == \
+        [f"t{i}" for i in np.argsort(-expected[0], kind="stable")[:3]]
+
+
+def test_balanced_chains():
+    ks = list(range(2, 37, 2))
+    chains = balanced_chains(ks, 3)
+    assert [k for chain in chains for k in chain] == ks
+    totals = [sum(chain) for chain in chains]
+    assert max(totals) - min(totals) <= max(ks)
+    assert balanced_chains([2, 4], 2) == [[2], [4]]
+
+
+@pytest.mark.parametrize("n_jobs", [1, 2])
+def test_cluster_sweep(n_jobs):
+    text = make_text()
+    sweep = ClusterSweep(text, n_jobs=n_jobs, silhouette_sample=100, init_size=300, batch_size=100,
+                         random_state=0)
+    results = sweep.fit(range(2, 9, 2))
+    assert [r['k'] for r in results] == [2, 4, 6, 8]
+    assert sweep.fit([2, 4]) == []
+    for result in results:
+        assert len(result['labels']) == text.shape[0]
+        assert len(np.unique(result['labels'])) <= result['k']
+        assert 'model' not in result
+    assert sweep.best_k() in (2, 4, 6, 8)
+    assert sweep.table()['k'].tolist() == [2, 4, 6, 8]
+
+    # A rebuilt model predicts the stored labels, which do not change
+    labels = sweep.labels(4).copy()
+    model = sweep.model(4)
+    np.testing.assert_array_equal(sweep.labels(4), labels)
+    np.testing.assert_array_equal(model.predict(text), labels)
+
+    # An unfitted k is fitted from the closest smaller k
+    assert sweep.model(5).n_clusters == 5
+    assert len(sweep.labels(5)) == text.shape[0]
@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+from fpi_predictor import CategoryPredictor
+from fpi_training import train_estimators
+
+TOPICS = {
+    'Health': "clinic hospital patient medical care vaccine".split(),
+    'Housing': "rent housing shelter mortgage tenant homeless".split(),
+    'Education': "school student teacher college grant tuition".split(),
+}
+COMMON = "program federal agency support community service fund state".split()
+
+
+def make_texts(n, seed=0):
+    # Program descriptions mixing common words with one or two topics' words
+    rng = np.random.default_rng(seed)
+    texts = []
+    labels = {category: [] for category in TOPICS}
+    for _ in range(n):
+        chosen = set(rng.choice(list(TOPICS), size=rng.integers(1, 3), replace=False))
+        words = list(rng.choice(COMMON, size=8))
+        for category in chosen:
+            words += list(rng.choice(TOPICS[category], size=4))
+        rng.shuffle(words)
+        texts.append(" ".join(words))
+        for category in TOPICS:
+            labels[category].append('Y' if category in chosen else 'N')
+    return (texts, labels)
+
+
+@pytest.fixture(scope="module")
+def estimators():
+    (texts, labels) = make_texts(120)
+    grid = {'ngram_range': [(1, 1), (1, 2)], 'k': [5, 20], 'loss': ['log_loss', 'modified_huber']}
+    (estimators, _) = train_estimators(texts, labels, grid, times=2, cv=2, n_jobs=1, random_state=0,
+                                       verbose=False)
+    # Categories of another vectorizer (bigrams), normalized over its own vocabulary
+    grid = dict(grid, ngram_range=[(1, 2)])
+    (bigrams, _) = train_estimators(texts, labels, grid, times=1, cv=2, n_jobs=1, random_state=1,
+                                    verbose=False)
+    estimators.update((category + " (bigrams)", pipeline) for (category, pipeline) in bigrams.items())
+    return estimators
+
+
+def pipeline_proba(estimators, texts):
+    return np.column_stack([pipeline.predict_proba(texts)[:, 1] for pipeline in estimators.values()])
+
+
+def test_predictor_matches_the_pipelines(estimators):
+    predictor = CategoryPredictor.from_estimators(estimators)
+    (texts, _) = make_texts(40, seed=1)
+    texts += ["", "unknown words only", "Clinic HOSPITAL, rent!", "café naïve école " * 3]
+    assert predictor.categories == list(estimators)
+    assert len(set(predictor.groups)) == 2
+    np.testing.assert_allclose(predictor.predict_proba(texts, batch_size=7),
+                               pipeline_proba(estimators, texts), rtol=0, atol=1e-12)
+
+    ranked = predictor.predict_categories(texts[:1])[0]
+    assert dict(ranked) == dict(zip(predictor.categories, predictor.predict_proba(texts[:1])[0]))
+    assert [p for (_, p) in ranked] == sorted((p for (_, p) in ranked), reverse=True)
+
+
+def test_save_and_load(estimators, tmp_path):
+    predictor = CategoryPredictor.from_estimators(estimators)
+    predictor.save(str(tmp_path / "model"))
+    (texts, _) = make_texts(20, seed=2)
+    expected = predictor.predict_proba(texts)
+    for mmap in (True, False):
+        loaded = CategoryPredictor.load(str(tmp_path / "model"), mmap=mmap)
+        assert isinstance(loaded.vocabulary, np.memmap) == mmap
+        assert loaded.categories == predictor.categories and loaded.losses == predictor.losses
+        np.testing.assert_array_equal(loaded.vocabulary, predictor.vocabulary)
+        np.testing.assert_array_equal(loaded.predict_proba(texts), expected)
+
+
+def test_load_rejects_other_formats(estimators, tmp_path):
+    import json
+
+    CategoryPredictor.from_estimators(estimators).save(str(tmp_path))
+    manifest = json.loads((tmp_path / "manifest.json").read_text())
+    manifest['format'] = 1
+    (tmp_path / "manifest.json").write_text(json.dumps(manifest))
+    with pytest.raises(ValueError):
+        CategoryPredictor.load(str(tmp_path))
+
+
+def test_unsupported_estimators():
+    with pytest.raises(ValueError):
+        CategoryPredictor.from_estimators({})